@@ -1,5 +1,92 @@
+""" SSM interpreter
+Executes a Simple Stack Machine program read from stdin and prints the value
+left on top of the stack.
+Usage: python HW1.py [options] < <filename>
+
+Options:
+  -t, --trace       print each executed instruction and the resulting stack
+                    to stderr (runs the program unfused)
+  --jit             compile each basic block into a Python function and
+                    run those instead of interpreting instructions
+  --regir           translate the program into register IR, with one virtual
+                    register per stack slot, and run that instead
+  --no-fuse         don't replace common instruction sequences with
+                    superinstructions
+  --fusion-report   print which superinstructions were fused to stderr
+  --profile         count the executions of every opcode, label and branch,
+                    and the maximum stack depth, and print a report of them
+                    to stderr (runs the program unfused)
+  --profile-json FILE
+                    write the same profile to FILE as JSON
+  --checkpoint FILE write snapshots of the execution (pc, stack, store and
+                    instruction count) to FILE as it runs
+  --checkpoint-every N
+                    write a snapshot every N instructions (the default is
+                    every 10 million)
+  --checkpoint-seconds S
+                    write a snapshot every S seconds
+  --resume FILE     continue the execution saved in the snapshot FILE, which
+                    must have been made by the same program, run with the
+                    same --no-fuse and -O options (checkpoints need
+                    Python 3, like --cache)
+  -O, --optimize    rewrite the program with the peephole optimizer (constant
+                    folding, jump threading, dead code removal) before
+                    running it
+  -c, --cache DIR   keep verified programs as bytecode in DIR, keyed by
+                    the hash of their source, and load them from there
+                    instead of parsing when the same source is run again
+                    (needs Python 3, as the bytecode format is read with its
+                    array and memoryview methods)
+  -h, --help        show this message
+
+As a library, compile_source(source) parses, validates and verifies a program
+once into an Executable, whose run(initial_store=None) method executes it on a
+fresh stack and store each time it is called. Errors are raised as subclasses
+of SSMError: ParseError, ValidationError, VerificationError and ExecutionError.
+"""
 from __future__ import print_function # gives us Python 3's print backported 
 import sys, re
+import getopt
+import os
+from array import array
+try:
+    # Python 2's StringIO reads both str and unicode strings, io's only unicode
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+import opcodes
+import fusion
+import blockjit
+import bytecode
+import ssmlexer
+import profiler
+import peephole
+import regir
+import checkpoint
+
+class Usage(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+class SSMError(Exception):
+    """An error in an SSM program, found while parsing, checking or running it.
+
+    The more specific errors below are all SSMErrors, so callers that don't
+    care which stage failed can catch just this.
+    """
+
+class ParseError(SSMError):
+    """The source has an invalid opcode or label, or a missing argument."""
+
+class ValidationError(SSMError):
+    """An instruction has an invalid argument or jumps to an unknown label."""
+
+class VerificationError(SSMError):
+    """The program could underflow the stack or end with it empty."""
+
+class ExecutionError(SSMError):
+    """The program failed while running, e.g. by dividing by zero."""
 
 class Stack(object):
     """Basic implementation of a stack data structure.
@@ -7,8 +94,12 @@ class Stack(object):
     This implementation supports the standard push, pop, and peek operations.
     """
 
-    def __init__(self):
-        self._items = []
+    def __init__(self, values=()):
+        """
+        Args:
+            values: The values to start with, bottom first.
+        """
+        self._items = list(values)
 
     def push(self, value):
         """Pushes value on top of the stack
@@ -16,41 +107,38 @@ class Stack(object):
         Args:
             value: The integer value to push onto the stack.
         """
-        print_debug("Pushing {0}".format(value))
-        # The following cast is necessary because value can either be 
-        # 1) an int from an arithmetic operation, etc.
-        # 2) a string from an ildc
-        self._items.append(int(value))
+        # No cast is needed here: ildc arguments are converted to ints when
+        # the program is validated, and every operation produces an int.
+        self._items.append(value)
 
     def pop(self):
         """Pops the top-most value off the stack.
 
-        If the stack is empty, emits an error message and exits with code 1.
+        If the stack is empty, raises an ExecutionError.
 
         Returns:
             The integer value popped off the stack.
         """
-        print_debug("Was {0}".format(self._items))
         if len(self._items) == 0:
-            print_error("Stack is empty, exiting")
-
-        ret = self._items.pop()
-        print_debug("Popping {0}".format(ret))
-        print_debug("Now {0}".format(self._items))
-        return ret
+            raise ExecutionError("Stack is empty, exiting")
+        return self._items.pop()
 
     def peek(self):
         """Peeks into the stack.
 
-        If the stack is empty, emits an error message and exits with code 1.
+        If the stack is empty, raises an ExecutionError.
 
         Returns:
             The integer value on top of the stack.
         """
         if len(self._items) == 0:
-            print_error("Stack is empty, exiting")
+            raise ExecutionError("Stack is empty, exiting")
         return self._items[-1]
 
+    def values(self):
+        """Returns a list of the values on the stack, bottom first."""
+        return list(self._items)
+
     def __str__(self):
         """A string representation of the stack.
 
@@ -58,6 +146,425 @@ class Stack(object):
         """
         return str(self._items);
 
+    def __len__(self):
+        """The number of values on the stack."""
+        return len(self._items)
+
+class UncheckedStack(Stack):
+    """A stack without the empty checks on pop and peek.
+
+    This is only used for programs that Parser.verify_program has proven can
+    never underflow. push and pop are bound directly to the underlying list's
+    methods, so a stack operation costs a single builtin call.
+    """
+
+    def __init__(self, values=()):
+        super(UncheckedStack, self).__init__(values)
+        self.push = self._items.append
+        self.pop = self._items.pop
+
+    def peek(self):
+        return self._items[-1]
+
+def _cell_typecode():
+    """Returns the array typecode of 64-bit ints: 'q', or 'l' where that is
+    8 bytes, as Python 2's array has no 'q'. Where neither is, 'l' is used,
+    and the values that don't fit go to Store's dict."""
+    for typecode in ('q', 'l'):
+        try:
+            if array(typecode).itemsize == 8:
+                return typecode
+        except ValueError:
+            pass
+    return 'l'
+
+CELL_TYPECODE = _cell_typecode()
+
+class Store(object):
+    """The directly-addressed memory area used by load and store.
+
+    Programs that use memory as an array mostly store to small, contiguous
+    addresses, so addresses below DENSE_LIMIT are kept in a growable array of
+    64-bit ints, with a bitmap recording which cells have been initialized.
+    The array only grows to take an address near its end, so a few scattered
+    high addresses don't allocate all the cells below them. Negative,
+    scattered or higher addresses, and values too large for the array, fall
+    back to a dict.
+    """
+
+    # Addresses from 0 up to (but not including) this may be stored densely.
+    DENSE_LIMIT = 1 << 24
+
+    # How far past twice its length an address may be for the array to grow
+    GROW_SLACK = 1024
+
+    def __init__(self):
+        self._cells = array(CELL_TYPECODE)
+        self._initialized = bytearray() # one bit per cell
+        self._sparse = {}
+
+    def load(self, address):
+        """Gets the value stored at address.
+
+        If nothing was stored there, raises an ExecutionError.
+
+        Returns:
+            The integer value at address.
+        """
+        if 0 <= address < len(self._cells) and \
+                self._initialized[address >> 3] & (1 << (address & 7)):
+            return self._cells[address]
+
+        value = self._sparse.get(address)
+        if value is None:
+            raise ExecutionError("Store address '{0}' not initialized, exiting.".format(address))
+        return value
+
+    def store(self, address, value):
+        """Stores value at address.
+
+        Args:
+            address: The integer address to store at.
+            value: The integer value to store.
+        """
+        if 0 <= address < self.DENSE_LIMIT and \
+                address < 2 * len(self._cells) + self.GROW_SLACK:
+            if address >= len(self._cells):
+                self._grow(address)
+            try:
+                self._cells[address] = value
+            except OverflowError:
+                # Too large for the array; it can only go in the dict
+                self._initialized[address >> 3] &= ~(1 << (address & 7))
+                self._sparse[address] = value
+                return
+            self._initialized[address >> 3] |= 1 << (address & 7)
+            if self._sparse:
+                self._sparse.pop(address, None)
+        else:
+            self._sparse[address] = value
+
+    def items(self):
+        """Returns a list of the (address, value) pairs that were stored."""
+        initialized = self._initialized
+        result = [(address, value) for address, value in enumerate(self._cells)
+                  if initialized[address >> 3] & (1 << (address & 7))]
+        result.extend(self._sparse.items())
+        return result
+
+    def _grow(self, address):
+        """Grows the dense cells so that address is in range."""
+        size = min(max(address + 1, 2 * len(self._cells), 64), self.DENSE_LIMIT)
+        self._cells.extend(array(CELL_TYPECODE, [0]) * (size - len(self._cells)))
+        self._initialized.extend(bytearray((size + 7) // 8 - len(self._initialized)))
+
+class Machine(object):
+    """The state of one execution of a program: its stack and store.
+
+    A Machine runs decoded (opcode, operand) code by looking up the handler
+    of each instruction in a dispatch table, indexed by opcode. A handler
+    returns the index of the next instruction. Every execution gets a new
+    Machine, so a program never sees the state left by an earlier run.
+    """
+
+    def __init__(self, stack, store):
+        """
+        Args:
+            stack: The Stack to run on, normally empty.
+            store: The Store used by load and store.
+        """
+        self._stack = stack
+        self._store = store
+        self._handlers = self._dispatch_table()
+
+    @property
+    def stack(self):
+        """stack (Stack): the stack, as left by the last run"""
+        return self._stack
+
+    @property
+    def store(self):
+        """store (Store): the memory area, as left by the last run"""
+        return self._store
+
+    def run(self, code, instructions=None, profile=None):
+        """Executes the code starting from the first instruction.
+
+        This will terminate when the program counter reaches past the end of
+        the code (i.e. when the last instruction has been executed).
+
+        Args:
+            code: A list of decoded (opcode, operand) tuples.
+            instructions: The Instructions the code was decoded from. If
+                given, every instruction is printed to stderr along with the
+                stack after it has run. Otherwise the loop has no tracing
+                hooks at all.
+            profile: A profiler.Profile for the code, to be filled in with
+                execution counts, in a separate, counting loop.
+
+        Returns:
+            On termination, it will return the top-most value off the stack.
+
+        Raises:
+            ExecutionError: The program divided by zero, loaded an address
+                that was never stored to, or popped an empty Stack.
+        """
+        try:
+            if instructions is not None:
+                self._run_traced(code, instructions)
+            elif profile is not None:
+                self._run_profiled(code, profile)
+            else:
+                handlers = self._handlers
+                pc = 0 # pc is 0, run the first (0th) instruction
+                end = len(code)
+                while pc < end:
+                    op, arg = code[pc]
+                    pc = handlers[op](pc, arg)
+        except ZeroDivisionError:
+            raise ExecutionError("Division by zero, exiting")
+        except ArithmeticError as err:
+            raise ExecutionError("Arithmetic error ({0}), exiting".format(err))
+
+        return self._stack.peek()
+
+    def run_from(self, code, pc=0, count=0, checkpointer=None):
+        """Executes the code from any instruction, counting instructions.
+
+        This is the loop for checkpointed and resumed executions. The code
+        is run in slices of checkpointer.interval instructions, and after
+        each slice a snapshot of the machine is written if the checkpointer
+        says one is due.
+
+        Args:
+            code: A list of decoded (opcode, operand) tuples.
+            pc: The index of the first instruction to execute.
+            count: The number of instructions executed before pc.
+            checkpointer: A checkpoint.Checkpointer, or None to not write
+                any checkpoints.
+
+        Returns:
+            On termination, it will return the top-most value off the stack.
+
+        Raises:
+            ExecutionError: The program failed while running.
+        """
+        handlers = self._handlers
+        end = len(code)
+        if checkpointer is None:
+            interval = sys.maxsize
+        else:
+            interval = checkpointer.interval
+            checkpointer.start(count)
+            digest = checkpoint.code_hash(code)
+
+        try:
+            while pc < end:
+                # The range counts the instructions, so the slice needs no
+                # counter of its own
+                for executed in range(1, interval + 1):
+                    op, arg = code[pc]
+                    pc = handlers[op](pc, arg)
+                    if pc >= end:
+                        break
+                count += executed
+                if pc < end and checkpointer.due(count):
+                    checkpointer.write(self.snapshot(digest, pc, count))
+        except ZeroDivisionError:
+            raise ExecutionError("Division by zero, exiting")
+        except ArithmeticError as err:
+            raise ExecutionError("Arithmetic error ({0}), exiting".format(err))
+
+        return self._stack.peek()
+
+    def snapshot(self, code_hash, pc, count):
+        """Returns a checkpoint.Snapshot of the stack and store.
+
+        Args:
+            code_hash: The checkpoint.code_hash of the code being run.
+            pc: The index of the next instruction to execute.
+            count: The number of instructions executed so far.
+        """
+        return checkpoint.Snapshot(code_hash, pc, count, self._stack.values(),
+                                   self._store.items())
+
+    def _run_traced(self, code, instructions):
+        """The execute loop, printing a trace line for every instruction.
+
+        This is kept apart from the loop in run so that untraced runs
+        don't pay for even a check of whether tracing is on.
+        """
+        handlers = self._handlers
+        pc = 0
+        end = len(code)
+        while pc < end:
+            op, arg = code[pc]
+            next_pc = handlers[op](pc, arg)
+            print_trace("{0}: {1}\t{2}".format(pc, instructions[pc], self._stack))
+            pc = next_pc
+
+    def _run_profiled(self, code, profile):
+        """The execute loop, counting what runs into profile."""
+        handlers = self._handlers
+        counts = profile.counts
+        taken = profile.taken
+        stack = self._stack
+        max_depth = len(stack)
+        pc = 0
+        end = len(code)
+        while pc < end:
+            op, arg = code[pc]
+            next_pc = handlers[op](pc, arg)
+            counts[pc] += 1
+            if next_pc != pc + 1:
+                taken[pc] += 1
+            depth = len(stack)
+            if depth > max_depth:
+                max_depth = depth
+            pc = next_pc
+        profile.max_depth = max_depth
+
+    def _dispatch_table(self):
+        """Builds the table of instruction handlers, indexed by opcode.
+
+        Every handler takes the current program counter and the decoded
+        operand, and returns the program counter of the next instruction.
+        """
+        table = [None] * opcodes.COUNT
+        table[opcodes.ILDC] = self._op_ildc
+        table[opcodes.IADD] = self._op_iadd
+        table[opcodes.ISUB] = self._op_isub
+        table[opcodes.IMUL] = self._op_imul
+        table[opcodes.IDIV] = self._op_idiv
+        table[opcodes.IMOD] = self._op_imod
+        table[opcodes.POP] = self._op_pop
+        table[opcodes.DUP] = self._op_dup
+        table[opcodes.SWAP] = self._op_swap
+        table[opcodes.JZ] = self._op_jz
+        table[opcodes.JNZ] = self._op_jnz
+        table[opcodes.JMP] = self._op_jmp
+        table[opcodes.LOAD] = self._op_load
+        table[opcodes.STORE] = self._op_store
+        table[opcodes.ADDI] = self._op_addi
+        table[opcodes.MULI] = self._op_muli
+        table[opcodes.DUP_JZ] = self._op_dup_jz
+        table[opcodes.DUP_JNZ] = self._op_dup_jnz
+        table[opcodes.LOAD_IMM] = self._op_load_imm
+        table[opcodes.STORE_IMM] = self._op_store_imm
+        table[opcodes.ADDI_UNDER] = self._op_addi_under
+        return table
+
+    def _op_ildc(self, pc, arg):
+        self._stack.push(arg)
+        return pc + 1
+
+    # The arithmetic handlers all pop the first two elements, then push
+    # the second value OPERATION the first value.
+    def _op_iadd(self, pc, arg):
+        first = self._stack.pop()
+        second = self._stack.pop()
+        self._stack.push(second + first)
+        return pc + 1
+
+    def _op_isub(self, pc, arg):
+        first = self._stack.pop()
+        second = self._stack.pop()
+        self._stack.push(second - first)
+        return pc + 1
+
+    def _op_imul(self, pc, arg):
+        first = self._stack.pop()
+        second = self._stack.pop()
+        self._stack.push(second * first)
+        return pc + 1
+
+    def _op_idiv(self, pc, arg):
+        first = self._stack.pop()
+        second = self._stack.pop()
+        self._stack.push(opcodes.idiv(second, first))
+        return pc + 1
+
+    def _op_imod(self, pc, arg):
+        first = self._stack.pop()
+        second = self._stack.pop()
+        self._stack.push(opcodes.imod(second, first))
+        return pc + 1
+
+    def _op_pop(self, pc, arg):
+        self._stack.pop()
+        return pc + 1
+
+    def _op_dup(self, pc, arg):
+        self._stack.push(self._stack.peek())
+        return pc + 1
+
+    def _op_swap(self, pc, arg):
+        first = self._stack.pop()
+        second = self._stack.pop()
+        self._stack.push(first)
+        self._stack.push(second)
+        return pc + 1
+
+    # For the jumps, arg has already been resolved into the target's index.
+    def _op_jz(self, pc, arg):
+        if self._stack.pop() == 0:
+            return arg
+        return pc + 1
+
+    def _op_jnz(self, pc, arg):
+        if self._stack.pop() != 0:
+            return arg
+        return pc + 1
+
+    def _op_jmp(self, pc, arg):
+        return arg
+
+    def _op_load(self, pc, arg):
+        self._stack.push(self._store.load(self._stack.pop()))
+        return pc + 1
+
+    def _op_store(self, pc, arg):
+        value = self._stack.pop()
+        address = self._stack.pop()
+        self._store.store(address, value)
+        return pc + 1
+
+    # The superinstructions created by fusion.fuse. Each one does the work of
+    # the sequence it replaced, described in the opcodes module.
+    def _op_addi(self, pc, arg):
+        self._stack.push(self._stack.pop() + arg)
+        return pc + 1
+
+    def _op_muli(self, pc, arg):
+        self._stack.push(self._stack.pop() * arg)
+        return pc + 1
+
+    def _op_dup_jz(self, pc, arg):
+        if self._stack.peek() == 0:
+            return arg
+        return pc + 1
+
+    def _op_dup_jnz(self, pc, arg):
+        if self._stack.peek() != 0:
+            return arg
+        return pc + 1
+
+    def _op_load_imm(self, pc, arg):
+        self._stack.push(self._store.load(arg))
+        return pc + 1
+
+    def _op_store_imm(self, pc, arg):
+        address, value = arg
+        self._store.store(address, value)
+        return pc + 1
+
+    def _op_addi_under(self, pc, arg):
+        top = self._stack.pop()
+        self._stack.push(self._stack.pop() + arg)
+        self._stack.push(top)
+        return pc + 1
+
+
 class Program(object):
     """Structured representation of the source code used for execution
 
@@ -65,13 +572,18 @@ class Program(object):
     to the program with the addInstruction method. Labels are added into a
     dictionary with addLabel. The program will be run when execute is called.
     Upon completion of execution, the top-most value on the stack will be printed.
+
+    Every execution starts from an empty stack and store. A verified Program
+    can also be frozen into an Executable, which can't be changed and can be
+    run any number of times.
     """
 
     def __init__(self):
         self._labels = {}
         self._instructions = []
-        self._store = {} # the directly-addressed memory area
-        self._stack = Stack()
+        self._decoded = None # the decoded instructions, see decode
+        self._code = None # what execute runs: _decoded, or fused, see fuse
+        self._heights = None # the verified stack heights, see setStackHeights
 
     @property
     def labels(self):
@@ -83,107 +595,206 @@ class Program(object):
         """instructions (List[Instruction]): the list of well-formed instructions
 
         The program will run through these sequentially on execution.
+
+        For a program loaded from bytecode, the Instructions are only rebuilt
+        from the decoded form when they are first asked for.
         """
+        if self._instructions is None:
+            self._instructions = self._rebuild_instructions()
         return self._instructions
-    
 
-    def execute(self):
+    @property
+    def stack_heights(self):
+        """stack_heights (List[int]): the stack height before each instruction
+
+        Unreachable instructions have a height of None. This is None as a
+        whole until the program has been verified.
+        """
+        return self._heights
+
+
+    def decode(self):
+        """Decodes the instructions into (opcode, operand) pairs.
+
+        Each opcode string is replaced by its integer from the opcodes module.
+        The operands have already been resolved by Parser.validate_program
+        (ildc values as ints, jump labels as instruction indices), so this is
+        only a copy. It is done once; the result is reused by every later call
+        until the program is changed.
+
+        Returns:
+            The list of decoded (opcode, operand) tuples.
+        """
+        if self._decoded is not None:
+            return self._decoded
+
+        code = []
+        for instruction in self._instructions:
+            op = opcodes.OPCODES.get(instruction.opcode)
+            if op is None:
+                raise ValidationError("Instruction not found '{0}'".format(instruction.opcode))
+            if instruction.arg is not None and instruction.operand is None:
+                raise ValidationError("Instruction '{0}' was not validated".format(instruction))
+            code.append((op, instruction.operand))
+
+        self._decoded = code
+        return code
+
+    def fuse(self):
+        """Replaces common instruction sequences with superinstructions.
+
+        The decoded program is rewritten by fusion.fuse, so that sequences
+        such as "ildc N; iadd" run as a single dispatch. Jump targets are
+        remapped accordingly. Traced executions go back to the unfused code,
+        so that every traced line matches a source instruction.
+
+        Returns:
+            A dict mapping the name of each fused sequence to the number of
+            times it was fused.
+        """
+        code, fired = fusion.fuse(self.decode())
+        self._code = code
+        return fired
+
+    def execute(self, trace=False, profile=None, checkpointer=None):
         """Executes the instructions starting from the first.
 
-        This will terminate when the program counter reaches past the
-        instruction array (i.e. when the last instruction has been executed).
+        The program is decoded first if it hasn't been already, then run by a
+        new Machine, with an empty stack and store. Verified programs run on
+        an UncheckedStack.
+
+        Args:
+            trace: If True, every instruction is printed to stderr along with
+                the stack after it has run. Otherwise the loop has no tracing
+                hooks at all.
+            profile: A profiler.Profile for the decoded program, to be filled
+                in with execution counts. If given, the unfused program is
+                run in a separate, counting loop.
+            checkpointer: A checkpoint.Checkpointer to write snapshots of
+                the execution with, so that it can be resumed later.
 
         Returns:
             On termination, it will return the top-most value off the stack.
+
+        Raises:
+            ExecutionError: The program failed while running.
         """
-        pc = 0 # pc is 0, run the first (0th) instruction
-        while pc < len(self._instructions):
-            op = self._instructions[pc].opcode
-            arg = self._instructions[pc].arg # May be None
-            print_debug('{0}: {1}'.format(pc, self._instructions[pc]))
-
-            if op == 'ildc':
-                self._stack.push(arg)
-
-            elif op == 'iadd':
-                # The add, sub, etc functions all pop the first two elements
-                # and do the desired operation on it, so since they all are
-                # the same except for the actual operation, use one function
-                # and use logic to find out which operation.
-                self._imath('+')
-
-            elif op == 'isub':
-                self._imath('-')
-
-            elif op == 'imul':
-                self._imath( '*')
-
-            elif op == 'idiv':
-                self._imath('/')
-
-            elif op == 'imod':
-                self._imath('%')
-
-            elif op == 'pop':
-                self._stack.pop()
-
-            elif op == 'dup':
-                self._stack.push(self._stack.peek())
-
-            elif op == 'swap':
-                first = self._stack.pop()
-                second = self._stack.pop()
-                self._stack.push(first)
-                self._stack.push(second)
-
-            elif op == 'jz':
-                top = self._stack.pop()
-                if top == 0:
-                    pc = self._labels.get(arg)
-                    if pc is None:
-                        print_error("Illegal jump performed to undefined label '{}'".format(instruction))
-                    continue
-
-            elif op == 'jnz':
-                top = self._stack.pop()
-                if top != 0:
-                    pc = self._labels.get(arg)
-                    if pc is None:
-                        print_error("Illegal jump performed to undefined label '{}'".format(instruction))
-                    continue
-
-            elif op == 'jmp':
-                pc = self._labels.get(arg)
-                if pc is None:
-                    print_error("Illegal jump performed to undefined label '{}'".format(instruction))
-                continue
-
-            elif op == 'load':
-                address = self._stack.pop()
-                print_debug(address)
-
-                value = self._store.get(address)
-                if value is None:
-                    print_error("Store address '{0}' not initialized, exiting.".format(address))
-
-                print_debug(value)
-                self._stack.push(value)
-
-            elif op == 'store':
-                value = self._stack.pop()
-                address = self._stack.pop()
-                self._store[address] = value
-                print_debug(self._store)
+        code = self._code
+        if code is None or trace or profile is not None:
+            code = self.decode()
+        stack = Stack() if self._heights is None else UncheckedStack()
+        machine = Machine(stack, Store())
+        if checkpointer is not None and not trace and profile is None:
+            return machine.run_from(code, checkpointer=checkpointer)
+        return machine.run(code, self.instructions if trace else None, profile)
+
+    def resume(self, snapshot, checkpointer=None):
+        """Continues an execution from a checkpoint.
+
+        The program has to be the one the snapshot was taken from, decoded
+        (and fused, or not) the same way; this is checked against the hash
+        of the code in the snapshot.
 
-            else:
-                print_error("Instruction not found '{0}'".format(op))
+        Args:
+            snapshot: The checkpoint.Snapshot to continue from.
+            checkpointer: A checkpoint.Checkpointer to keep writing snapshots
+                with, or None.
 
-            print_debug(self._stack)
-            pc += 1 # Advance to next instruction after current one is completed.
-                    # After pc is set with a jump instruction, it is 'continue'd
-                    # so we never make it here if the instruction is a jump
+        Returns:
+            On termination, it will return the top-most value off the stack.
 
-        return self._stack.peek()
+        Raises:
+            checkpoint.CheckpointError: The snapshot is of another program.
+            ExecutionError: The program failed while running.
+        """
+        code = self._code
+        if code is None:
+            code = self.decode()
+        if snapshot.code_hash != checkpoint.code_hash(code) or snapshot.pc > len(code):
+            raise checkpoint.CheckpointError("The checkpoint was made by a different program")
+
+        if self._heights is None:
+            stack = Stack(snapshot.stack)
+        else:
+            stack = UncheckedStack(snapshot.stack)
+        store = Store()
+        for address, value in snapshot.store:
+            store.store(address, value)
+        machine = Machine(stack, store)
+        return machine.run_from(code, snapshot.pc, snapshot.count, checkpointer)
+
+    def execute_compiled(self):
+        """Executes the program as compiled basic-block functions.
+
+        Instead of dispatching each instruction, the program is compiled by
+        blockjit into one Python function per basic block, with the stack
+        held in local variables inside each block. Only verified programs
+        can be compiled, since the compiler relies on the stack heights.
+
+        Returns:
+            On termination, it will return the top-most value off the stack.
+
+        Raises:
+            VerificationError: The program hasn't been verified.
+            ExecutionError: The program failed while running.
+        """
+        if self._heights is None:
+            raise VerificationError("Only verified programs can be compiled")
+
+        compiled = blockjit.compile_program(self.decode(), self._heights)
+        stack = []
+        try:
+            compiled.run(stack, Store())
+        except ZeroDivisionError:
+            raise ExecutionError("Division by zero, exiting")
+        except ArithmeticError as err:
+            raise ExecutionError("Arithmetic error ({0}), exiting".format(err))
+        return stack[-1]
+
+    def execute_registers(self):
+        """Executes the program translated into register IR.
+
+        regir.translate gives every stack slot its own virtual register,
+        using the verified stack heights, so that no instruction pushes or
+        pops; the IR is then run by regir's executor.
+
+        Returns:
+            On termination, it will return the top-most value off the stack.
+
+        Raises:
+            VerificationError: The program hasn't been verified.
+            ExecutionError: The program failed while running.
+        """
+        if self._heights is None:
+            raise VerificationError("Only verified programs can be translated")
+
+        translated = regir.translate(self.decode(), self._heights)
+        try:
+            return translated.run(Store())
+        except ZeroDivisionError:
+            raise ExecutionError("Division by zero, exiting")
+        except ArithmeticError as err:
+            raise ExecutionError("Arithmetic error ({0}), exiting".format(err))
+
+    def freeze(self, fuse=True):
+        """Returns an Executable of this program, for repeated runs.
+
+        The Executable keeps its own copy of the decoded (and, by default,
+        fused) code, so later changes to this Program don't affect it.
+
+        Args:
+            fuse: If False, the code is not rewritten by fusion.fuse.
+
+        Raises:
+            VerificationError: The program hasn't been verified.
+        """
+        if self._heights is None:
+            raise VerificationError("Only verified programs can be frozen")
+
+        code = self.decode()
+        if fuse:
+            code, fired = fusion.fuse(code)
+        return Executable(code)
 
     def addInstruction(self, instruction):
         """Adds an instruction to the end of the instructions list.
@@ -191,7 +802,8 @@ class Program(object):
         Args:
             instruction: The Instruction object to append to the instructions.
         """
-        self._instructions.append(instruction)
+        self.instructions.append(instruction)
+        self._invalidate()
 
     def addLabel(self, label, instruction_number):
         """Adds a label and its associated instruction number to the label map.
@@ -202,42 +814,63 @@ class Program(object):
                 the ith instruction.
         """
         self._labels[label] = instruction_number
+        self._invalidate()
 
-    def _imath(self, operation):
-        """Performs binary arithmetic operations on the top of the stack.
+    def setStackHeights(self, heights):
+        """Records the stack heights computed by Parser.verify_program.
 
-        In summary, this will pop off two values from the stack. It will then
-        compute the second value OPERATION the first value, where OPERATION is
-        a binary arithmetic operation. It will then push the result onto the
-        stack.
-
-        The supported binary math operations are: +, -, *, /, and %. If an
-        unsupported operation is passed in, this will emit an error message
-        and exit.
+        Since the verifier has proven the stack can never underflow, the
+        program is executed on an UncheckedStack from then on.
 
         Args:
-            operation: a character representing the operation to perform
+            heights: A list with the stack height before each instruction,
+                None for unreachable instructions.
         """
-        first = self._stack.pop()
-        second = self._stack.pop()
+        self._heights = heights
 
-        if operation == '+':
-            self._stack.push(second + first)
+    @classmethod
+    def fromBytecode(cls, code, labels, heights):
+        """Creates a verified program directly from its decoded form.
 
-        elif operation == '-':
-            self._stack.push(second - first)
+        This is how programs loaded by the bytecode module are rebuilt, so
+        parsing, validation and verification are all skipped.
 
-        elif operation == '*':
-            self._stack.push(second * first)
-
-        elif operation == '/':
-            self._stack.push(second / first)
-
-        elif operation == '%':
-            self._stack.push(second % first)
+        Args:
+            code: The list of decoded (opcode, operand) tuples.
+            labels: The mapping of labels to instruction numbers.
+            heights: The verified stack height before each instruction.
+        """
+        program = cls()
+        program._instructions = None # rebuilt on demand, see instructions
+        program._labels = labels
+        program._decoded = code
+        program.setStackHeights(heights)
+        return program
+
+    def _rebuild_instructions(self):
+        """Rebuilds the Instruction list from the decoded instructions."""
+        names = {}
+        for label, instruction_number in sorted(self._labels.items()):
+            names.setdefault(instruction_number, label)
+
+        instructions = []
+        for op, operand in self._decoded:
+            if op == opcodes.ILDC:
+                instruction = Instruction(opcodes.NAMES[op], str(operand))
+                instruction.resolve(operand)
+            elif op in opcodes.BRANCHES:
+                instruction = Instruction(opcodes.NAMES[op], names[operand])
+                instruction.resolve(operand)
+            else:
+                instruction = Instruction(opcodes.NAMES[op])
+            instructions.append(instruction)
+        return instructions
 
-        else:
-            print_error("Unknown math operation '{0}'".format(operand))
+    def _invalidate(self):
+        """Drops everything derived from the instructions after a change."""
+        self._decoded = None
+        self._code = None
+        self._heights = None
 
     def __str__(self):
         """Returns the list of instructions and the label mapping.
@@ -252,24 +885,74 @@ class Program(object):
         # testing, so it should be fine.
         i = 1
         result_string = ""
-        for line in self._instructions:
+        for line in self.instructions:
             result_string += "{0}: {1}\n".format(i, line)
             i += 1
 
         result_string += 'Labels:'
-        for label, line_number in self._labels.iteritems():
+        for label, line_number in self._labels.items():
             result_string += "\n\t{0}: {1}".format(label, line_number+1)
             # Added 1 because the line numbers are stored 0-indexed,
             # but we are printing 1-indexed line numbers.
 
         return result_string
 
+class Executable(object):
+    """A verified program, decoded into the form it is executed in.
+
+    An Executable is built once, by Program.freeze or compile_source, and
+    can't be changed afterwards. Each call of run executes it on a new
+    Machine, with an empty stack and store, so it can be run any number of
+    times without parsing it again, and no run sees the state of another.
+    """
+
+    __slots__ = ('_code',)
+
+    def __init__(self, code):
+        """
+        Args:
+            code: The decoded (opcode, operand) tuples of a verified program.
+        """
+        self._code = tuple(code)
+
+    @property
+    def code(self):
+        """code (Tuple[(int, int)]): the decoded instructions"""
+        return self._code
+
+    def run(self, initial_store=None):
+        """Executes the program from its first instruction.
+
+        Args:
+            initial_store: A dict mapping addresses to the integer values to
+                store there before the program starts, e.g. its inputs.
+
+        Returns:
+            On termination, it will return the top-most value off the stack.
+
+        Raises:
+            ExecutionError: The program failed while running.
+        """
+        store = Store()
+        if initial_store:
+            for address, value in initial_store.items():
+                store.store(address, value)
+        return Machine(UncheckedStack(), store).run(self._code)
+
+    def __len__(self):
+        """The number of decoded instructions."""
+        return len(self._code)
+
 class Instruction(object):
     """Structured representation of a well-formatted Instruction"""
 
+    # Programs can have millions of instructions, so don't give each one a dict
+    __slots__ = ('_opcode', '_arg', '_operand')
+
     def __init__(self, opcode, arg=None):
         self._opcode = opcode
         self._arg = arg
+        self._operand = None
 
     @property
     def opcode(self):
@@ -281,6 +964,24 @@ class Instruction(object):
         """Gets the argument for this instruction. May be None."""
         return self._arg
 
+    @property
+    def operand(self):
+        """Gets the resolved argument used at execution time. May be None.
+
+        For ildc this is the integer value, and for the jumps it is the index
+        of the target instruction. It is None until the argument is resolved.
+        """
+        return self._operand
+
+    def resolve(self, operand):
+        """Sets the resolved form of this instruction's argument.
+
+        Args:
+            operand: The int value of an ildc argument, or the instruction
+                index a jump label refers to.
+        """
+        self._operand = operand
+
     def __str__(self):
         """Returns a string representing this instruction.
 
@@ -310,11 +1011,20 @@ class Parser(object):
     def parse_data(self, data):
         """Takes the raw data as input and constructs a Program
 
-        First, it strips comments. Then it will split the source on whitespace
-        to create an array of tokens. Note, even if a label doesn't have
-        whitespace between it and the following instruction in the source,
-        we ensure it does before splitting. After the token array it created,
-        we parse it to construct the resulting program.
+        This is parse_stream over the contents of a string.
+
+        Args:
+            data: A string of the raw source code.
+        """
+        self.parse_stream(StringIO(data))
+
+    def parse_stream(self, stream):
+        """Reads the raw source from a file object and constructs a Program
+
+        The source is tokenized incrementally by ssmlexer, which strips
+        comments and separates labels from the following token, and the
+        instructions are built as the tokens arrive. Only the instructions
+        themselves are kept in memory, never the whole source.
 
         After running this, if an error has not occurred, the program will
         be stored as self.program. Note, the program has not been validated
@@ -322,64 +1032,56 @@ class Parser(object):
         guaranteed to be legal.
 
         Args:
-            data: A string of the raw source code.
+            stream: A file object with the raw source code, in text mode.
         """
-        # First, remove the comments
-        data = self._strip_comments(data)
-
-        # Ensure labels have a space after them
-        data = data.replace(':', ': ') 
-
-        # Next, split into a token array
-        token_array = data.split()
-
-        # Counter into our token_array
-        token_i = 0
-        
         # Each time we add an instruction to the list, increment this.
         # This helps determine which instruction a label points to, e.g.
         # if the first line of the program is a label, then it means set
         # the program counter to instruction 0 when jumped to
         instruction_counter = 0
 
-        while token_i < len(token_array):
-            # If opcode is one of the four opcodes that take arguments,
-            # add an Instruction with the next token as an arg to the program.
-            if self._has_arg(token_array[token_i]):
-                opcode = token_array[token_i]
-                arg = token_array[token_i+1]
-                self._program.addInstruction(Instruction(opcode, arg))
+        # When the previous token was one of the four opcodes that take
+        # arguments, this holds it, and the current token is its argument.
+        pending_opcode = None
 
-                token_i += 1 # Advance an extra element. We don't want to look at the arg next.
+        for token, line, column in ssmlexer.tokenize(stream):
+            if pending_opcode is not None:
+                self._program.addInstruction(Instruction(pending_opcode, token))
+                pending_opcode = None
                 instruction_counter += 1
 
+            # If opcode is one of the four opcodes that take arguments,
+            # the next token will be its argument.
+            elif self._has_arg(token):
+                pending_opcode = token
+
             # If we make it this far, it means the opcode does not have an argument
             # following it, so just add it as a bare instruction.
-            elif self._is_opcode_valid(token_array[token_i]):
-                opcode = token_array[token_i]
-                self._program.addInstruction(Instruction(opcode))
-
+            elif self._is_opcode_valid(token):
+                self._program.addInstruction(Instruction(token))
                 instruction_counter += 1
 
             # If it's a label, add the label and current instruction counter
             # into the label map.
-            elif ':' in token_array[token_i]:
-                # strip __LABEL__ and insert label name into hashmap
-                label = token_array[token_i].replace(':', '')
+            elif token.endswith(':'):
+                label = token[:-1]
                 if not self._is_label_valid(label):
-                    print_error(("'{0}' is not a valid label. Must begin "
-                                 "with an alphabetic character and have "
-                                 "only alphanumeric or '_' characters.").format(label))
+                    raise ParseError(("'{0}' is not a valid label. Must begin "
+                                      "with an alphabetic character and have "
+                                      "only alphanumeric or '_' characters. "
+                                      "(line {1}, column {2})").format(label, line, column))
                 self._program.addLabel(label, instruction_counter)
 
             # If we've made it this far, the instruction instruction is not valid, so exit
             else:
-                print_error("Invalid opcode '{0}', exiting.".format(token_array[token_i]))
+                raise ParseError("Invalid opcode '{0}' (line {1}, column {2}), exiting.".format(
+                    token, line, column))
 
-            token_i += 1
+        if pending_opcode is not None:
+            raise ParseError("{0} must have an argument.".format(pending_opcode))
 
     def validate_program(self):
-        """Verifies parsed program is legal.
+        """Verifies parsed program is legal and resolves the arguments.
 
         This function will check that:
             ildc has an integral argument,
@@ -389,22 +1091,111 @@ class Parser(object):
         This function will not check that:
             the opcodes are valid
         because that has already been verified during the initial parse.
+
+        Once an argument is known to be legal, it is resolved into the operand
+        used at execution time: ildc arguments are converted to ints, and jump
+        labels are replaced by the index of the instruction they refer to.
         """
         for instruction in self._program.instructions:
             if self._has_arg(instruction.opcode):
                 if instruction.opcode == 'ildc':
                     if instruction.arg is None:
-                        print_error("ildc must have an argument.")
-                    if re.match(r"(?:-?[1-9][0-9]*)|0", instruction.arg) is None:
-                        print_error("Invalid immediate number '{0}', exiting".format(instruction.arg))
+                        raise ValidationError("ildc must have an argument.")
+                    if re.match(r"(?:-?[1-9][0-9]*|0)$", instruction.arg) is None:
+                        raise ValidationError("Invalid immediate number '{0}', exiting".format(instruction.arg))
+                    instruction.resolve(int(instruction.arg))
                 else:
                     if not self._is_label_valid(instruction.arg):
-                        print_error(("'{0}' is not a valid label. Must begin "
-                                     "with an alphabetic character and have "
-                                     "only alphanumeric or '_' characters.").format(instruction.arg))
-                    if self._program.labels.get(instruction.arg) is None: # check to see if the label is mapped to an index
-                        print_error("Label '{0}' not found, exiting".format(instruction.arg))
-                print_debug(instruction)
+                        raise ValidationError(("'{0}' is not a valid label. Must begin "
+                                               "with an alphabetic character and have "
+                                               "only alphanumeric or '_' characters.").format(instruction.arg))
+                    target = self._program.labels.get(instruction.arg) # check to see if the label is mapped to an index
+                    if target is None:
+                        raise ValidationError("Label '{0}' not found, exiting".format(instruction.arg))
+                    instruction.resolve(target)
+
+    def verify_program(self):
+        """Verifies the program can never underflow the stack.
+
+        This walks the control-flow graph of the program, following the
+        fall-through and jump edges of every instruction, and computes the
+        stack height before each reachable instruction. The program is
+        rejected if:
+            an instruction can pop more values than the stack holds,
+            a label can be reached with two different stack heights,
+            the program can finish with an empty stack.
+
+        On success, the heights are stored in the program so it can execute
+        without checking the stack on every operation. This must be run after
+        validate_program, since it relies on the resolved jump targets.
+        """
+        instructions = self._program.instructions
+        end = len(instructions)
+        heights = [None] * end
+        worklist = []
+
+        def reach(index, height):
+            if index == end:
+                if height == 0:
+                    raise VerificationError("Stack can be empty when the program ends, exiting")
+            elif heights[index] is None:
+                heights[index] = height
+                worklist.append(index)
+            elif heights[index] != height:
+                raise VerificationError(("Inconsistent stack heights {0} and {1} at "
+                                         "label '{2}', exiting").format(
+                                            heights[index], height,
+                                            self._label_at(index)))
+
+        reach(0, 0)
+        while worklist:
+            index = worklist.pop()
+            instruction = instructions[index]
+            op = opcodes.OPCODES[instruction.opcode]
+            pops, pushes = opcodes.STACK_EFFECTS[op]
+            if heights[index] < pops:
+                raise VerificationError("Stack underflow at instruction {0} '{1}', exiting".format(
+                    index + 1, instruction))
+
+            height = heights[index] - pops + pushes
+            if op in opcodes.BRANCHES:
+                reach(instruction.operand, height)
+            if op != opcodes.JMP:
+                reach(index + 1, height)
+
+        self._program.setStackHeights(heights)
+
+    def optimize_program(self):
+        """Rewrites the program with the peephole optimizer.
+
+        The program is replaced by the one peephole.optimize produces, which
+        is then validated and verified again to resolve its arguments and
+        recompute its stack heights. This must be run after verify_program:
+        the rewrites keep every stack height, but removing "dup; pop" could
+        hide an underflow the verifier would have reported.
+
+        Returns:
+            A dict mapping the name of each rewrite to the number of times it
+            was done.
+        """
+        pairs = [(instruction.opcode, instruction.arg)
+                 for instruction in self._program.instructions]
+        pairs, labels, applied = peephole.optimize(pairs, self._program.labels)
+
+        self._program = Program()
+        for opcode, arg in pairs:
+            self._program.addInstruction(Instruction(opcode, arg))
+        for label, instruction_number in labels.items():
+            self._program.addLabel(label, instruction_number)
+        self.validate_program()
+        self.verify_program()
+        return applied
+
+    def _label_at(self, index):
+        """Returns a label referring to the instruction at index."""
+        for label, instruction_number in self._program.labels.items():
+            if instruction_number == index:
+                return label
 
     @staticmethod
     def _has_arg(opcode):
@@ -450,31 +1241,197 @@ class Parser(object):
 
         return re.match(r"^[a-zA-Z][a-zA-Z0-9_]*$", label)
 
-    @staticmethod
-    def _strip_comments(raw_data):
-        """Strips the comments out of the source code.
+def print_trace(trace_string):
+    print(trace_string, file=sys.stderr)
 
-        Comments begin with a '#' character and end at the next new line or EOF.
-        """
-        # The last \n is optional so that comments on the last line are
-        # still removed. Note that in python the optional qualifier is greedy,
-        # so newlines will still be consumed if present
-        return re.sub(r"#.*\n?", '\n', raw_data)
-    
-def print_debug(input_string):
-    if False: # set to True to print debug statements, False to not print anything
-        print(input_string)
+def load_program(stream, cache_dir=None, optimize=False):
+    """Builds a verified Program from the source code.
 
-def print_error(error_string):
-    print('Error: {0}'.format(error_string), file=sys.stderr)
-    sys.exit(1)
+    Without a cache directory, this parses, validates and verifies the
+    program (and optionally optimizes it), reading the source incrementally.
+    With one, the whole source is read so the program can first be looked up
+    in the bytecode cache by the hash of its source; on a hit, all of that
+    work is skipped. On a miss, the verified program is added to the cache.
 
-if __name__ == "__main__":
-    data = sys.stdin.read() # Data is a string of the input program
+    Args:
+        stream: A file object with the raw source code, in text mode.
+        cache_dir: The bytecode cache directory, or None to not use a cache.
+        optimize: If True, the program is rewritten by Parser.optimize_program.
+            Optimized programs are cached apart from unoptimized ones.
+
+    Returns:
+        The verified Program.
 
+    Raises:
+        ParseError, ValidationError, VerificationError: The program is not
+            legal, see Parser.
+    """
     parser = Parser()
-    parser.parse_data(data) # Construct the program
+    if cache_dir is None:
+        parser.parse_stream(stream) # Construct the program
+    else:
+        data = stream.read()
+        path = bytecode.cache_path(cache_dir, data,
+                                   'optimized' if optimize else '')
+        image = bytecode.load(path)
+        if image is not None:
+            return Program.fromBytecode(*image)
+        parser.parse_data(data)
+
     parser.validate_program() # Verify program before running it
+    parser.verify_program() # Prove the stack can't underflow
+    if optimize:
+        parser.optimize_program()
+    program = parser.program
+
+    if cache_dir is not None:
+        try:
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            bytecode.save(path, program.decode(), program.labels,
+                          program.stack_heights)
+        except (IOError, OSError, OverflowError):
+            pass # The cache is only an optimization
+    return program
+
+def compile_source(source, fuse=True, optimize=False):
+    """Builds an Executable from the source code.
+
+    This is the entry point for using the interpreter as a library: the
+    program is parsed, validated and verified once, and the Executable can
+    then be run any number of times.
+
+    Args:
+        source: The raw source code, as a string or a file object in text
+            mode.
+        fuse: If False, the code is not rewritten by fusion.fuse.
+        optimize: If True, the program is first rewritten by the peephole
+            optimizer.
+
+    Returns:
+        The Executable.
+
+    Raises:
+        ParseError, ValidationError, VerificationError: The program is not
+            legal, see Parser.
+    """
+    if not hasattr(source, 'read'):
+        source = StringIO(source)
+    return load_program(source, optimize=optimize).freeze(fuse)
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+
+    try:
+        try:
+            opts, args = getopt.getopt(argv[1:], "htOc:",
+                                       ["help", "trace", "jit", "no-fuse",
+                                        "fusion-report", "cache=", "profile",
+                                        "profile-json=", "optimize", "regir",
+                                        "checkpoint=", "checkpoint-every=",
+                                        "checkpoint-seconds=", "resume="])
+        except getopt.error as msg:
+            raise Usage(msg)
+        trace = False
+        jit = False
+        registers = False
+        fuse = True
+        report = False
+        cache_dir = None
+        profile = False
+        profile_json = None
+        optimize = False
+        checkpoint_path = None
+        every = None
+        seconds = None
+        resume = None
+        for o, a in opts:
+            if o in ("-h", "--help"):
+                print(__doc__)
+                return 0
+            elif o in ("-t", "--trace"):
+                trace = True
+            elif o == "--jit":
+                jit = True
+            elif o == "--regir":
+                registers = True
+            elif o == "--no-fuse":
+                fuse = False
+            elif o == "--fusion-report":
+                report = True
+            elif o in ("-c", "--cache"):
+                cache_dir = a
+            elif o == "--profile":
+                profile = True
+            elif o == "--profile-json":
+                profile_json = a
+            elif o in ("-O", "--optimize"):
+                optimize = True
+            elif o == "--checkpoint":
+                checkpoint_path = a
+            elif o == "--checkpoint-every":
+                try:
+                    every = int(a)
+                except ValueError:
+                    raise Usage("The checkpoint interval must be an integer")
+                if every <= 0:
+                    raise Usage("The checkpoint interval must be positive")
+            elif o == "--checkpoint-seconds":
+                try:
+                    seconds = float(a)
+                except ValueError:
+                    raise Usage("The checkpoint interval must be a number of seconds")
+            elif o == "--resume":
+                resume = a
+        if (checkpoint_path is not None or resume is not None) and \
+                (jit or registers or trace or profile or profile_json is not None):
+            raise Usage("Checkpoints can't be used with --jit, --regir, --trace or --profile")
+        if cache_dir is not None and sys.version_info[0] < 3:
+            raise Usage("--cache needs Python 3")
+        if (checkpoint_path is not None or resume is not None) and \
+                sys.version_info[0] < 3:
+            raise Usage("Checkpoints need Python 3")
+        if len(args) != 0:
+            raise Usage("The program is read from stdin, no arguments are expected")
+    except Usage as err:
+        print(err.msg, file=sys.stderr)
+        print("For help use --help", file=sys.stderr)
+        return 2
+
+    try:
+        program = load_program(sys.stdin, cache_dir, optimize)
+
+        if profile or profile_json is not None:
+            counts = profiler.Profile(program.decode(), program.labels)
+            result = program.execute(profile=counts)
+            if profile:
+                print(counts.report(), file=sys.stderr)
+            if profile_json is not None:
+                counts.write_json(profile_json)
+        elif jit and not trace:
+            result = program.execute_compiled()
+        elif registers and not trace:
+            result = program.execute_registers()
+        else:
+            if fuse and not trace:
+                fired = program.fuse() # Combine common sequences
+                if report:
+                    print(fusion.format_report(fired), file=sys.stderr)
+
+            checkpointer = None
+            if checkpoint_path is not None:
+                checkpointer = checkpoint.Checkpointer(checkpoint_path, every, seconds)
+            if resume is not None:
+                result = program.resume(checkpoint.load(resume), checkpointer)
+            else:
+                result = program.execute(trace, checkpointer=checkpointer) # Finally execute
+    except (SSMError, checkpoint.CheckpointError, IOError, OSError) as err:
+        print('Error: {0}'.format(err), file=sys.stderr)
+        return 1
 
-    result = parser.program.execute() # Finally execute
     print("{0}".format(result))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,168 @@
+""" Batch SSM runner
+Runs many SSM programs across a pool of worker processes, and writes one JSON
+line per program to stdout as soon as it finishes. Each line has the
+program's path and either its "result" (the value left on top of the stack)
+or an "error", along with the "seconds" it took.
+Usage: python batch.py [options] <directory or manifest>
+
+The programs are either every .ssm file in a directory, or the files listed
+one per line in a manifest file (relative paths are relative to the
+manifest; blank lines and lines starting with '#' are ignored).
+
+The exit status is 0 if every program ran to completion, and 1 if any ended
+in an error or timed out.
+
+Options:
+  -j, --jobs N          number of worker processes (default: one per CPU)
+  -t, --timeout SECONDS time each program may take, including parsing
+                        (default: 10)
+  --jit                 run the programs with the basic-block compiler
+  -h, --help            show this message
+"""
+from __future__ import print_function
+import sys
+import os
+import getopt
+import json
+import signal
+import time
+import functools
+import multiprocessing
+
+import HW1
+
+class Usage(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+class Timeout(Exception):
+    """Raised in a worker when a program runs past its time limit."""
+
+def find_programs(path):
+    """Returns the list of program paths named by a directory or manifest."""
+    if os.path.isdir(path):
+        return sorted(os.path.join(path, name) for name in os.listdir(path)
+                      if name.endswith('.ssm'))
+
+    base = os.path.dirname(path)
+    programs = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                programs.append(os.path.join(base, line))
+    return programs
+
+def run_program(path, timeout, jit=False):
+    """Parses, verifies and runs one program, in a worker process.
+
+    The time limit is enforced with SIGALRM, so it also interrupts programs
+    that never terminate.
+
+    Returns:
+        The dict written as the program's JSON line.
+    """
+    record = {'program': path}
+    start = time.time()
+    previous = signal.signal(signal.SIGALRM, _alarm)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        with open(path) as f:
+            program = HW1.load_program(f)
+        if jit:
+            record['result'] = program.execute_compiled()
+        else:
+            program.fuse()
+            record['result'] = program.execute()
+        signal.setitimer(signal.ITIMER_REAL, 0)
+    except HW1.SSMError as err:
+        record['error'] = str(err)
+    except Timeout:
+        record['error'] = 'Timed out after {0} seconds'.format(timeout)
+    except (IOError, OSError) as err:
+        record['error'] = str(err)
+    except Exception as err:
+        # A bug in the interpreter ends this program, not the batch
+        record['error'] = '{0}: {1}'.format(type(err).__name__, err)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+    record['seconds'] = round(time.time() - start, 6)
+    return record
+
+def _alarm(signum, frame):
+    raise Timeout()
+
+def run_batch(programs, jobs=None, timeout=10, jit=False, out=sys.stdout):
+    """Runs programs in a pool of jobs workers, streaming JSON lines to out.
+
+    The lines are written in the order the programs finish.
+
+    Returns:
+        The number of programs that ended in an error.
+    """
+    errors = 0
+    run = functools.partial(run_program, timeout=timeout, jit=jit)
+    pool = multiprocessing.Pool(jobs)
+    try:
+        for record in pool.imap_unordered(run, programs):
+            if 'error' in record:
+                errors += 1
+            out.write(json.dumps(record, sort_keys=True) + '\n')
+            out.flush()
+    finally:
+        pool.terminate()
+        pool.join()
+    return errors
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+
+    try:
+        try:
+            opts, args = getopt.getopt(argv[1:], "hj:t:",
+                                       ["help", "jobs=", "timeout=", "jit"])
+        except getopt.error as msg:
+            raise Usage(msg)
+        jobs = None
+        timeout = 10.0
+        jit = False
+        for o, a in opts:
+            if o in ("-h", "--help"):
+                print(__doc__)
+                return 0
+            elif o in ("-j", "--jobs"):
+                try:
+                    jobs = int(a)
+                except ValueError:
+                    raise Usage("The number of jobs must be an integer")
+                if jobs < 1:
+                    raise Usage("The number of jobs must be at least 1")
+            elif o in ("-t", "--timeout"):
+                try:
+                    timeout = float(a)
+                except ValueError:
+                    raise Usage("The timeout must be a number of seconds")
+                if timeout <= 0:
+                    raise Usage("The timeout must be positive")
+            elif o == "--jit":
+                jit = True
+        if len(args) != 1:
+            raise Usage("A single directory or manifest argument is required")
+    except Usage as err:
+        print(err.msg, file=sys.stderr)
+        print("For help use --help", file=sys.stderr)
+        return 2
+
+    try:
+        programs = find_programs(args[0])
+    except (IOError, OSError) as err:
+        print('Error: {0}'.format(err), file=sys.stderr)
+        return 1
+
+    errors = run_batch(programs, jobs, timeout, jit)
+    return 1 if errors else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
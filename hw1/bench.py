@@ -0,0 +1,298 @@
+""" SSM benchmarks
+Generates synthetic SSM workloads of a given size, runs each of them in
+every execution mode, and reports the time taken to load (parse, validate and
+verify) and to run each program, the instructions executed per second, and
+the peak memory of the process that ran it.
+Usage: python bench.py [options]
+
+The workloads are:
+  countdown     a tight loop like test4.ssm's, counting N down to 0
+  arithmetic    N blocks of straight-line multiply/add/modulo code
+  array         a loop storing N cells of memory, then one summing them
+  deep          N values pushed onto the stack, then all added together
+
+The modes are the ways HW1.py can run a program: fused (the default),
+unfused (--no-fuse), jit (--jit) and regir (--regir).
+
+Every measurement runs in a new process, so the peak memory (the maximum
+resident set size) is that of one program in one mode. The run time includes
+whatever the mode does to the program before executing it (fusing, compiling
+or translating it), since that is paid on every run.
+
+Options:
+  -w, --workloads LIST  comma-separated workloads to run (default: all)
+  -m, --modes LIST      comma-separated modes to run (default: all)
+  -s, --scale X         multiply the size of every workload by X (default: 1)
+  -r, --repeat N        run each measurement N times and keep the fastest
+                        (default: 1)
+  --save FILE           write the results to FILE as JSON, as a baseline
+  --compare FILE        compare the results against the baseline in FILE, and
+                        exit with code 1 if any got slower by more than the
+                        threshold
+  --threshold PERCENT   the slowdown --compare tolerates (default: 10)
+  -h, --help            show this message
+"""
+from __future__ import print_function
+import sys
+import getopt
+import json
+import time
+import resource
+import multiprocessing
+try:
+    # Python 2's StringIO reads both str and unicode strings, io's only unicode
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+import HW1
+
+class Usage(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+def countdown(n):
+    """A loop that runs n times, adding 10 to a second counter each time."""
+    source = '\n'.join([
+        '      ildc 0',
+        '      ildc {0}'.format(n),
+        'loop: ildc 1',
+        '      isub',
+        '      dup',
+        '      jz   done',
+        '      swap',
+        '      ildc 10',
+        '      iadd',
+        '      swap',
+        '      jmp  loop',
+        'done: pop',
+    ])
+    return source, 9 * n - 2
+
+def arithmetic(n):
+    """n blocks of straight-line arithmetic, without any jumps."""
+    lines = ['ildc 1']
+    for i in range(n):
+        lines.extend(['ildc {0}'.format(i % 97 + 2), 'imul',
+                      'ildc {0}'.format(i), 'iadd',
+                      'ildc 1000003', 'imod'])
+    return '\n'.join(lines), 1 + 6 * n
+
+def array(n):
+    """Stores i at addresses 1 to n, then sums them with address 0 as the
+    accumulator."""
+    source = '\n'.join([
+        '      ildc {0}'.format(n),
+        'fill: dup',
+        '      dup',
+        '      store',
+        '      ildc 1',
+        '      isub',
+        '      dup',
+        '      jnz  fill',
+        '      pop',
+        '      ildc 0',
+        '      ildc 0',
+        '      store',
+        '      ildc {0}'.format(n),
+        'sum:  dup',
+        '      load',
+        '      ildc 0',
+        '      load',
+        '      iadd',
+        '      ildc 0',
+        '      swap',
+        '      store',
+        '      ildc 1',
+        '      isub',
+        '      dup',
+        '      jnz  sum',
+        '      pop',
+        '      ildc 0',
+        '      load',
+    ])
+    return source, 19 * n + 9
+
+def deep(n):
+    """Pushes n values, so the stack is n deep, then adds them up."""
+    lines = ['ildc {0}'.format(i % 10) for i in range(n)]
+    lines.extend(['iadd'] * (n - 1))
+    return '\n'.join(lines), 2 * n - 1
+
+# The workloads as (name, generator, size at scale 1), sized to run for
+# around a second in the default mode.
+WORKLOADS = [
+    ('countdown', countdown, 200000),
+    ('arithmetic', arithmetic, 50000),
+    ('array', array, 50000),
+    ('deep', deep, 100000),
+]
+
+MODES = ['fused', 'unfused', 'jit', 'regir']
+
+def measure(source, mode):
+    """Loads and runs a program once, in the calling process.
+
+    Returns:
+        A dict with the program's result, the seconds spent loading it and
+        running it, and the peak resident memory of the process in KiB.
+    """
+    start = time.time()
+    program = HW1.load_program(StringIO(source))
+    loaded = time.time()
+    if mode == 'jit':
+        result = program.execute_compiled()
+    elif mode == 'regir':
+        result = program.execute_registers()
+    else:
+        if mode == 'fused':
+            program.fuse()
+        result = program.execute()
+    end = time.time()
+    return {
+        'result': result,
+        'load_seconds': loaded - start,
+        'seconds': end - loaded,
+        'peak_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+def run_benchmarks(workloads, modes, scale=1.0, repeat=1, out=sys.stdout):
+    """Runs every workload in every mode, each in a fresh process.
+
+    Returns:
+        A dict mapping "workload/mode" to the measurement of its fastest
+        run, along with the number of instructions it executed and the
+        instructions per second.
+    """
+    results = {}
+    print('{0:<22} {1:>11} {2:>9} {3:>9} {4:>10} {5:>9}'.format(
+        'benchmark', 'instrs', 'load s', 'run s', 'Minstr/s', 'peak MiB'), file=out)
+    for name, generate, size in WORKLOADS:
+        if name not in workloads:
+            continue
+        source, instructions = generate(max(1, int(size * scale)))
+        for mode in modes:
+            best = None
+            for i in range(repeat):
+                # A new worker for every run, so ru_maxrss is this run's
+                pool = multiprocessing.Pool(1, maxtasksperchild=1)
+                try:
+                    record = pool.apply(measure, (source, mode))
+                finally:
+                    pool.terminate()
+                    pool.join()
+                if best is None or record['seconds'] < best['seconds']:
+                    best = record
+            best['instructions'] = instructions
+            best['ips'] = instructions / max(best['seconds'], 1e-9)
+            key = '{0}/{1}'.format(name, mode)
+            results[key] = best
+            print('{0:<22} {1:>11} {2:>9.3f} {3:>9.3f} {4:>10.2f} {5:>9.1f}'.format(
+                key, instructions, best['load_seconds'], best['seconds'],
+                best['ips'] / 1e6, best['peak_kib'] / 1024.0), file=out)
+            out.flush()
+    return results
+
+def compare(results, baseline, threshold, out=sys.stdout):
+    """Prints the change in throughput of each benchmark against baseline.
+
+    Returns:
+        The list of benchmarks whose throughput dropped by more than
+        threshold percent.
+    """
+    regressions = []
+    print('Compared to the baseline:', file=out)
+    for key in sorted(results):
+        if key not in baseline:
+            continue
+        ratio = results[key]['ips'] / baseline[key]['ips']
+        slower = ratio < 1 - threshold / 100.0
+        if slower:
+            regressions.append(key)
+        print('\t{0}: {1:+.1f}% instructions/s{2}'.format(
+            key, (ratio - 1) * 100, '  REGRESSION' if slower else ''), file=out)
+    return regressions
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+
+    workload_names = [name for name, generate, size in WORKLOADS]
+    try:
+        try:
+            opts, args = getopt.getopt(argv[1:], "hw:m:s:r:",
+                                       ["help", "workloads=", "modes=", "scale=",
+                                        "repeat=", "save=", "compare=",
+                                        "threshold="])
+        except getopt.error as msg:
+            raise Usage(msg)
+        workloads = workload_names
+        modes = MODES
+        scale = 1.0
+        repeat = 1
+        save = None
+        baseline_path = None
+        threshold = 10.0
+        for o, a in opts:
+            if o in ("-h", "--help"):
+                print(__doc__)
+                return 0
+            elif o in ("-w", "--workloads"):
+                workloads = a.split(',')
+                for name in workloads:
+                    if name not in workload_names:
+                        raise Usage("Unknown workload '{0}'".format(name))
+            elif o in ("-m", "--modes"):
+                modes = a.split(',')
+                for mode in modes:
+                    if mode not in MODES:
+                        raise Usage("Unknown mode '{0}'".format(mode))
+            elif o in ("-s", "--scale"):
+                try:
+                    scale = float(a)
+                except ValueError:
+                    raise Usage("The scale must be a number")
+            elif o in ("-r", "--repeat"):
+                try:
+                    repeat = max(1, int(a))
+                except ValueError:
+                    raise Usage("The number of repeats must be an integer")
+            elif o == "--save":
+                save = a
+            elif o == "--compare":
+                baseline_path = a
+            elif o == "--threshold":
+                try:
+                    threshold = float(a)
+                except ValueError:
+                    raise Usage("The threshold must be a percentage")
+        if len(args) != 0:
+            raise Usage("No arguments are expected")
+    except Usage as err:
+        print(err.msg, file=sys.stderr)
+        print("For help use --help", file=sys.stderr)
+        return 2
+
+    try:
+        baseline = None
+        if baseline_path is not None:
+            with open(baseline_path) as f:
+                baseline = json.load(f)['results']
+
+        results = run_benchmarks(workloads, modes, scale, repeat)
+
+        if save is not None:
+            with open(save, 'w') as f:
+                json.dump({'scale': scale, 'results': results}, f,
+                          indent=2, sort_keys=True)
+                f.write('\n')
+    except (IOError, OSError, ValueError, KeyError) as err:
+        print('Error: {0}'.format(err), file=sys.stderr)
+        return 1
+
+    if baseline is not None and compare(results, baseline, threshold):
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,184 @@
+"""Compiles SSM programs into one Python function per basic block.
+
+The decoded program is split into basic blocks, which start at the first
+instruction, at every jump target and after every jump. Each block becomes a
+Python function whose intermediate values are held in local variables rather
+than on the stack: only the values the block consumes from below its entry
+height are popped, and only the values still live at its exit are pushed.
+A run of arithmetic therefore becomes a few plain Python statements.
+
+Every block function takes the stack (a list) and the store, and returns the
+index of the next instruction to execute, which is always the start of
+another block (or the end of the program). The functions are generated as
+source text and built with compile/exec.
+
+Only verified programs can be compiled, since the stack heights computed by
+Parser.verify_program are what make holding the stack in locals safe.
+"""
+
+import opcodes
+
+# Python operators for the binary arithmetic opcodes. idiv and imod call
+# opcodes.idiv and opcodes.imod, which truncate like the interpreter.
+_BINARY = {
+    opcodes.IADD: '{0} + {1}',
+    opcodes.ISUB: '{0} - {1}',
+    opcodes.IMUL: '{0} * {1}',
+    opcodes.IDIV: 'idiv({0}, {1})',
+    opcodes.IMOD: 'imod({0}, {1})',
+}
+
+class BlockProgram(object):
+    """A program compiled into basic-block functions.
+
+    Attributes:
+        blocks: A list mapping an instruction index to the function of the
+            block starting there, or None if no reachable block starts there.
+        source: The generated Python source, for debugging.
+    """
+
+    def __init__(self, blocks, source):
+        self.blocks = blocks
+        self.source = source
+
+    def run(self, stack, store):
+        """Runs the program from the first block until it falls off the end.
+
+        Args:
+            stack: The list used as the stack, modified in place.
+            store: The Store used by load and store, modified in place.
+        """
+        blocks = self.blocks
+        pc = 0
+        end = len(blocks)
+        while pc < end:
+            pc = blocks[pc](stack, store)
+
+def find_leaders(code):
+    """Returns the sorted indices at which basic blocks start."""
+    leaders = set([0])
+    for i, (op, arg) in enumerate(code):
+        if op in opcodes.BRANCHES:
+            leaders.add(arg)
+            leaders.add(i + 1)
+    end = len(code)
+    return sorted(leader for leader in leaders if leader < end)
+
+def compile_program(code, heights):
+    """Compiles a decoded program into a BlockProgram.
+
+    Args:
+        code: The unfused (opcode, operand) list from Program.decode.
+        heights: The stack height before each instruction, as computed by
+            Parser.verify_program.
+
+    Returns:
+        The compiled BlockProgram.
+    """
+    leaders = find_leaders(code)
+    bounds = list(zip(leaders, leaders[1:] + [len(code)]))
+
+    source = []
+    for start, stop in bounds:
+        if heights[start] is not None: # skip unreachable blocks
+            source.extend(_BlockWriter(code, start, stop).write())
+
+    namespace = {'idiv': opcodes.idiv, 'imod': opcodes.imod}
+    text = '\n'.join(source) + '\n'
+    exec(compile(text, '<ssm blocks>', 'exec'), namespace)
+
+    blocks = [None] * len(code)
+    for start, stop in bounds:
+        blocks[start] = namespace.get('block_{0}'.format(start))
+    return BlockProgram(blocks, text)
+
+class _BlockWriter(object):
+    """Generates the source of the function for one basic block.
+
+    While writing, the values the block has pushed are tracked in a
+    compile-time stack of Python expressions (local variable names and
+    integer literals). Popping past the bottom of it pops the real stack.
+    """
+
+    def __init__(self, code, start, stop):
+        self._code = code
+        self._start = start
+        self._stop = stop
+        self._lines = []
+        self._values = []
+        self._temps = 0
+
+    def write(self):
+        """Returns the lines of the block's function definition."""
+        self._emit('def block_{0}(stack, store):'.format(self._start))
+        for pc in range(self._start, self._stop):
+            op, arg = self._code[pc]
+            if op == opcodes.ILDC:
+                self._values.append('({0})'.format(arg))
+            elif op in _BINARY:
+                first = self._pop()
+                second = self._pop()
+                self._push_new(_BINARY[op].format(second, first))
+            elif op == opcodes.POP:
+                if self._values:
+                    self._values.pop()
+                else:
+                    self._emit('    stack.pop()')
+            elif op == opcodes.DUP:
+                top = self._pop()
+                self._values.append(top)
+                self._values.append(top)
+            elif op == opcodes.SWAP:
+                first = self._pop()
+                second = self._pop()
+                self._values.append(first)
+                self._values.append(second)
+            elif op == opcodes.LOAD:
+                address = self._pop()
+                self._push_new('store.load({0})'.format(address))
+            elif op == opcodes.STORE:
+                value = self._pop()
+                address = self._pop()
+                self._emit('    store.store({0}, {1})'.format(address, value))
+            elif op == opcodes.JMP:
+                self._flush()
+                self._emit('    return {0}'.format(arg))
+                return self._lines
+            elif op == opcodes.JZ or op == opcodes.JNZ:
+                condition = self._pop()
+                self._flush()
+                test = '==' if op == opcodes.JZ else '!='
+                self._emit('    if {0} {1} 0:'.format(condition, test))
+                self._emit('        return {0}'.format(arg))
+                break
+
+        # Fall through into the next block
+        self._flush()
+        self._emit('    return {0}'.format(self._stop))
+        return self._lines
+
+    def _emit(self, line):
+        self._lines.append(line)
+
+    def _pop(self):
+        """Pops an expression, reading from the real stack if none are left."""
+        if self._values:
+            return self._values.pop()
+        return self._push_new('stack.pop()', push=False)
+
+    def _push_new(self, expression, push=True):
+        """Assigns expression to a new local variable and returns its name."""
+        name = 'v{0}'.format(self._temps)
+        self._temps += 1
+        self._emit('    {0} = {1}'.format(name, expression))
+        if push:
+            self._values.append(name)
+        return name
+
+    def _flush(self):
+        """Pushes the values still held in locals onto the real stack."""
+        if len(self._values) == 1:
+            self._emit('    stack.append({0})'.format(self._values[0]))
+        elif self._values:
+            self._emit('    stack.extend(({0}))'.format(', '.join(self._values)))
+        self._values = []
@@ -0,0 +1,193 @@
+"""Binary serialization of verified SSM programs, and a cache of them.
+
+A bytecode file holds everything needed to execute a program without parsing,
+validating or verifying it again. All integers are little-endian:
+
+    header      magic 'SSMB', format version (uint16), 2 padding bytes,
+                instruction count, label count, label name bytes (uint32 each)
+    opcodes     one byte per instruction, padded to a multiple of 8 bytes
+    operands    one int64 per instruction: the ildc value or the jump target,
+                0 for instructions without an argument
+    heights     one int64 per instruction: the verified stack height before
+                it, -1 for unreachable instructions
+    label table one int64 instruction number per label, followed by the
+                label names, UTF-8 encoded and separated by newlines
+
+Files are read through mmap, so the arrays are decoded straight from the
+mapped pages. Programs with an ildc value that doesn't fit in an int64 can't
+be serialized.
+
+The cache stores one bytecode file per program, named after the SHA-256 hash
+of the program's source text (and the format version), so a changed program
+never picks up a stale file.
+
+This module needs Python 3 (array's frombytes and tobytes, and memoryview's
+release); HW1.py only accepts --cache there.
+"""
+
+import array
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import tempfile
+
+MAGIC = b'SSMB'
+VERSION = 1
+
+_HEADER = struct.Struct('<4sH2xIII')
+
+def _pad(length):
+    """Rounds length up to a multiple of 8."""
+    return (length + 7) & ~7
+
+def _native(arr):
+    """Converts an array read from (or written to) a file to/from little-endian."""
+    if sys.byteorder != 'little':
+        arr.byteswap()
+    return arr
+
+def dumps(code, labels, heights):
+    """Serializes a verified program.
+
+    Args:
+        code: The unfused (opcode, operand) list from Program.decode.
+        labels: The mapping of labels to instruction numbers.
+        heights: The verified stack height before each instruction.
+
+    Returns:
+        The bytecode, as bytes.
+
+    Raises:
+        OverflowError: An ildc value doesn't fit in an int64.
+    """
+    count = len(code)
+    ops = array.array('B', [op for op, operand in code])
+    operands = _native(array.array('q', [operand or 0 for op, operand in code]))
+    stack_heights = _native(array.array('q', [-1 if h is None else h for h in heights]))
+
+    label_items = sorted(labels.items())
+    names = '\n'.join(label for label, index in label_items).encode('utf-8')
+    label_indices = _native(array.array('q', [index for label, index in label_items]))
+
+    parts = [
+        _HEADER.pack(MAGIC, VERSION, count, len(label_items), len(names)),
+        ops.tobytes(),
+        b'\0' * (_pad(count) - count),
+        operands.tobytes(),
+        stack_heights.tobytes(),
+        label_indices.tobytes(),
+        names,
+    ]
+    return b''.join(parts)
+
+def loads(data):
+    """Deserializes a program written by dumps.
+
+    Args:
+        data: The bytecode as a bytes-like object, such as an mmap.
+
+    Returns:
+        A (code, labels, heights) tuple, as taken by Program.fromBytecode, or
+        None if data is not bytecode of the current format version, or is
+        damaged.
+    """
+    if len(data) < _HEADER.size:
+        return None
+    magic, version, count, label_count, names_length = _HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        return None
+    offset = _HEADER.size
+    expected = offset + _pad(count) + 8 * (2 * count + label_count) + names_length
+    if len(data) != expected:
+        return None
+
+    view = memoryview(data)
+    ops = view[offset:offset + count].tolist()
+    offset += _pad(count)
+    operands = _read_int64s(view, offset, count)
+    offset += 8 * count
+    heights = _read_int64s(view, offset, count)
+    offset += 8 * count
+    label_indices = _read_int64s(view, offset, label_count)
+    offset += 8 * label_count
+    names = view[offset:offset + names_length].tobytes()
+    view.release()
+    try:
+        names = names.decode('utf-8')
+    except UnicodeDecodeError:
+        return None
+
+    code = list(zip(ops, operands))
+    heights = [None if h < 0 else h for h in heights]
+    labels = {}
+    if label_count > 0:
+        names = names.split('\n')
+        if len(names) != label_count:
+            return None
+        labels = dict(zip(names, label_indices))
+    return code, labels, heights
+
+def _read_int64s(view, offset, count):
+    values = array.array('q')
+    values.frombytes(view[offset:offset + 8 * count])
+    return _native(values).tolist()
+
+def load(path):
+    """Reads a bytecode file through mmap.
+
+    Returns:
+        The (code, labels, heights) tuple from loads, or None if the file
+        doesn't exist or isn't bytecode of the current format version.
+    """
+    try:
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return None
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                return loads(mapped)
+            finally:
+                mapped.close()
+    except (IOError, OSError):
+        return None
+
+def save(path, code, labels, heights):
+    """Writes a bytecode file.
+
+    The file is written under a temporary name and renamed into place, so a
+    concurrent reader never sees a partial file.
+
+    Raises:
+        OverflowError: An ildc value doesn't fit in an int64.
+    """
+    data = dumps(code, labels, heights)
+    directory = os.path.dirname(path) or '.'
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    renamed = False
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.rename(temp_path, path)
+        renamed = True
+    except BaseException:
+        # as in checkpoint.save, an interrupt after the rename must not be
+        # hidden by failing to remove the file
+        if not renamed:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+        raise
+
+def cache_path(cache_dir, source, variant=''):
+    """Returns the path of the cached bytecode for a program's source text.
+
+    variant names the way the program was built from its source (such as
+    'optimized'), so that each way is cached separately.
+    """
+    digest = hashlib.sha256()
+    digest.update('{0}\n{1}\n'.format(VERSION, variant).encode('utf-8'))
+    digest.update(source.encode('utf-8'))
+    return os.path.join(cache_dir, digest.hexdigest() + '.ssmb')
@@ -0,0 +1,224 @@
+"""Checkpoints of running SSM programs, so a long execution can be resumed.
+
+A checkpoint is a snapshot of everything an execution depends on: the index
+of the next instruction, the stack, the store and the number of instructions
+executed so far. It also holds a hash of the code being executed, so it is
+never resumed with a different program (or a differently fused one). All
+integers are little-endian:
+
+    header      magic 'SSMC', format version (uint16), 2 padding bytes,
+                SHA-256 of the code (32 bytes), pc and instruction count
+                (uint64 each)
+    stack       the values, bottom first, as an integer section
+    store       the addresses, then the values, as two integer sections
+
+An integer section is a kind byte and a uint64 count. Kind 0 is followed by
+count int64s. Kind 1, used when some value doesn't fit in 64 bits, is
+followed by each value as a uint32 byte length and that many bytes of
+signed two's complement.
+
+A Checkpointer decides when to write checkpoints, every so many instructions
+or seconds, and writes them atomically over the same file.
+
+This module needs Python 3 (int.to_bytes and array's frombytes and
+tobytes); HW1.py only accepts --checkpoint and --resume there.
+"""
+
+import array
+import hashlib
+import os
+import struct
+import sys
+import tempfile
+import time
+
+MAGIC = b'SSMC'
+VERSION = 1
+
+# Instructions run between checks of the clock, for checkpoints by time
+POLL_INSTRUCTIONS = 1 << 16
+
+_HEADER = struct.Struct('<4sH2x32sQQ')
+_SECTION = struct.Struct('<BQ')
+_LENGTH = struct.Struct('<I')
+
+class CheckpointError(Exception):
+    """A checkpoint file is damaged, or was made by a different program."""
+
+class Snapshot(object):
+    """The state of an execution between two instructions.
+
+    Attributes:
+        code_hash: The hash of the executed code, from code_hash.
+        pc: The index of the next instruction to execute.
+        count: The number of instructions executed so far.
+        stack: The list of values on the stack, bottom first.
+        store: A list of the (address, value) pairs in the store.
+    """
+
+    def __init__(self, code_hash, pc, count, stack, store):
+        self.code_hash = code_hash
+        self.pc = pc
+        self.count = count
+        self.stack = stack
+        self.store = store
+
+class Checkpointer(object):
+    """Writes checkpoints of an execution to a file at regular intervals.
+
+    The executing loop runs slices of `interval` instructions, and after
+    each one asks due whether a checkpoint should be written. Checking only
+    between slices keeps the overhead to a counter per instruction.
+    """
+
+    def __init__(self, path, instructions=None, seconds=None):
+        """
+        Args:
+            path: The file the checkpoints are written to.
+            instructions: Write a checkpoint every this many instructions.
+            seconds: Write a checkpoint every this many seconds. If neither
+                this nor instructions is given, it is every 10 million
+                instructions.
+        """
+        if instructions is None and seconds is None:
+            instructions = 10000000
+        self.path = path
+        self._instructions = instructions
+        self._seconds = seconds
+        self._last_count = 0
+        self._last_time = time.time()
+
+    @property
+    def interval(self):
+        """The number of instructions to run between calls of due."""
+        if self._seconds is None:
+            return self._instructions
+        if self._instructions is None:
+            return POLL_INSTRUCTIONS
+        return min(self._instructions, POLL_INSTRUCTIONS)
+
+    def start(self, count):
+        """Starts timing the intervals from count executed instructions."""
+        self._last_count = count
+        self._last_time = time.time()
+
+    def due(self, count):
+        """Tests whether a checkpoint should be written after count instructions."""
+        if self._instructions is not None and \
+                count - self._last_count >= self._instructions:
+            return True
+        return self._seconds is not None and \
+            time.time() - self._last_time >= self._seconds
+
+    def write(self, snapshot):
+        """Writes snapshot to the checkpoint file and restarts the interval."""
+        save(self.path, snapshot)
+        self.start(snapshot.count)
+
+def code_hash(code):
+    """Returns the SHA-256 digest identifying a decoded program."""
+    return hashlib.sha256(repr(list(code)).encode('utf-8')).digest()
+
+def _native(arr):
+    """Converts an array read from (or written to) a file to/from little-endian."""
+    if sys.byteorder != 'little':
+        arr.byteswap()
+    return arr
+
+def _dump_ints(values, parts):
+    try:
+        packed = _native(array.array('q', values))
+    except OverflowError:
+        parts.append(_SECTION.pack(1, len(values)))
+        for value in values:
+            length = (value.bit_length() + 8) // 8 # room for the sign bit
+            parts.append(_LENGTH.pack(length))
+            parts.append(value.to_bytes(length, 'little', signed=True))
+    else:
+        parts.append(_SECTION.pack(0, len(values)))
+        parts.append(packed.tobytes())
+
+def _load_ints(data, offset):
+    """Reads an integer section, returning (values, offset after it)."""
+    kind, count = _SECTION.unpack_from(data, offset)
+    offset += _SECTION.size
+    if kind == 0:
+        values = array.array('q')
+        values.frombytes(data[offset:offset + 8 * count])
+        if len(values) != count:
+            raise CheckpointError("Checkpoint is truncated")
+        return _native(values).tolist(), offset + 8 * count
+    if kind != 1:
+        raise CheckpointError("Checkpoint has an unknown integer section")
+    values = []
+    for i in range(count):
+        length, = _LENGTH.unpack_from(data, offset)
+        offset += _LENGTH.size
+        values.append(int.from_bytes(data[offset:offset + length], 'little', signed=True))
+        offset += length
+    return values, offset
+
+def dumps(snapshot):
+    """Serializes a Snapshot, returning bytes."""
+    parts = [_HEADER.pack(MAGIC, VERSION, snapshot.code_hash, snapshot.pc, snapshot.count)]
+    _dump_ints(snapshot.stack, parts)
+    _dump_ints([address for address, value in snapshot.store], parts)
+    _dump_ints([value for address, value in snapshot.store], parts)
+    return b''.join(parts)
+
+def loads(data):
+    """Deserializes a Snapshot written by dumps.
+
+    Raises:
+        CheckpointError: data is not a checkpoint of this format version.
+    """
+    try:
+        magic, version, digest, pc, count = _HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise CheckpointError("Not a checkpoint of format version {0}".format(VERSION))
+        offset = _HEADER.size
+        stack, offset = _load_ints(data, offset)
+        addresses, offset = _load_ints(data, offset)
+        values, offset = _load_ints(data, offset)
+    except struct.error:
+        raise CheckpointError("Checkpoint is truncated")
+    if len(addresses) != len(values) or offset != len(data):
+        raise CheckpointError("Checkpoint is damaged")
+    return Snapshot(digest, pc, count, stack, list(zip(addresses, values)))
+
+def save(path, snapshot):
+    """Writes a checkpoint file.
+
+    The file is written under a temporary name and renamed into place, so
+    a process killed while writing leaves the previous checkpoint intact.
+    """
+    data = dumps(snapshot)
+    directory = os.path.dirname(path) or '.'
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    renamed = False
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(temp_path, path)
+        renamed = True
+    except BaseException:
+        # An interrupt may come after the rename but before renamed is set;
+        # the temporary file is then gone, and the original error matters
+        if not renamed:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+        raise
+
+def load(path):
+    """Reads a checkpoint file.
+
+    Raises:
+        IOError: The file can't be read.
+        CheckpointError: The file is not a valid checkpoint.
+    """
+    with open(path, 'rb') as f:
+        return loads(f.read())
@@ -0,0 +1,118 @@
+"""Superinstruction fusion for decoded SSM programs.
+
+This pass runs over the (opcode, operand) list produced by Program.decode and
+replaces frequent instruction sequences with a single internal
+superinstruction (see the opcodes module), so that each sequence costs one
+dispatch instead of several.
+
+A sequence is only fused if none of its instructions other than the first is
+the target of a jump, since a jump into the middle of a superinstruction
+would have nowhere to land. Jump operands are then remapped to the new
+instruction indices.
+"""
+
+import opcodes
+
+def _addi(args):
+    return (opcodes.ADDI, args[0])
+
+def _subi(args):
+    return (opcodes.ADDI, -args[0])
+
+def _muli(args):
+    return (opcodes.MULI, args[0])
+
+def _dup_jz(args):
+    return (opcodes.DUP_JZ, args[1])
+
+def _dup_jnz(args):
+    return (opcodes.DUP_JNZ, args[1])
+
+def _load_imm(args):
+    return (opcodes.LOAD_IMM, args[0])
+
+def _store_imm(args):
+    return (opcodes.STORE_IMM, (args[0], args[1]))
+
+def _addi_under(args):
+    return (opcodes.ADDI_UNDER, args[1])
+
+def _subi_under(args):
+    return (opcodes.ADDI_UNDER, -args[1])
+
+# The fusible sequences as (opcode sequence, builder) pairs, longest first so
+# that the longest match wins. A builder takes the operands of the matched
+# instructions and returns the fused (opcode, operand) pair.
+PATTERNS = [
+    ((opcodes.SWAP, opcodes.ILDC, opcodes.IADD, opcodes.SWAP), _addi_under),
+    ((opcodes.SWAP, opcodes.ILDC, opcodes.ISUB, opcodes.SWAP), _subi_under),
+    ((opcodes.ILDC, opcodes.ILDC, opcodes.STORE), _store_imm),
+    ((opcodes.ILDC, opcodes.IADD), _addi),
+    ((opcodes.ILDC, opcodes.ISUB), _subi),
+    ((opcodes.ILDC, opcodes.IMUL), _muli),
+    ((opcodes.ILDC, opcodes.LOAD), _load_imm),
+    ((opcodes.DUP, opcodes.JZ), _dup_jz),
+    ((opcodes.DUP, opcodes.JNZ), _dup_jnz),
+]
+
+def pattern_name(sequence):
+    """Returns the name of a pattern as used in the fusion report."""
+    return '; '.join(opcodes.NAMES[op] for op in sequence)
+
+# The patterns grouped by their first opcode, as (sequence, builder, name).
+_BY_FIRST_OP = {}
+for _sequence, _build in PATTERNS:
+    _BY_FIRST_OP.setdefault(_sequence[0], []).append(
+        (_sequence, _build, pattern_name(_sequence)))
+del _sequence, _build
+
+def fuse(code):
+    """Fuses the instruction sequences in PATTERNS into superinstructions.
+
+    Args:
+        code: A list of decoded (opcode, operand) tuples, as produced by
+            Program.decode. It is not modified.
+
+    Returns:
+        A (fused_code, fired) tuple. fused_code is the new list of
+        (opcode, operand) tuples and fired maps the name of each pattern that
+        was fused to the number of times it was.
+    """
+    end = len(code)
+    ops = tuple(op for op, arg in code)
+    targets = set(arg for op, arg in code if op in opcodes.BRANCHES)
+
+    fused = []
+    fired = {}
+    new_index = [None] * (end + 1) # old instruction index -> new index
+    i = 0
+    while i < end:
+        new_index[i] = len(fused)
+        for sequence, build, name in _BY_FIRST_OP.get(ops[i], ()):
+            length = len(sequence)
+            if ops[i:i + length] == sequence and \
+                    not any(j in targets for j in range(i + 1, i + length)):
+                fused.append(build([arg for op, arg in code[i:i + length]]))
+                fired[name] = fired.get(name, 0) + 1
+                i += length
+                break
+        else:
+            fused.append(code[i])
+            i += 1
+    new_index[end] = len(fused)
+
+    # Every jump target starts an instruction, so it has a new index.
+    for i, (op, arg) in enumerate(fused):
+        if op in opcodes.BRANCHES:
+            fused[i] = (op, new_index[arg])
+
+    return fused, fired
+
+def format_report(fired):
+    """Formats the fusions that fired, most frequent first."""
+    lines = ['Fusions:']
+    for name, count in sorted(fired.items(), key=lambda item: (-item[1], item[0])):
+        lines.append('\t{0}: {1}'.format(name, count))
+    if len(fired) == 0:
+        lines.append('\tnone')
+    return '\n'.join(lines)
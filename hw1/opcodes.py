@@ -0,0 +1,107 @@
+"""Integer opcodes for the SSM instruction set.
+
+Before a program is executed, every Instruction is decoded from its mnemonic
+into one of the small integers below. The interpreter then dispatches through
+a table indexed by these integers instead of comparing opcode strings.
+"""
+
+ILDC = 0
+IADD = 1
+ISUB = 2
+IMUL = 3
+IDIV = 4
+IMOD = 5
+POP = 6
+DUP = 7
+SWAP = 8
+JZ = 9
+JNZ = 10
+JMP = 11
+LOAD = 12
+STORE = 13
+
+# Internal superinstructions. These never appear in source programs; the
+# fusion module replaces common instruction sequences with them.
+ADDI = 14           # ildc N; iadd  (and ildc N; isub, with -N)
+MULI = 15           # ildc N; imul
+DUP_JZ = 16         # dup; jz L
+DUP_JNZ = 17        # dup; jnz L
+LOAD_IMM = 18       # ildc A; load
+STORE_IMM = 19      # ildc A; ildc V; store
+ADDI_UNDER = 20     # swap; ildc N; iadd; swap  (and isub, with -N)
+
+# Number of opcodes, i.e. the size of a dispatch table.
+COUNT = 21
+
+# Maps each mnemonic to its opcode.
+OPCODES = {
+    'ildc': ILDC,
+    'iadd': IADD,
+    'isub': ISUB,
+    'imul': IMUL,
+    'idiv': IDIV,
+    'imod': IMOD,
+    'pop': POP,
+    'dup': DUP,
+    'swap': SWAP,
+    'jz': JZ,
+    'jnz': JNZ,
+    'jmp': JMP,
+    'load': LOAD,
+    'store': STORE,
+}
+
+# Maps each opcode back to its mnemonic, indexed by opcode.
+NAMES = [None] * COUNT
+for _name, _op in OPCODES.items():
+    NAMES[_op] = _name
+del _name, _op
+NAMES[ADDI] = 'addi'
+NAMES[MULI] = 'muli'
+NAMES[DUP_JZ] = 'dup_jz'
+NAMES[DUP_JNZ] = 'dup_jnz'
+NAMES[LOAD_IMM] = 'load_imm'
+NAMES[STORE_IMM] = 'store_imm'
+NAMES[ADDI_UNDER] = 'addi_under'
+
+# Opcodes whose operand is an instruction index.
+BRANCHES = frozenset([JZ, JNZ, JMP, DUP_JZ, DUP_JNZ])
+
+# The (pops, pushes) stack effect of each opcode, indexed by opcode.
+STACK_EFFECTS = [None] * COUNT
+STACK_EFFECTS[ILDC] = (0, 1)
+STACK_EFFECTS[IADD] = (2, 1)
+STACK_EFFECTS[ISUB] = (2, 1)
+STACK_EFFECTS[IMUL] = (2, 1)
+STACK_EFFECTS[IDIV] = (2, 1)
+STACK_EFFECTS[IMOD] = (2, 1)
+STACK_EFFECTS[POP] = (1, 0)
+STACK_EFFECTS[DUP] = (1, 2)
+STACK_EFFECTS[SWAP] = (2, 2)
+STACK_EFFECTS[JZ] = (1, 0)
+STACK_EFFECTS[JNZ] = (1, 0)
+STACK_EFFECTS[JMP] = (0, 0)
+STACK_EFFECTS[LOAD] = (1, 1)
+STACK_EFFECTS[STORE] = (2, 0)
+
+# idiv and imod truncate toward zero, as in C and Java, rather than flooring
+# like Python's // and %, so that second == idiv(second, first) * first +
+# imod(second, first) and the remainder has the sign of second.
+
+def idiv(second, first):
+    """Divides second by first, truncating toward zero as idiv does.
+
+    The division is exact for integers of any size, unlike int(second /
+    first), which goes through a float. Raises ZeroDivisionError if first is 0.
+    """
+    quotient = abs(second) // abs(first)
+    if (second < 0) != (first < 0):
+        quotient = -quotient
+    return quotient
+
+def imod(second, first):
+    """Returns the remainder of idiv(second, first), as imod does.
+
+    Raises ZeroDivisionError if first is 0.
+    """
+    return second - first * idiv(second, first)
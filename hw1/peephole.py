@@ -0,0 +1,230 @@
+"""Peephole optimization of SSM programs.
+
+This pass rewrites a program at the source level, as a list of (mnemonic,
+argument) pairs and a label table, so that its result is an ordinary SSM
+program: it can be printed, traced, cached and fused like any other. The
+rewrites are:
+
+    constant folding    "ildc a; ildc b; iadd" becomes "ildc c", and likewise
+                        for isub, imul, idiv and imod (but never a division
+                        by zero, which must still fail when it runs)
+    identities          "ildc 0; iadd", "ildc 0; isub" and "ildc 1; imul"
+                        are removed
+    no-ops              "swap; swap", "dup; pop" and "ildc N; pop" are removed
+    jump threading      a jump to a label whose instruction is "jmp M" jumps
+                        to M directly
+    jumps to next       a jmp to a label right after it is removed
+    unreachable code    the instructions after a jmp, up to the next label,
+                        are removed
+    unused labels       labels that no jump refers to are dropped
+
+One rewrite often enables another (dropping a label lets a fold happen
+across it, removing dead code makes a jmp jump to the next instruction), so
+the passes are repeated until none of them changes anything.
+
+Instructions are only combined when no label sits between them, so a jump
+can never land in the middle of a rewritten sequence. Every rewrite keeps the
+stack height at each remaining instruction, but "dup; pop" on an empty stack
+is an underflow, so this must only be run on verified programs.
+"""
+
+import opcodes
+
+# The folding functions for the binary arithmetic opcodes, with the same
+# semantics as the interpreter's handlers.
+_FOLD = {
+    'iadd': lambda second, first: second + first,
+    'isub': lambda second, first: second - first,
+    'imul': lambda second, first: second * first,
+    'idiv': opcodes.idiv,
+    'imod': opcodes.imod,
+}
+
+# Operations that leave their other operand unchanged, as (opcode, value).
+_IDENTITIES = set([('iadd', 0), ('isub', 0), ('imul', 1)])
+
+# Pairs of instructions that leave the stack as it was.
+_NO_OPS = set([('swap', 'swap'), ('dup', 'pop'), ('ildc', 'pop')])
+
+_JUMPS = set(opcodes.NAMES[op] for op in (opcodes.JZ, opcodes.JNZ, opcodes.JMP))
+
+def optimize(instructions, labels):
+    """Applies the peephole rewrites until none of them changes the program.
+
+    Args:
+        instructions: A list of (mnemonic, argument) pairs, where the argument
+            is None for instructions that don't take one. ildc arguments are
+            integer strings and jump arguments are label names.
+        labels: The mapping of labels to instruction numbers.
+
+    Returns:
+        An (instructions, labels, applied) tuple. instructions and labels are
+        the optimized program, in the same form as the arguments, and applied
+        maps the name of each rewrite to the number of times it was done.
+    """
+    entries = _interleave(instructions, labels)
+    applied = {}
+    changed = True
+    while changed:
+        changed = False
+        for name, rewrite in _PASSES:
+            entries, count = rewrite(entries)
+            if count > 0:
+                applied[name] = applied.get(name, 0) + count
+                changed = True
+
+    instructions, labels = _split(entries)
+    return instructions, labels, applied
+
+# The program is rewritten as a single list of entries, in which a label is
+# an entry of its own, (None, name), placed before the instruction it refers
+# to. Deleting or replacing instructions then never needs any renumbering.
+
+def _interleave(instructions, labels):
+    """Merges instructions and labels into one list of entries."""
+    at = {}
+    for label, instruction_number in sorted(labels.items()):
+        at.setdefault(instruction_number, []).append(label)
+
+    entries = []
+    for index, instruction in enumerate(instructions):
+        for label in at.get(index, ()):
+            entries.append((None, label))
+        entries.append(instruction)
+    for label in at.get(len(instructions), ()):
+        entries.append((None, label))
+    return entries
+
+def _split(entries):
+    """Separates a list of entries into instructions and labels."""
+    instructions = []
+    labels = {}
+    for opcode, arg in entries:
+        if opcode is None:
+            labels[arg] = len(instructions)
+        else:
+            instructions.append((opcode, arg))
+    return instructions, labels
+
+def _combine(entries):
+    """Folds constants and removes identities and no-ops.
+
+    The output is built up one entry at a time, and the rewrites are applied
+    to its tail after each one, so that a chain like
+    "ildc 2; ildc 3; iadd; ildc 4; imul" collapses in a single pass.
+    """
+    out = []
+    count = 0
+    for entry in entries:
+        out.append(entry)
+        while _rewrite_tail(out):
+            count += 1
+    return out, count
+
+def _rewrite_tail(out):
+    """Rewrites the instructions at the end of out, if they match a pattern.
+
+    Returns:
+        True if out was changed.
+    """
+    if len(out) < 2 or out[-1][0] is None or out[-2][0] is None:
+        return False
+    (op1, arg1), (op2, arg2) = out[-2:]
+
+    if (op1, op2) in _NO_OPS:
+        del out[-2:]
+        return True
+
+    if op1 == 'ildc' and (op2, int(arg1)) in _IDENTITIES:
+        del out[-2:]
+        return True
+
+    if op2 in _FOLD and op1 == 'ildc' and len(out) >= 3 and out[-3][0] == 'ildc':
+        first = int(arg1)
+        if first == 0 and op2 in ('idiv', 'imod'):
+            return False
+        value = _FOLD[op2](int(out[-3][1]), first)
+        out[-3:] = [('ildc', str(value))]
+        return True
+
+    return False
+
+def _thread_jumps(entries):
+    """Retargets jumps to labels on a jmp, following chains of them."""
+    # The instruction each label refers to, None for labels at the end
+    landing = {}
+    following = None
+    for opcode, arg in reversed(entries):
+        if opcode is None:
+            landing[arg] = following
+        else:
+            following = (opcode, arg)
+
+    out = []
+    count = 0
+    for opcode, arg in entries:
+        if opcode in _JUMPS:
+            target = arg
+            seen = set([target])
+            destination = landing.get(target)
+            while destination is not None and destination[0] == 'jmp':
+                target = destination[1]
+                if target in seen:
+                    # A loop of jmps; retargeting into it would never settle
+                    target = arg
+                    break
+                seen.add(target)
+                destination = landing.get(target)
+            if target != arg:
+                count += 1
+                arg = target
+        out.append((opcode, arg))
+    return out, count
+
+def _remove_unreachable(entries):
+    """Removes the instructions between a jmp and the next label."""
+    out = []
+    count = 0
+    reachable = True
+    for entry in entries:
+        if entry[0] is None:
+            reachable = True
+        elif not reachable:
+            count += 1
+            continue
+        elif entry[0] == 'jmp':
+            reachable = False
+        out.append(entry)
+    return out, count
+
+def _remove_jumps_to_next(entries):
+    """Removes every jmp to a label between it and the next instruction."""
+    out = []
+    count = 0
+    for index, (opcode, arg) in enumerate(entries):
+        if opcode == 'jmp':
+            following = index + 1
+            while following < len(entries) and entries[following][0] is None:
+                if entries[following][1] == arg:
+                    break
+                following += 1
+            if following < len(entries) and entries[following] == (None, arg):
+                count += 1
+                continue
+        out.append((opcode, arg))
+    return out, count
+
+def _drop_unused_labels(entries):
+    """Removes the labels that no jump refers to."""
+    used = set(arg for opcode, arg in entries if opcode in _JUMPS)
+    out = [entry for entry in entries if entry[0] is not None or entry[1] in used]
+    return out, len(entries) - len(out)
+
+# The passes, in the order they are run on each iteration.
+_PASSES = [
+    ('jump threading', _thread_jumps),
+    ('unreachable code', _remove_unreachable),
+    ('jumps to next', _remove_jumps_to_next),
+    ('unused labels', _drop_unused_labels),
+    ('folds and no-ops', _combine),
+]
@@ -0,0 +1,120 @@
+"""Execution profiles of SSM programs.
+
+A Profile is filled in by Program.execute when it is given one. It records
+how many times each instruction ran and how many times each jump was taken,
+along with the maximum stack depth. Everything else (the per-opcode counts,
+how often each label was entered, how often each branch was not taken) is
+derived from those counts when the report is made.
+"""
+
+import json
+
+import opcodes
+
+class Profile(object):
+    """The execution counts of one run of a program.
+
+    Attributes:
+        counts: A list with the number of times each instruction ran.
+        taken: A list with the number of times each instruction jumped.
+        max_depth: The largest number of values that were on the stack.
+    """
+
+    def __init__(self, code, labels):
+        """
+        Args:
+            code: The unfused (opcode, operand) list that will be executed.
+            labels: The mapping of labels to instruction numbers.
+        """
+        self._code = code
+        self._labels = labels
+        self.counts = [0] * len(code)
+        self.taken = [0] * len(code)
+        self.max_depth = 0
+
+    @property
+    def total(self):
+        """The total number of instructions executed."""
+        return sum(self.counts)
+
+    def opcode_counts(self):
+        """Returns a dict mapping each mnemonic to its execution count."""
+        result = {}
+        for (op, arg), count in zip(self._code, self.counts):
+            if count > 0:
+                name = opcodes.NAMES[op]
+                result[name] = result.get(name, 0) + count
+        return result
+
+    def label_counts(self):
+        """Returns a dict mapping each label to the times it was entered."""
+        result = {}
+        for label, index in self._labels.items():
+            if index < len(self.counts):
+                result[label] = self.counts[index]
+        return result
+
+    def branches(self):
+        """Returns a list of dicts describing each branch instruction.
+
+        Each has the instruction's index, its text, and the number of times
+        it was taken and not taken.
+        """
+        names = self._label_names()
+        result = []
+        for index, (op, arg) in enumerate(self._code):
+            if op in opcodes.BRANCHES:
+                result.append({
+                    'index': index,
+                    'instruction': '{0} {1}'.format(opcodes.NAMES[op], names.get(arg, arg)),
+                    'taken': self.taken[index],
+                    'not_taken': self.counts[index] - self.taken[index],
+                })
+        return result
+
+    def to_dict(self):
+        """Returns the profile as a JSON-serializable dict."""
+        return {
+            'instructions': self.total,
+            'max_stack_depth': self.max_depth,
+            'opcodes': self.opcode_counts(),
+            'labels': self.label_counts(),
+            'branches': self.branches(),
+        }
+
+    def write_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2, sort_keys=True)
+            f.write('\n')
+
+    def report(self):
+        """Formats the profile as text, with the hottest entries first."""
+        lines = ['Instructions executed: {0}'.format(self.total),
+                 'Maximum stack depth: {0}'.format(self.max_depth),
+                 'Opcodes:']
+        for name, count in _by_count(self.opcode_counts()):
+            lines.append('\t{0}: {1}'.format(name, count))
+
+        lines.append('Labels entered:')
+        for label, count in _by_count(self.label_counts()):
+            lines.append('\t{0}: {1}'.format(label, count))
+
+        lines.append('Branches (taken / not taken):')
+        branches = sorted(self.branches(),
+                          key=lambda b: (-(b['taken'] + b['not_taken']), b['index']))
+        for branch in branches:
+            lines.append('\t{0}: {1}: {2} / {3}'.format(
+                branch['index'] + 1, branch['instruction'],
+                branch['taken'], branch['not_taken']))
+        return '\n'.join(lines)
+
+    def _label_names(self):
+        """Maps each labelled instruction number to one of its labels."""
+        names = {}
+        for label, index in sorted(self._labels.items()):
+            names.setdefault(index, label)
+        return names
+
+def _by_count(counts):
+    """Sorts the items of a dict of counts, highest count first."""
+    return sorted(counts.items(), key=lambda item: (-item[1], item[0]))
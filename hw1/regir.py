@@ -0,0 +1,275 @@
+"""Translation of SSM programs into a three-address register IR.
+
+In a verified program the stack height before every instruction is known
+(see Parser.verify_program), so each stack slot can be given a fixed virtual
+register: the value at height h lives in register h. Every instruction then
+reads and writes registers by number instead of pushing and popping, e.g.
+"iadd" at height 3 becomes "r1 = r1 + r2", and pop disappears entirely.
+
+The IR instructions are tuples of an IR opcode and its operands:
+
+    (CONST, d, value)   d = value
+    (MOVE, d, s)        d = s
+    (ADD, d, x, y)      d = x + y, and likewise SUB, MUL, DIV and MOD
+    (SWAP, x, y)        exchange x and y
+    (LOAD, d, a)        d = the value stored at address a
+    (STORE, a, v)       store v at address a
+    (JZ, x, target)     jump to target if x == 0
+    (JNZ, x, target)    jump to target if x != 0
+    (JMP, target)       jump to target
+    (RET, x)            stop, with x as the program's result
+
+where d, s, x, y, a and v are register numbers and targets are IR indices.
+A program can end with different stack heights on different paths, so every
+way of reaching the end goes to a RET of the register on top at that height.
+
+The executor turns each IR instruction into a small closure that reads and
+writes a list of registers, and returns the index of the next instruction.
+"""
+
+import opcodes
+
+CONST = 0
+MOVE = 1
+ADD = 2
+SUB = 3
+MUL = 4
+DIV = 5
+MOD = 6
+SWAP = 7
+LOAD = 8
+STORE = 9
+JZ = 10
+JNZ = 11
+JMP = 12
+RET = 13
+
+NAMES = ['const', 'move', 'add', 'sub', 'mul', 'div', 'mod', 'swap',
+         'load', 'store', 'jz', 'jnz', 'jmp', 'ret']
+
+_BINARY = {
+    opcodes.IADD: ADD,
+    opcodes.ISUB: SUB,
+    opcodes.IMUL: MUL,
+    opcodes.IDIV: DIV,
+    opcodes.IMOD: MOD,
+}
+
+_BRANCHES = {
+    opcodes.JZ: JZ,
+    opcodes.JNZ: JNZ,
+}
+
+_OPERATORS = {ADD: '+', SUB: '-', MUL: '*', DIV: '/', MOD: '%'}
+
+class RegisterProgram(object):
+    """A program translated into register IR, ready to be executed.
+
+    Attributes:
+        code: The list of IR instruction tuples.
+        registers: The number of virtual registers the code uses.
+    """
+
+    def __init__(self, code, registers):
+        self.code = code
+        self.registers = registers
+        self._steps = [_step(instruction, pc + 1, registers, len(code))
+                       for pc, instruction in enumerate(code)]
+
+    def run(self, store):
+        """Runs the program from its first instruction until a RET.
+
+        Args:
+            store: The Store used by LOAD and STORE, modified in place.
+
+        Returns:
+            The value of the register returned by RET.
+        """
+        steps = self._steps
+        regs = [0] * (self.registers + 1) # plus a slot for the result
+        pc = 0
+        end = len(steps)
+        while pc < end:
+            pc = steps[pc](regs, store)
+        return regs[self.registers]
+
+    def __str__(self):
+        return format_code(self.code)
+
+def translate(code, heights):
+    """Translates a verified program into register IR.
+
+    Args:
+        code: The unfused (opcode, operand) list from Program.decode.
+        heights: The stack height before each instruction, as computed by
+            Parser.verify_program.
+
+    Returns:
+        The RegisterProgram.
+    """
+    end = len(code)
+    ir = []
+    sources = [] # the index of the instruction each IR instruction came from
+    new_index = [None] * end # the IR index each instruction starts at
+    registers = 0
+    exits = {} # stack height at the end -> index of its RET
+    for pc, (op, arg) in enumerate(code):
+        new_index[pc] = len(ir)
+        h = heights[pc]
+        if h is None: # unreachable
+            continue
+        pops, pushes = opcodes.STACK_EFFECTS[op]
+        registers = max(registers, h - pops + pushes)
+
+        if op == opcodes.ILDC:
+            ir.append((CONST, h, arg))
+        elif op in _BINARY:
+            ir.append((_BINARY[op], h - 2, h - 2, h - 1))
+        elif op == opcodes.DUP:
+            ir.append((MOVE, h, h - 1))
+        elif op == opcodes.SWAP:
+            ir.append((SWAP, h - 2, h - 1))
+        elif op == opcodes.LOAD:
+            ir.append((LOAD, h - 1, h - 1))
+        elif op == opcodes.STORE:
+            ir.append((STORE, h - 2, h - 1))
+        elif op in _BRANCHES:
+            ir.append((_BRANCHES[op], h - 1, arg))
+        elif op == opcodes.JMP:
+            ir.append((JMP, arg))
+        # pop only lowers the height, so it needs no instruction
+        sources.extend([pc] * (len(ir) - len(sources)))
+
+    # Falling off the end returns the top of the stack after the last
+    # instruction; its RET has to come right after the last instruction.
+    if end > 0 and heights[-1] is not None and code[-1][0] != opcodes.JMP:
+        pops, pushes = opcodes.STACK_EFFECTS[code[-1][0]]
+        height = heights[-1] - pops + pushes
+        exits[height] = len(ir)
+        ir.append((RET, height - 1))
+
+    for i, instruction in enumerate(ir):
+        if instruction[0] in (JZ, JNZ, JMP):
+            target = instruction[-1]
+            if target < end:
+                target = new_index[target]
+            else:
+                # A jump to the end returns the top of the stack after it
+                pc = sources[i]
+                pops, pushes = opcodes.STACK_EFFECTS[code[pc][0]]
+                height = heights[pc] - pops + pushes
+                if height not in exits:
+                    exits[height] = len(ir)
+                    ir.append((RET, height - 1))
+                target = exits[height]
+            ir[i] = instruction[:-1] + (target,)
+
+    return RegisterProgram(ir, registers)
+
+def format_code(code):
+    """Formats IR code as text, one numbered instruction per line."""
+    lines = []
+    for pc, instruction in enumerate(code):
+        op = instruction[0]
+        if op == CONST:
+            text = 'r{0} = {1}'.format(instruction[1], instruction[2])
+        elif op == MOVE:
+            text = 'r{0} = r{1}'.format(instruction[1], instruction[2])
+        elif op in _OPERATORS:
+            text = 'r{0} = r{1} {2} r{3}'.format(instruction[1], instruction[2],
+                                                  _OPERATORS[op], instruction[3])
+        elif op == SWAP:
+            text = 'swap r{0}, r{1}'.format(instruction[1], instruction[2])
+        elif op == LOAD:
+            text = 'r{0} = load r{1}'.format(instruction[1], instruction[2])
+        elif op == STORE:
+            text = 'store r{0}, r{1}'.format(instruction[1], instruction[2])
+        elif op in (JZ, JNZ):
+            text = '{0} r{1}, {2}'.format(NAMES[op], instruction[1], instruction[2])
+        elif op == JMP:
+            text = 'jmp {0}'.format(instruction[1])
+        else:
+            text = 'ret r{0}'.format(instruction[1])
+        lines.append('{0}: {1}'.format(pc, text))
+    return '\n'.join(lines)
+
+def _step(instruction, next_pc, registers, end):
+    """Builds the closure that executes one IR instruction.
+
+    The closure takes the register list and the store, and returns the index
+    of the next instruction. Operands are bound when the closure is built, so
+    running it does no decoding at all.
+    """
+    op = instruction[0]
+    if op == CONST:
+        d, value = instruction[1:]
+        def step(regs, store):
+            regs[d] = value
+            return next_pc
+    elif op == MOVE:
+        d, s = instruction[1:]
+        def step(regs, store):
+            regs[d] = regs[s]
+            return next_pc
+    elif op == ADD:
+        d, x, y = instruction[1:]
+        def step(regs, store):
+            regs[d] = regs[x] + regs[y]
+            return next_pc
+    elif op == SUB:
+        d, x, y = instruction[1:]
+        def step(regs, store):
+            regs[d] = regs[x] - regs[y]
+            return next_pc
+    elif op == MUL:
+        d, x, y = instruction[1:]
+        def step(regs, store):
+            regs[d] = regs[x] * regs[y]
+            return next_pc
+    elif op == DIV:
+        d, x, y = instruction[1:]
+        def step(regs, store):
+            regs[d] = opcodes.idiv(regs[x], regs[y])
+            return next_pc
+    elif op == MOD:
+        d, x, y = instruction[1:]
+        def step(regs, store):
+            regs[d] = opcodes.imod(regs[x], regs[y])
+            return next_pc
+    elif op == SWAP:
+        x, y = instruction[1:]
+        def step(regs, store):
+            regs[x], regs[y] = regs[y], regs[x]
+            return next_pc
+    elif op == LOAD:
+        d, a = instruction[1:]
+        def step(regs, store):
+            regs[d] = store.load(regs[a])
+            return next_pc
+    elif op == STORE:
+        a, v = instruction[1:]
+        def step(regs, store):
+            store.store(regs[a], regs[v])
+            return next_pc
+    elif op == JZ:
+        x, target = instruction[1:]
+        def step(regs, store):
+            if regs[x] == 0:
+                return target
+            return next_pc
+    elif op == JNZ:
+        x, target = instruction[1:]
+        def step(regs, store):
+            if regs[x] != 0:
+                return target
+            return next_pc
+    elif op == JMP:
+        target = instruction[1]
+        def step(regs, store):
+            return target
+    else: # RET
+        x = instruction[1]
+        def step(regs, store):
+            regs[registers] = regs[x]
+            return end
+    return step
@@ -0,0 +1,77 @@
+"""Incremental tokenizer for SSM source code.
+
+The source is read from a file object in fixed-size chunks, and tokens are
+produced lazily, so only one chunk (plus a partial token carried over to the
+next one) is held in memory at a time, however large the program is, even
+if it is all on one line.
+
+A token is a run of characters other than whitespace and ':', or such a run
+followed by a ':', which makes it a label. A label therefore doesn't need any
+whitespace between it and the next token. Comments begin with a '#' character
+and end at the next new line or EOF.
+"""
+
+import re
+
+# Size of the chunks read from the input, in characters.
+CHUNK_SIZE = 1 << 16
+
+# A new line, a comment, or a token (group 2)
+_TOKEN = re.compile(r'(\n)|#[^\n]*|([^\s:#]*:|[^\s:#]+)')
+
+def tokenize(stream, chunk_size=CHUNK_SIZE):
+    """Generates the tokens of the SSM source read from stream.
+
+    Args:
+        stream: A file object opened in text mode.
+        chunk_size: The number of characters to read at a time.
+
+    Yields:
+        (text, line, column) tuples, where line and column are the 1-indexed
+        position of the token's first character.
+    """
+    line_number = 1
+    # The number of characters of the current line before the text scanned
+    column = 0
+    carry = ''
+    # Whether the text read so far ends inside a comment, whose remaining
+    # characters are skipped up to the next new line
+    in_comment = False
+    done = False
+    while not done:
+        chunk = stream.read(chunk_size)
+        if chunk:
+            text = carry + chunk
+            if in_comment:
+                end = text.find('\n')
+                if end < 0:
+                    continue
+                text = text[end:]
+                in_comment = False
+            # A comment in the last line runs to the end of the text, so it
+            # is dropped and the rest of it skipped. Otherwise the text is
+            # scanned up to its last whitespace, as the token after it may
+            # continue in the next chunk.
+            last_line = text.rfind('\n') + 1
+            comment = text.find('#', last_line)
+            if comment >= 0:
+                carry = ''
+                text = text[:comment]
+                in_comment = True
+            else:
+                cut = max([text.rfind(space) for space in ' \t\n\r\f\v']) + 1
+                carry = text[cut:]
+                text = text[:cut]
+        else:
+            text = carry
+            done = True
+
+        line_start = -column
+        for match in _TOKEN.finditer(text):
+            token = match.group(2)
+            if token is not None:
+                yield token, line_number, match.start() - line_start + 1
+            elif match.group(1) is not None:
+                line_number += 1
+                line_start = match.end()
+        column = len(text) - line_start
@@ -14,8 +14,11 @@ if __name__ == '__main__':
     with open(sys.argv[1]) as f:
         data = f.read()
         lexer = lex.lex(module=decaflexer)
-        parser = yacc.yacc(module=decafparser)
-        parser.parse(data)
+        # The tables are written to decafparsetab.py on the first run, and
+        # read from it afterwards for as long as the grammar is unchanged
+        parser = yacc.yacc(module=decafparser, tabmodule='decafparsetab',
+                           debug=False)
+        parser.parse(data, lexer=lexer)
 
         # Parse successful
         print ("Parse successful!")
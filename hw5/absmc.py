@@ -3,6 +3,9 @@ class AbstractMachine(object):
         self.static_data = 0
         self.instr_list = []
         self.labels = []
+        # The numbers given to the next new register and branch label
+        self.register_count = 0
+        self.label_count = 1
 
     def add_instr(self, instr):
         if len(self.labels) > 0:
@@ -16,6 +19,15 @@ class AbstractMachine(object):
     def add_static_field(self):
         self.static_data += 1
 
+    def new_register(self, reg_type='t'):
+        reg = Register(reg_type, self.register_count)
+        self.register_count += 1
+        return reg
+
+    def new_label_number(self):
+        self.label_count += 1
+        return self.label_count - 1
+
     def __str__(self):
         str_list = []
         str_list.append('.static_data {}'.format(self.static_data))
@@ -24,14 +36,19 @@ class AbstractMachine(object):
 
 
 class Instruction(object):
-    def __init__(self, op, args, label=None):
+    def __init__(self, machine, op, args, label=None):
         self.op = op
         self.args = args
         self.label = label
         machine.add_instr(self)
 
     def __str__(self):
-        arg_list = [str(arg) for arg in self.args]
+        return self.to_string(str)
+
+    def to_string(self, show):
+        '''Returns the instruction as it is printed, with each argument
+        shown by show.'''
+        arg_list = [show(arg) for arg in self.args]
         label_string = ""
         if self.label is not None:
             label_string = '{}:\n'.format(self.label)
@@ -48,16 +65,12 @@ class Label(object):
 
 
 class Register(object):
-    count = 0
-
+    '''A register. New numbered registers come from
+    AbstractMachine.new_register; the sap register has no number.'''
     def __init__(self, reg_type='t', reg_num=None):
         self.reg_type = reg_type
         self.reg_num = reg_num
 
-        if self.reg_num is None and self.reg_type != 'sap':
-            self.reg_num = Register.count
-            Register.count += 1
-
     def __str__(self):
         if self.reg_type == 'sap':
             return '{}'.format(self.reg_type)
@@ -66,7 +79,7 @@ class Register(object):
 
 
 class MethodLabel(Label):
-    def __init__(self, name, id):
+    def __init__(self, machine, name, id):
         if name == 'main':
             name = '__main__'
         else:
@@ -77,21 +90,120 @@ class MethodLabel(Label):
 
 
 class ConstructorLabel(Label):
-    def __init__(self, id):
+    def __init__(self, machine, id):
         super(ConstructorLabel, self).__init__('C_{}'.format(id))
 
         machine.add_label(self)
 
 
 class BranchLabel(Label):
-    unique_int = 1
-
-    def __init__(self, lines, name):
-        super(BranchLabel, self).__init__('L{}_{}_{}'.format(lines, name, BranchLabel.unique_int))
-        BranchLabel.unique_int += 1
+    def __init__(self, machine, lines, name):
+        # the parts of the name are kept for the linker, which moves the
+        # labels of a class compiled on its own to its place in the program
+        self.lines = lines
+        self.kind = name
+        self.number = machine.new_label_number()
+        super(BranchLabel, self).__init__('L{}_{}_{}'.format(lines, name, self.number))
+        self.machine = machine
 
     def add_to_code(self):
-        machine.add_label(self)
+        self.machine.add_label(self)
+
+
+class Symbol(object):
+    '''A value in the code of a class compiled on its own, which depends on
+    the other classes and is filled in by the linker:
+    ('method', class name, index): the label of a class's method
+    ('constructor', class name, index): the label of a class's constructor
+    ('offset', class name, field name): the offset of a field
+    ('size', class name): the size of a class's records'''
+    def __init__(self, kind, classname, member=None):
+        self.kind = kind
+        self.classname = classname
+        self.member = member
+
+    def key(self):
+        return (self.kind, self.classname, self.member)
+
+    def __eq__(self, other):
+        return isinstance(other, Symbol) and self.key() == other.key()
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def __str__(self):
+        if self.member is None:
+            return '{}({})'.format(self.kind, self.classname)
+        return '{}({}, {})'.format(self.kind, self.classname, self.member)
+
+
+class ObjectMachine(AbstractMachine):
+    '''The machine the code of one class is generated into when it is
+    compiled on its own. The labels are kept in the code where they were
+    added rather than put on the next instruction, as the labels at the end
+    of a class's code go on the first instruction of the next class's.'''
+    def __init__(self):
+        super(ObjectMachine, self).__init__()
+        self.code = []
+
+    def add_instr(self, instr):
+        self.code.append(instr)
+
+    def add_label(self, label):
+        self.code.append(label)
+
+
+class ObjectUnit(object):
+    '''The code of one class, compiled on its own, for linker.py to link
+    with the other classes' units into a program.
+
+    The code is kept as the text it is printed as, in which what is only
+    known once the unit is linked are replacement fields for str.format, each
+    described by an item of fields: ('symbol', Symbol) for the label of a
+    method or constructor or for an offset or a size, or ('label', lines,
+    kind, number) for a branch label, numbered from 1 in the unit (labels is
+    how many there are) and on the lines of the class when it was compiled,
+    starting on line. tail is the labels after the last instruction, which
+    go on the first instruction of the next classes'. exports are the
+    Symbols of the class's methods and constructors, and output is what was
+    printed while generating the code.'''
+    def __init__(self, name, line, machine, output, exports):
+        self.name = name
+        self.line = line
+        self.labels = machine.label_count - 1
+        self.output = output
+        self.exports = exports
+        self.fields = []
+        numbers = {}
+
+        def field(key, value):
+            if key not in numbers:
+                numbers[key] = len(self.fields)
+                self.fields.append(value)
+            return '{{{}}}'.format(numbers[key])
+
+        def show(arg):
+            if isinstance(arg, BranchLabel):
+                return field(id(arg), ('label', arg.lines, arg.kind, arg.number))
+            if isinstance(arg, Label) and isinstance(arg.name, Symbol):
+                arg = arg.name
+            if isinstance(arg, Symbol):
+                return field(arg, ('symbol', arg))
+            return str(arg).replace('{', '{{').replace('}', '}}')
+
+        parts = []
+        end = 0
+        for item in machine.code:
+            if isinstance(item, Label):
+                parts.append('{}:\n'.format(show(item)))
+            else:
+                parts.append(item.to_string(show) + '\n')
+                end = len(parts)
+        self.code = ''.join(parts[:end])
+        self.tail = ''.join(parts[end:])
 
 
 class ProcedureInstr(Instruction):
@@ -100,21 +212,21 @@ class ProcedureInstr(Instruction):
     ret
     save r
     restore r'''
-    def __init__(self, op, arg=None):
+    def __init__(self, machine, op, arg=None):
         if arg is None:
             args = []
         else:
             args = [arg]
-        super(ProcedureInstr, self).__init__(op, args)
+        super(ProcedureInstr, self).__init__(machine, op, args)
 
 
 class ConvertInstr(Instruction):
     '''The conversion instructions are:
     ftoi dst, src
     itof dst, src'''
-    def __init__(self, op, reg):
-        self.dst = Register()
-        super(ConvertInstr, self).__init__(op, [self.dst, reg])
+    def __init__(self, machine, op, reg):
+        self.dst = machine.new_register()
+        super(ConvertInstr, self).__init__(machine, op, [self.dst, reg])
 
 
 class BranchInstr(Instruction):
@@ -122,14 +234,14 @@ class BranchInstr(Instruction):
     bz r, l
     bnz r, l
     jmp l'''
-    def __init__(self, op, label=None, reg=None):
+    def __init__(self, machine, op, label=None, reg=None):
         if label is None:
             args = []
         elif reg is None:
             args = [label]
         else:
             args = [reg, label]
-        super(BranchInstr, self).__init__(op, args)
+        super(BranchInstr, self).__init__(machine, op, args)
 
 
 class MoveInstr(Instruction):
@@ -137,9 +249,9 @@ class MoveInstr(Instruction):
     move_immed_i r, i
     move_immed_f r, f
     move dst, src'''
-    def __init__(self, op, dst, src, val_is_const=False):
+    def __init__(self, machine, op, dst, src, val_is_const=False):
         self.is_src_const = val_is_const
-        super(MoveInstr, self).__init__(op, [dst, src])
+        super(MoveInstr, self).__init__(machine, op, [dst, src])
 
 
 class ArithInstr(Instruction):
@@ -156,8 +268,8 @@ class ArithInstr(Instruction):
 
     There also exist floating point operations of the form fadd, fsub, etc.
     for all but the modulus operator (imod exists but fmod doesn't)'''
-    def __init__(self, op, dst, src1, src2, type='i'):
-        super(ArithInstr, self).__init__(type + op, [dst, src1, src2])
+    def __init__(self, machine, op, dst, src1, src2, type='i'):
+        super(ArithInstr, self).__init__(machine, type + op, [dst, src1, src2])
 
 
 class HeapInstr(Instruction):
@@ -165,11 +277,9 @@ class HeapInstr(Instruction):
     hload  dst, base, off
     hstore base, off, dst
     halloc base, off'''
-    def __init__(self, op, reg1, reg2, reg3=None):
+    def __init__(self, machine, op, reg1, reg2, reg3=None):
         if reg3 is None:
             args = [reg1, reg2]
         else:
             args = [reg1, reg2, reg3]
-        super(HeapInstr, self).__init__(op, args)
-
-machine = AbstractMachine()
+        super(HeapInstr, self).__init__(machine, op, args)
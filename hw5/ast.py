@@ -21,6 +21,14 @@ def print_ast():
     
 
 def initialize_ast():
+    global lastmethod, lastconstructor
+    # start from an empty class table and fresh ids, so that a program
+    # compiles the same whether or not others were compiled before it
+    classtable.clear()
+    lastmethod = 0
+    lastconstructor = 0
+    Field.lastfield = 0
+
     # define In class:
     cin = Class("In", None)
     cin.builtin = True     # this is a builtin class
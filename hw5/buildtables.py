@@ -0,0 +1,93 @@
+""" Build the parser and lexer tables
+Writes the LALR tables for decafparser.py to decafparsetab.py and the lexer's
+tables to decaflextab.py, and byte-compiles both, so the compiler reads them
+instead of building the tables every time it starts.
+Usage: python buildtables.py [options]
+
+Run it again after changing the grammar or the token rules. Both table
+modules record a signature of what they were built from, and the compiler
+notices when they are out of date and builds its tables at startup instead.
+It writes the parser's tables to decafparsetab.py when it builds them, so
+that only its first run is slower, but the lexer's tables are only written
+here.
+
+Options:
+  -h, --help    show this message
+"""
+import os
+import sys
+import getopt
+import py_compile
+import ply.lex as lex
+import ply.yacc as yacc
+
+import decaflexer
+import decafparser
+
+class Usage(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+# The table modules, as named in decaflexer.py and decafparser.py
+LEXTAB = 'decaflextab'
+PARSETAB = 'decafparsetab'
+
+def remove_tables(directory):
+    for name in (LEXTAB, PARSETAB):
+        # importing decaflexer and decafparser may have loaded old tables
+        sys.modules.pop(name, None)
+        for ext in ('.py', '.pyc', '.pyo'):
+            path = os.path.join(directory, name + ext)
+            if os.path.exists(path):
+                os.remove(path)
+
+def build_tables(directory):
+    '''Writes and byte-compiles the table modules in directory.'''
+    remove_tables(directory)
+
+    lex.lex(module=decaflexer, optimize=1, lextab=LEXTAB, outputdir=directory)
+    lextab = os.path.join(directory, LEXTAB + '.py')
+    with open(lextab, 'a') as f:
+        f.write('signature = {!r}\n'.format(decaflexer.rules_signature()))
+
+    yacc.yacc(module=decafparser, tabmodule=PARSETAB, outputdir=directory,
+              debug=False, write_tables=True)
+    parsetab = os.path.join(directory, PARSETAB + '.py')
+
+    for path in (lextab, parsetab):
+        if not os.path.exists(path):
+            raise IOError("{} was not written".format(path))
+        py_compile.compile(path, doraise=True)
+    return lextab, parsetab
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+
+    try:
+        try:
+            opts, args = getopt.getopt(argv[1:], "h", ["help"])
+        except getopt.error, msg:
+            raise Usage(msg)
+        for o,a in opts:
+            if o in ("-h", "--help"):
+                print __doc__
+                return 0
+        if len(args) != 0:
+            raise Usage("No arguments are expected")
+    except Usage, err:
+        print >>sys.stderr, err.msg
+        print >>sys.stderr, "For help use --help"
+        return 2
+
+    directory = os.path.dirname(os.path.abspath(__file__))
+    try:
+        for path in build_tables(directory):
+            print "Wrote {}".format(path)
+    except (IOError, OSError, py_compile.PyCompileError), err:
+        print >>sys.stderr, "Error: {}".format(err)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
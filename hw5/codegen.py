@@ -1,3 +1,6 @@
+import sys
+import StringIO
+
 import ast
 import absmc
 
@@ -6,549 +9,643 @@ import absmc
 
 ####################################################################################################
 
-# Global vars that hold label objects for different expressions / statements
-label_scope = []
+class CodeGenerator(object):
+    '''Generates the code for one program into an AbstractMachine.
 
-# This holds the label used for a `continue` statement in a loop
-# For `for` loops, this points to the update expression
-# For `while` loops, this points to the condition expression
+    All the state of a compilation lives on the generator and its machine, so
+    several programs can be compiled in the same process, one after another
+    or in separate threads.'''
+    def __init__(self, machine):
+        self.machine = machine
+        self.classtable = None
 
-current_loop_continue_label = None
+        # Label objects for different expressions / statements, saved
+        # while generating the code nested in them
+        self.label_scope = []
 
-# This holds the entrance of a loop, or the then part of an if statement
-current_enter_then_label = None
+        # This holds the label used for a `continue` statement in a loop
+        # For `for` loops, this points to the update expression
+        # For `while` loops, this points to the condition expression
 
-# This holds the loop's exit or the else part of an if statement
-current_break_out_else_label = None
+        self.current_loop_continue_label = None
 
-# Examples:
-# if we're in an if stmt where:
-#
-# if (x < y && x == z) {
-#   x++;
-# } else {
-#   x--;
-# }
-# then if x < y BinaryExpr evals to false, we know to jump to the else branch
-# and use the label called 'current_break_out_else_label'
-# similarly, if we're in a loop where:
-#
-# while (x < y || x < z) {
-#   x++;
-# }
-#
-# if x < y evals to true, jump into the body of the loop
-# which is the label held by current_enter_then_label
+        # This holds the entrance of a loop, or the then part of an if statement
+        self.current_enter_then_label = None
 
-non_static_field_offset = 0
-current_method = None
+        # This holds the loop's exit or the else part of an if statement
+        self.current_break_out_else_label = None
 
-def push_labels():
-    global label_scope
-    global current_loop_continue_label, current_enter_then_label, current_break_out_else_label
+        # Examples:
+        # if we're in an if stmt where:
+        #
+        # if (x < y && x == z) {
+        #   x++;
+        # } else {
+        #   x--;
+        # }
+        # then if x < y BinaryExpr evals to false, we know to jump to the else branch
+        # and use the label called 'current_break_out_else_label'
+        # similarly, if we're in a loop where:
+        #
+        # while (x < y || x < z) {
+        #   x++;
+        # }
+        #
+        # if x < y evals to true, jump into the body of the loop
+        # which is the label held by current_enter_then_label
 
-    label_scope.append(current_loop_continue_label)
-    label_scope.append(current_enter_then_label)
-    label_scope.append(current_break_out_else_label)
+        self.non_static_field_offset = 0
+        self.current_method = None
 
-def pop_labels():
-    global label_scope
-    global current_loop_continue_label, current_enter_then_label, current_break_out_else_label
+    def push_labels(self):
+        self.label_scope.append(self.current_loop_continue_label)
+        self.label_scope.append(self.current_enter_then_label)
+        self.label_scope.append(self.current_break_out_else_label)
 
-    current_break_out_else_label = label_scope.pop()
-    current_enter_then_label = label_scope.pop()
-    current_loop_continue_label = label_scope.pop()
+    def pop_labels(self):
+        self.current_break_out_else_label = self.label_scope.pop()
+        self.current_enter_then_label = self.label_scope.pop()
+        self.current_loop_continue_label = self.label_scope.pop()
 
-def calc_nonstatic_offsets(cls):
-    '''Calculates the offsets for all instance fields of a class.
+    def calc_nonstatic_offsets(self, cls):
+        '''Calculates the offsets for all instance fields of a class.
 
-    Walks up the hierarchy and assigns each instance field a unique offset.
-    At the end, it sets the class's size to number of instance fields.'''
-    global non_static_field_offset
+        Walks up the hierarchy and assigns each instance field a unique offset.
+        At the end, it sets the class's size to number of instance fields.'''
 
-    if cls.superclass is not None:
-        calc_nonstatic_offsets(cls.superclass)
+        if cls.superclass is not None:
+            self.calc_nonstatic_offsets(cls.superclass)
 
-    for field in cls.fields.viewvalues():
-        if field.storage == 'instance':
-            field.offset = non_static_field_offset
-            print '# field {} given {}'.format(field.name, non_static_field_offset)
-            non_static_field_offset += 1
+        for field in cls.fields.viewvalues():
+            if field.storage == 'instance':
+                field.offset = self.non_static_field_offset
+                print '# field {} given {}'.format(field.name, self.non_static_field_offset)
+                self.non_static_field_offset += 1
 
-    cls.size = non_static_field_offset
+        cls.size = self.non_static_field_offset
 
 
-def calc_static_offsets(cls):
-    for field in cls.fields.viewvalues():
-        if field.storage == 'static':
-            field.offset = absmc.machine.static_data
-            absmc.machine.add_static_field()
+    def calc_static_offsets(self, cls):
+        for field in cls.fields.viewvalues():
+            if field.storage == 'static':
+                field.offset = self.machine.static_data
+                self.machine.add_static_field()
 
 
-def preprocess(cls):
-    global non_static_field_offset
+    def preprocess(self, cls):
+        self.calc_static_offsets(cls)
 
-    calc_static_offsets(cls)
+        self.non_static_field_offset = 0
+        self.calc_nonstatic_offsets(cls)
 
-    non_static_field_offset = 0
-    calc_nonstatic_offsets(cls)
 
+    def generate(self, classtable):
+        self.classtable = classtable
 
-def generate_code(classtable):
+        for cls in classtable.viewvalues():
+            self.preprocess(cls)
 
-    for cls in classtable.viewvalues():
-        preprocess(cls)
+        for cls in classtable.viewvalues():
+            self.generate_class_code(cls)
 
-    for cls in classtable.viewvalues():
-        generate_class_code(cls)
 
+    def setup_registers(self, method):
+        # block 0 are the formals, which go into args
+        # if static, first arg is a0,
+        # if instance, first arg is a1, as `this` goes in a0
 
-def setup_registers(method):
-    # block 0 are the formals, which go into args
-    # if static, first arg is a0,
-    # if instance, first arg is a1, as `this` goes in a0
+        if isinstance(method, ast.Method) and method.storage == 'static':
+            self.machine.register_count = 0
+        else:
+            self.machine.register_count = 1
 
-    if isinstance(method, ast.Method) and method.storage == 'static':
-        absmc.Register.count = 0
-    else:
-        absmc.Register.count = 1
+        for var in method.vars.vars[0].values():
+            var.reg = self.machine.new_register('a')
+            print '# var {} given {}'.format(var.name, var.reg)
 
-    for var in method.vars.vars[0].values():
-        var.reg = absmc.Register('a')
-        print '# var {} given {}'.format(var.name, var.reg)
+        self.machine.register_count = 0
+        # rest of the vars in the method go into t registers
+        for block in range(1, len(method.vars.vars)):
+            for var in method.vars.vars[block].values():
+                var.reg = self.machine.new_register('t')
+                print '# var {} given {}'.format(var.name, var.reg)
 
-    absmc.Register.count = 0
-    # rest of the vars in the method go into t registers
-    for block in range(1, len(method.vars.vars)):
-        for var in method.vars.vars[block].values():
-            var.reg = absmc.Register('t')
-            print '# var {} given {}'.format(var.name, var.reg)
 
+    # The labels, offsets and sizes that the code of a class takes from the
+    # classes it uses. UnitGenerator leaves them to the linker.
 
-def generate_class_code(cls):
-    global current_method
-
-    for method in cls.methods:
-        setup_registers(method)
-        current_method = method
-        method.returned = False
-        absmc.MethodLabel(method.name, method.id)
-        gen_code(method.body)
-        if not method.returned:
-            absmc.ProcedureInstr('ret')
-    for constr in cls.constructors:
-        setup_registers(constr)
-        current_method = constr
-        constr.returned = False
-        absmc.ConstructorLabel(constr.id)
-        gen_code(constr.body)
-        if not constr.returned:
-            absmc.ProcedureInstr('ret')  # We assume constrs don't have a return
-
-
-def gen_code(stmt):
-    global current_loop_continue_label, current_enter_then_label, current_break_out_else_label
-    # stmt.end_reg is the destination register for each expression
-    stmt.end_reg = None
-    push_labels()
-
-    if isinstance(stmt, ast.BlockStmt):
-        for stmt_line in stmt.stmtlist:
-            gen_code(stmt_line)
-
-    elif isinstance(stmt, ast.ExprStmt):
-        gen_code(stmt.expr)
-
-    elif isinstance(stmt, ast.AssignExpr):
-        gen_code(stmt.rhs)
-        gen_code(stmt.lhs)
-
-        if stmt.lhs.type == ast.Type('float') and stmt.rhs.type == ast.Type('int'):
-            conv = absmc.ConvertInstr('itof', stmt.rhs.end_reg)
-            stmt.rhs.end_reg = conv.dst
-
-        if not isinstance(stmt.lhs, ast.FieldAccessExpr):
-            absmc.MoveInstr('move', stmt.lhs.end_reg, stmt.rhs.end_reg)
-        else:
-            absmc.HeapInstr('hstore', stmt.lhs.base.end_reg, stmt.lhs.offset_reg, stmt.rhs.end_reg)
+    def method_entry(self, cls, index):
+        method = cls.methods[index]
+        absmc.MethodLabel(self.machine, method.name, method.id)
 
-    elif isinstance(stmt, ast.VarExpr):
-        stmt.end_reg = stmt.var.reg
+    def constructor_entry(self, cls, index):
+        absmc.ConstructorLabel(self.machine, cls.constructors[index].id)
 
-    elif isinstance(stmt, ast.ConstantExpr):
-        reg = absmc.Register()
+    def method_label(self, cls, method):
+        return 'M_{}_{}'.format(method.name, method.id)
 
-        if stmt.kind == 'int':
-            absmc.MoveInstr('move_immed_i', reg, stmt.int, True)
-        elif stmt.kind == 'float':
-            absmc.MoveInstr('move_immed_f', reg, stmt.float, True)
-        elif stmt.kind == 'string':
-            pass
-        elif stmt.kind == 'True':
-            absmc.MoveInstr('move_immed_i', reg, 1, True)
-        elif stmt.kind == 'False':
-            absmc.MoveInstr('move_immed_i', reg, 0, True)
-        elif stmt.kind == 'Null':
-            absmc.MoveInstr('move_immed_i', reg, 'Null', True)
-
-
-        stmt.end_reg = reg
-
-    elif isinstance(stmt, ast.BinaryExpr):
-        if stmt.bop not in ['and', 'or']:
-            gen_code(stmt.arg1)
-            gen_code(stmt.arg2)
-
-            reg = absmc.Register()
-            flt = ast.Type('float')
-            intg = ast.Type('int')
-            if stmt.arg1.type == flt or stmt.arg2.type == flt:
-                expr_type = 'f'
-            else:
-                expr_type = 'i'
-
-            if stmt.arg1.type == intg and stmt.arg2.type == flt:
-                conv = absmc.Convert('itof', stmt.arg1.end_reg)
-                stmt.arg1.end_reg = conv.dst
-            elif stmt.arg1.type == flt and stmt.arg2.type == intg:
-                conv = absmc.Convert('itof', stmt.arg2.end_reg)
-                stmt.arg2.end_reg = conv.dst
-
-            if stmt.bop in ['add', 'sub', 'mul', 'div', 'gt', 'geq', 'lt', 'leq']:
-                absmc.ArithInstr(stmt.bop, reg, stmt.arg1.end_reg, stmt.arg2.end_reg, expr_type)
-
-            elif stmt.bop == 'eq' or stmt.bop == 'neq':
-                absmc.ArithInstr('sub', reg, stmt.arg1.end_reg, stmt.arg2.end_reg, expr_type)
-
-            if stmt.bop == 'eq':
-
-                # check if r2 == r3
-                # 1. perform sub r1, r2, r3 (done above)
-                # 2. branch to set_one if r1 is zero
-                # 3. else, fall through and set r1 to zero
-                # 4. jump out so we don't set r1 to one by accident
-
-                ieq_set = absmc.BranchLabel(stmt.lines, 'SET_EQ')
-                ieq_out = absmc.BranchLabel(stmt.lines, 'SET_EQ_OUT')
-
-                absmc.BranchInstr('bz', ieq_set, reg)
-                absmc.MoveInstr('move_immed_i', reg, 0, True)
-                absmc.BranchInstr('jmp', ieq_out)
-
-                ieq_set.add_to_code()
-                absmc.MoveInstr('move_immed_i', reg, 1, True)
-
-                ieq_out.add_to_code()
-
-        if stmt.bop == 'and':
-            and_skip = absmc.BranchLabel(stmt.lines, 'AND_SKIP')
-            gen_code(stmt.arg1)
-            reg = absmc.Register()
-            absmc.MoveInstr('move', reg, stmt.arg1.end_reg)
-            absmc.BranchInstr('bz', and_skip, stmt.arg1.end_reg)
-            gen_code(stmt.arg2)
-            absmc.MoveInstr('move', reg, stmt.arg2.end_reg)
-            and_skip.add_to_code()
-
-        if stmt.bop == 'or':
-            or_skip = absmc.BranchLabel(stmt.lines, 'OR_SKIP')
-            gen_code(stmt.arg1)
-            reg = absmc.Register()
-            absmc.MoveInstr('move', reg, stmt.arg1.end_reg)
-            absmc.BranchInstr('bnz', or_skip, stmt.arg1.end_reg)
-            gen_code(stmt.arg2)
-            absmc.MoveInstr('move', reg, stmt.arg2.end_reg)
-            or_skip.add_to_code()
-
-        stmt.end_reg = reg
-
-    elif isinstance(stmt, ast.ForStmt):
-
-        # for-loop:
-        # for (i = 0; i < 10; i++) {
-        #   body
-        # }
+    def constructor_label(self, cls, constr_id):
+        return 'C_{}'.format(constr_id)
 
-        # set i's reg equal to 0
-        # create a label after this, as this is where we jump back to at end of loop
-        # also create the 'out' label which is what we jump to when breaking out of loop
-        # generate code for the 'cond' (test if i's reg is less than 10's reg)
-        # test if the cond evaluated to false with 'bz', if so, break out of loop
-        # else, fall through into the body of the for-loop
-        # when body is over, generate code to update the var (i++)
-        # jump unconditionally back to the cond_label, where we eval if i is still < 10
-        gen_code(stmt.init)
+    def field_offset(self, cls, field):
+        return field.offset
 
-        cond_label = absmc.BranchLabel(stmt.lines, 'FOR_COND')
-        current_enter_then_label = entry_label = absmc.BranchLabel(stmt.lines, 'FOR_ENTRY')
-        current_loop_continue_label = continue_label = absmc.BranchLabel(stmt.lines, 'FOR_UPDATE')
-        current_break_out_else_label = out_label = absmc.BranchLabel(stmt.lines, 'FOR_OUT')
+    def class_size(self, cls):
+        return cls.size
 
-        cond_label.add_to_code()
 
-        gen_code(stmt.cond)
-        absmc.BranchInstr('bz', out_label, stmt.cond.end_reg)
+    def generate_class_code(self, cls):
+        for index, method in enumerate(cls.methods):
+            self.setup_registers(method)
+            self.current_method = method
+            method.returned = False
+            self.method_entry(cls, index)
+            self.gen_code(method.body)
+            if not method.returned:
+                absmc.ProcedureInstr(self.machine, 'ret')
+        for index, constr in enumerate(cls.constructors):
+            self.setup_registers(constr)
+            self.current_method = constr
+            constr.returned = False
+            self.constructor_entry(cls, index)
+            self.gen_code(constr.body)
+            if not constr.returned:
+                absmc.ProcedureInstr(self.machine, 'ret')  # We assume constrs don't have a return
 
-        entry_label.add_to_code()
-        gen_code(stmt.body)
 
-        continue_label.add_to_code()
-        gen_code(stmt.update)
+    def gen_code(self, stmt):
+        # stmt.end_reg is the destination register for each expression
+        stmt.end_reg = None
+        self.push_labels()
 
-        absmc.BranchInstr('jmp', cond_label)
+        if isinstance(stmt, ast.BlockStmt):
+            for stmt_line in stmt.stmtlist:
+                self.gen_code(stmt_line)
 
-        out_label.add_to_code()
+        elif isinstance(stmt, ast.ExprStmt):
+            self.gen_code(stmt.expr)
 
-    elif isinstance(stmt, ast.AutoExpr):
-        gen_code(stmt.arg)
+        elif isinstance(stmt, ast.AssignExpr):
+            self.gen_code(stmt.rhs)
+            self.gen_code(stmt.lhs)
 
-        if stmt.when == 'post':
-            tmp_reg = absmc.Register()
-            absmc.MoveInstr('move', tmp_reg, stmt.arg.end_reg)
+            if stmt.lhs.type == ast.Type('float') and stmt.rhs.type == ast.Type('int'):
+                conv = absmc.ConvertInstr(self.machine, 'itof', stmt.rhs.end_reg)
+                stmt.rhs.end_reg = conv.dst
 
-        one_reg = absmc.Register()
+            if not isinstance(stmt.lhs, ast.FieldAccessExpr):
+                absmc.MoveInstr(self.machine, 'move', stmt.lhs.end_reg, stmt.rhs.end_reg)
+            else:
+                absmc.HeapInstr(self.machine, 'hstore', stmt.lhs.base.end_reg, stmt.lhs.offset_reg, stmt.rhs.end_reg)
+
+        elif isinstance(stmt, ast.VarExpr):
+            stmt.end_reg = stmt.var.reg
+
+        elif isinstance(stmt, ast.ConstantExpr):
+            reg = self.machine.new_register()
+
+            if stmt.kind == 'int':
+                absmc.MoveInstr(self.machine, 'move_immed_i', reg, stmt.int, True)
+            elif stmt.kind == 'float':
+                absmc.MoveInstr(self.machine, 'move_immed_f', reg, stmt.float, True)
+            elif stmt.kind == 'string':
+                pass
+            elif stmt.kind == 'True':
+                absmc.MoveInstr(self.machine, 'move_immed_i', reg, 1, True)
+            elif stmt.kind == 'False':
+                absmc.MoveInstr(self.machine, 'move_immed_i', reg, 0, True)
+            elif stmt.kind == 'Null':
+                absmc.MoveInstr(self.machine, 'move_immed_i', reg, 'Null', True)
+
+
+            stmt.end_reg = reg
+
+        elif isinstance(stmt, ast.BinaryExpr):
+            if stmt.bop not in ['and', 'or']:
+                self.gen_code(stmt.arg1)
+                self.gen_code(stmt.arg2)
+
+                reg = self.machine.new_register()
+                flt = ast.Type('float')
+                intg = ast.Type('int')
+                if stmt.arg1.type == flt or stmt.arg2.type == flt:
+                    expr_type = 'f'
+                else:
+                    expr_type = 'i'
+
+                if stmt.arg1.type == intg and stmt.arg2.type == flt:
+                    conv = absmc.ConvertInstr(self.machine, 'itof', stmt.arg1.end_reg)
+                    stmt.arg1.end_reg = conv.dst
+                elif stmt.arg1.type == flt and stmt.arg2.type == intg:
+                    conv = absmc.ConvertInstr(self.machine, 'itof', stmt.arg2.end_reg)
+                    stmt.arg2.end_reg = conv.dst
+
+                if stmt.bop in ['add', 'sub', 'mul', 'div', 'gt', 'geq', 'lt', 'leq']:
+                    absmc.ArithInstr(self.machine, stmt.bop, reg, stmt.arg1.end_reg, stmt.arg2.end_reg, expr_type)
+
+                elif stmt.bop == 'eq' or stmt.bop == 'neq':
+                    absmc.ArithInstr(self.machine, 'sub', reg, stmt.arg1.end_reg, stmt.arg2.end_reg, expr_type)
+
+                if stmt.bop == 'eq':
+
+                    # check if r2 == r3
+                    # 1. perform sub r1, r2, r3 (done above)
+                    # 2. branch to set_one if r1 is zero
+                    # 3. else, fall through and set r1 to zero
+                    # 4. jump out so we don't set r1 to one by accident
+
+                    ieq_set = absmc.BranchLabel(self.machine, stmt.lines, 'SET_EQ')
+                    ieq_out = absmc.BranchLabel(self.machine, stmt.lines, 'SET_EQ_OUT')
+
+                    absmc.BranchInstr(self.machine, 'bz', ieq_set, reg)
+                    absmc.MoveInstr(self.machine, 'move_immed_i', reg, 0, True)
+                    absmc.BranchInstr(self.machine, 'jmp', ieq_out)
+
+                    ieq_set.add_to_code()
+                    absmc.MoveInstr(self.machine, 'move_immed_i', reg, 1, True)
+
+                    ieq_out.add_to_code()
+
+            if stmt.bop == 'and':
+                and_skip = absmc.BranchLabel(self.machine, stmt.lines, 'AND_SKIP')
+                self.gen_code(stmt.arg1)
+                reg = self.machine.new_register()
+                absmc.MoveInstr(self.machine, 'move', reg, stmt.arg1.end_reg)
+                absmc.BranchInstr(self.machine, 'bz', and_skip, stmt.arg1.end_reg)
+                self.gen_code(stmt.arg2)
+                absmc.MoveInstr(self.machine, 'move', reg, stmt.arg2.end_reg)
+                and_skip.add_to_code()
+
+            if stmt.bop == 'or':
+                or_skip = absmc.BranchLabel(self.machine, stmt.lines, 'OR_SKIP')
+                self.gen_code(stmt.arg1)
+                reg = self.machine.new_register()
+                absmc.MoveInstr(self.machine, 'move', reg, stmt.arg1.end_reg)
+                absmc.BranchInstr(self.machine, 'bnz', or_skip, stmt.arg1.end_reg)
+                self.gen_code(stmt.arg2)
+                absmc.MoveInstr(self.machine, 'move', reg, stmt.arg2.end_reg)
+                or_skip.add_to_code()
+
+            stmt.end_reg = reg
+
+        elif isinstance(stmt, ast.ForStmt):
+
+            # for-loop:
+            # for (i = 0; i < 10; i++) {
+            #   body
+            # }
+
+            # set i's reg equal to 0
+            # create a label after this, as this is where we jump back to at end of loop
+            # also create the 'out' label which is what we jump to when breaking out of loop
+            # generate code for the 'cond' (test if i's reg is less than 10's reg)
+            # test if the cond evaluated to false with 'bz', if so, break out of loop
+            # else, fall through into the body of the for-loop
+            # when body is over, generate code to update the var (i++)
+            # jump unconditionally back to the cond_label, where we eval if i is still < 10
+            self.gen_code(stmt.init)
+
+            cond_label = absmc.BranchLabel(self.machine, stmt.lines, 'FOR_COND')
+            self.current_enter_then_label = entry_label = absmc.BranchLabel(self.machine, stmt.lines, 'FOR_ENTRY')
+            self.current_loop_continue_label = continue_label = absmc.BranchLabel(self.machine, stmt.lines, 'FOR_UPDATE')
+            self.current_break_out_else_label = out_label = absmc.BranchLabel(self.machine, stmt.lines, 'FOR_OUT')
+
+            cond_label.add_to_code()
+
+            self.gen_code(stmt.cond)
+            absmc.BranchInstr(self.machine, 'bz', out_label, stmt.cond.end_reg)
+
+            entry_label.add_to_code()
+            self.gen_code(stmt.body)
+
+            continue_label.add_to_code()
+            self.gen_code(stmt.update)
+
+            absmc.BranchInstr(self.machine, 'jmp', cond_label)
 
-        # Load 1 into a register
-        absmc.MoveInstr('move_immed_i', one_reg, 1, True)
+            out_label.add_to_code()
 
-        absmc.ArithInstr('add' if stmt.oper == 'inc' else 'sub', stmt.arg.end_reg, stmt.arg.end_reg, one_reg)
+        elif isinstance(stmt, ast.AutoExpr):
+            self.gen_code(stmt.arg)
 
-        if stmt.when == 'post':
-            stmt.end_reg = tmp_reg
-        else:
-            stmt.end_reg = stmt.arg.end_reg
+            if stmt.when == 'post':
+                tmp_reg = self.machine.new_register()
+                absmc.MoveInstr(self.machine, 'move', tmp_reg, stmt.arg.end_reg)
 
-    elif isinstance(stmt, ast.SkipStmt):
-        pass
+            one_reg = self.machine.new_register()
 
-    elif isinstance(stmt, ast.ReturnStmt):
-        current_method.returned = True
-        if stmt.expr is None:
-            absmc.ProcedureInstr('ret')
-            return
-        gen_code(stmt.expr)
+            # Load 1 into a register
+            absmc.MoveInstr(self.machine, 'move_immed_i', one_reg, 1, True)
 
-        # Load the result into a0
-        absmc.MoveInstr('move', absmc.Register('a', 0), stmt.expr.end_reg)
+            absmc.ArithInstr(self.machine, 'add' if stmt.oper == 'inc' else 'sub', stmt.arg.end_reg, stmt.arg.end_reg, one_reg)
 
-        # Return to caller
-        absmc.ProcedureInstr('ret')
+            if stmt.when == 'post':
+                stmt.end_reg = tmp_reg
+            else:
+                stmt.end_reg = stmt.arg.end_reg
 
-    elif isinstance(stmt, ast.WhileStmt):
+        elif isinstance(stmt, ast.SkipStmt):
+            pass
 
-        current_loop_continue_label = cond_label = absmc.BranchLabel(stmt.lines, 'WHILE_COND')
-        current_enter_then_label = entry_label = absmc.BranchLabel(stmt.lines, 'WHILE_ENTRY')
-        current_break_out_else_label = out_label = absmc.BranchLabel(stmt.lines, 'WHILE_OUT')
+        elif isinstance(stmt, ast.ReturnStmt):
+            self.current_method.returned = True
+            if stmt.expr is None:
+                absmc.ProcedureInstr(self.machine, 'ret')
+                return
+            self.gen_code(stmt.expr)
 
-        cond_label.add_to_code()
+            # Load the result into a0
+            absmc.MoveInstr(self.machine, 'move', absmc.Register('a', 0), stmt.expr.end_reg)
 
-        gen_code(stmt.cond)
+            # Return to caller
+            absmc.ProcedureInstr(self.machine, 'ret')
 
-        absmc.BranchInstr('bz', out_label, stmt.cond.end_reg)
+        elif isinstance(stmt, ast.WhileStmt):
 
-        entry_label.add_to_code()
+            self.current_loop_continue_label = cond_label = absmc.BranchLabel(self.machine, stmt.lines, 'WHILE_COND')
+            self.current_enter_then_label = entry_label = absmc.BranchLabel(self.machine, stmt.lines, 'WHILE_ENTRY')
+            self.current_break_out_else_label = out_label = absmc.BranchLabel(self.machine, stmt.lines, 'WHILE_OUT')
 
-        gen_code(stmt.body)
+            cond_label.add_to_code()
 
-        absmc.BranchInstr('jmp', cond_label)
+            self.gen_code(stmt.cond)
 
-        out_label.add_to_code()
+            absmc.BranchInstr(self.machine, 'bz', out_label, stmt.cond.end_reg)
 
-    elif isinstance(stmt, ast.BreakStmt):
-        absmc.BranchInstr('jmp', current_break_out_else_label)
+            entry_label.add_to_code()
 
-    elif isinstance(stmt, ast.ContinueStmt):
-        absmc.BranchInstr('jmp', current_loop_continue_label)
+            self.gen_code(stmt.body)
 
-    elif isinstance(stmt, ast.IfStmt):
+            absmc.BranchInstr(self.machine, 'jmp', cond_label)
 
-        # if (x == y)
-        #   ++x;
-        # else
-        #   --x;
+            out_label.add_to_code()
 
-        # generate 2 labels, for the else part, and the out part
-        # test if x == y
-        # if not true, jump to the else part
-        # if true, we're falling through to the then part, then must jump
-        # out right before hitting the else part straight to the out part
+        elif isinstance(stmt, ast.BreakStmt):
+            absmc.BranchInstr(self.machine, 'jmp', self.current_break_out_else_label)
 
-        current_enter_then_label = then_part = absmc.BranchLabel(stmt.lines, 'THEN_PART')
-        current_break_out_else_label = else_part = absmc.BranchLabel(stmt.lines, 'ELSE_PART')
-        out_label = absmc.BranchLabel(stmt.lines, 'IF_STMT_OUT')
+        elif isinstance(stmt, ast.ContinueStmt):
+            absmc.BranchInstr(self.machine, 'jmp', self.current_loop_continue_label)
 
-        gen_code(stmt.condition)
+        elif isinstance(stmt, ast.IfStmt):
 
-        absmc.BranchInstr('bz', else_part, stmt.condition.end_reg)
+            # if (x == y)
+            #   ++x;
+            # else
+            #   --x;
 
-        then_part.add_to_code()
-        gen_code(stmt.thenpart)
+            # generate 2 labels, for the else part, and the out part
+            # test if x == y
+            # if not true, jump to the else part
+            # if true, we're falling through to the then part, then must jump
+            # out right before hitting the else part straight to the out part
 
-        absmc.BranchInstr('jmp', out_label)
+            self.current_enter_then_label = then_part = absmc.BranchLabel(self.machine, stmt.lines, 'THEN_PART')
+            self.current_break_out_else_label = else_part = absmc.BranchLabel(self.machine, stmt.lines, 'ELSE_PART')
+            out_label = absmc.BranchLabel(self.machine, stmt.lines, 'IF_STMT_OUT')
 
-        else_part.add_to_code()
+            self.gen_code(stmt.condition)
 
-        gen_code(stmt.elsepart)
+            absmc.BranchInstr(self.machine, 'bz', else_part, stmt.condition.end_reg)
 
-        out_label.add_to_code()
+            then_part.add_to_code()
+            self.gen_code(stmt.thenpart)
 
-    elif isinstance(stmt, ast.FieldAccessExpr):
-        gen_code(stmt.base)
+            absmc.BranchInstr(self.machine, 'jmp', out_label)
 
-        cls = ast.lookup(ast.classtable, stmt.base.type.typename)
-        field = ast.lookup(cls.fields, stmt.fname)
+            else_part.add_to_code()
 
-        offset_reg = absmc.Register()
-        ret_reg = absmc.Register()
+            self.gen_code(stmt.elsepart)
 
-        absmc.MoveInstr('move_immed_i', offset_reg, field.offset, True)
-        absmc.HeapInstr('hload', ret_reg, stmt.base.end_reg, offset_reg)
+            out_label.add_to_code()
 
-        stmt.offset_reg = offset_reg
-        stmt.end_reg = ret_reg
+        elif isinstance(stmt, ast.FieldAccessExpr):
+            self.gen_code(stmt.base)
 
-    elif isinstance(stmt, ast.ClassReferenceExpr):
-        stmt.end_reg = absmc.Register('sap')
+            cls = ast.lookup(self.classtable, stmt.base.type.typename)
+            field = ast.lookup(cls.fields, stmt.fname)
 
-    elif isinstance(stmt, ast.NewObjectExpr):
-        recd_addr_reg = absmc.Register()
-        size_reg = absmc.Register()
-        absmc.MoveInstr('move_immed_i', size_reg, stmt.classref.size, True)
-        absmc.HeapInstr('halloc', recd_addr_reg, size_reg)
+            offset_reg = self.machine.new_register()
+            ret_reg = self.machine.new_register()
 
-        if stmt.constr_id is None:
-            stmt.end_reg = recd_addr_reg
-            return
+            absmc.MoveInstr(self.machine, 'move_immed_i', offset_reg, self.field_offset(cls, field), True)
+            absmc.HeapInstr(self.machine, 'hload', ret_reg, stmt.base.end_reg, offset_reg)
+
+            stmt.offset_reg = offset_reg
+            stmt.end_reg = ret_reg
+
+        elif isinstance(stmt, ast.ClassReferenceExpr):
+            stmt.end_reg = absmc.Register('sap')
 
-        saved_regs = []
+        elif isinstance(stmt, ast.NewObjectExpr):
+            recd_addr_reg = self.machine.new_register()
+            size_reg = self.machine.new_register()
+            absmc.MoveInstr(self.machine, 'move_immed_i', size_reg, self.class_size(stmt.classref), True)
+            absmc.HeapInstr(self.machine, 'halloc', recd_addr_reg, size_reg)
 
-        saved_regs.append(recd_addr_reg)
+            if stmt.constr_id is None:
+                stmt.end_reg = recd_addr_reg
+                return
 
-        # add a0 if the current method is not static
-        if current_method.storage != 'static':
-            saved_regs.append(absmc.Register('a', 0))
+            saved_regs = []
 
-        # for each var in each block of the current method, add to save list
-        for block in range(0, len(current_method.vars.vars)):
-            for var in current_method.vars.vars[block].values():
-                saved_regs.append(var.reg)
+            saved_regs.append(recd_addr_reg)
 
-        # save each reg in the saved list
-        for reg in saved_regs:
-            absmc.ProcedureInstr('save', reg)
+            # add a0 if the current method is not static
+            if self.current_method.storage != 'static':
+                saved_regs.append(absmc.Register('a', 0))
 
-        absmc.MoveInstr('move', absmc.Register('a', 0), recd_addr_reg)
+            # for each var in each block of the current method, add to save list
+            for block in range(0, len(self.current_method.vars.vars)):
+                for var in self.current_method.vars.vars[block].values():
+                    saved_regs.append(var.reg)
 
-        arg_reg_index = 1
+            # save each reg in the saved list
+            for reg in saved_regs:
+                absmc.ProcedureInstr(self.machine, 'save', reg)
 
-        for arg in stmt.args:
-            gen_code(arg)
-            absmc.MoveInstr('move', absmc.Register('a', arg_reg_index), arg.end_reg)
-            arg_reg_index += 1
+            absmc.MoveInstr(self.machine, 'move', absmc.Register('a', 0), recd_addr_reg)
 
-        absmc.ProcedureInstr('call', 'C_{}'.format(stmt.constr_id))
+            arg_reg_index = 1
 
-        # restore regs from the now-reversed save list
-        for reg in reversed(saved_regs):
-            absmc.ProcedureInstr('restore', reg)
+            for arg in stmt.args:
+                self.gen_code(arg)
+                absmc.MoveInstr(self.machine, 'move', absmc.Register('a', arg_reg_index), arg.end_reg)
+                arg_reg_index += 1
 
-        stmt.end_reg = recd_addr_reg
+            absmc.ProcedureInstr(self.machine, 'call', self.constructor_label(stmt.classref, stmt.constr_id))
 
-    elif isinstance(stmt, ast.ThisExpr):
-        stmt.end_reg = absmc.Register('a', 0)
+            # restore regs from the now-reversed save list
+            for reg in reversed(saved_regs):
+                absmc.ProcedureInstr(self.machine, 'restore', reg)
 
-    elif isinstance(stmt, ast.MethodInvocationExpr):
-        gen_code(stmt.base)
+            stmt.end_reg = recd_addr_reg
+
+        elif isinstance(stmt, ast.ThisExpr):
+            stmt.end_reg = absmc.Register('a', 0)
 
-        cls = ast.lookup(ast.classtable, stmt.base.type.typename)
-        for method in cls.methods:
-            if stmt.mname == method.name:
-                break
+        elif isinstance(stmt, ast.MethodInvocationExpr):
+            self.gen_code(stmt.base)
 
-        saved_regs = []
+            cls = ast.lookup(self.classtable, stmt.base.type.typename)
+            for method in cls.methods:
+                if stmt.mname == method.name:
+                    break
 
-        arg_reg_index = 0
+            saved_regs = []
 
-        # first arg goes into a1 if desired method is not static
-        if method.storage != 'static':
-            arg_reg_index += 1
+            arg_reg_index = 0
 
-        # add a0 if the current method is not static
-        if current_method.storage != 'static':
-            saved_regs.append(absmc.Register('a', 0))
+            # first arg goes into a1 if desired method is not static
+            if method.storage != 'static':
+                arg_reg_index += 1
 
-        # for each var in each block of the current method, add to save list
-        for block in range(0, len(current_method.vars.vars)):
-            for var in current_method.vars.vars[block].values():
-                saved_regs.append(var.reg)
+            # add a0 if the current method is not static
+            if self.current_method.storage != 'static':
+                saved_regs.append(absmc.Register('a', 0))
 
-        # save each reg in the saved list
-        for reg in saved_regs:
-            absmc.ProcedureInstr('save', reg)
+            # for each var in each block of the current method, add to save list
+            for block in range(0, len(self.current_method.vars.vars)):
+                for var in self.current_method.vars.vars[block].values():
+                    saved_regs.append(var.reg)
 
-        if method.storage != 'static':
-            absmc.MoveInstr('move', absmc.Register('a', 0), stmt.base.end_reg)
+            # save each reg in the saved list
+            for reg in saved_regs:
+                absmc.ProcedureInstr(self.machine, 'save', reg)
 
-        for arg in stmt.args:
-            gen_code(arg)
-            absmc.MoveInstr('move', absmc.Register('a', arg_reg_index), arg.end_reg)
-            arg_reg_index += 1
+            if method.storage != 'static':
+                absmc.MoveInstr(self.machine, 'move', absmc.Register('a', 0), stmt.base.end_reg)
 
-        absmc.ProcedureInstr('call', 'M_{}_{}'.format(method.name, method.id))
+            for arg in stmt.args:
+                self.gen_code(arg)
+                absmc.MoveInstr(self.machine, 'move', absmc.Register('a', arg_reg_index), arg.end_reg)
+                arg_reg_index += 1
 
-        # Store the result in a temporary register
-        stmt.end_reg = absmc.Register()
-        absmc.MoveInstr('move', stmt.end_reg, absmc.Register('a', 0))
+            absmc.ProcedureInstr(self.machine, 'call', self.method_label(cls, method))
 
-        # restore regs from the reversed save list
-        for reg in reversed(saved_regs):
-            absmc.ProcedureInstr('restore', reg)
+            # Store the result in a temporary register
+            stmt.end_reg = self.machine.new_register()
+            absmc.MoveInstr(self.machine, 'move', stmt.end_reg, absmc.Register('a', 0))
 
-    elif isinstance(stmt, ast.UnaryExpr):
-        gen_code(stmt.arg)
+            # restore regs from the reversed save list
+            for reg in reversed(saved_regs):
+                absmc.ProcedureInstr(self.machine, 'restore', reg)
 
-        ret = absmc.Register()
-        if stmt.uop == 'uminus':
-            zero_reg = absmc.Register()
-            if stmt.arg.type == ast.Type('float'):
-                prefix = 'f'
+        elif isinstance(stmt, ast.UnaryExpr):
+            self.gen_code(stmt.arg)
+
+            ret = self.machine.new_register()
+            if stmt.uop == 'uminus':
+                zero_reg = self.machine.new_register()
+                if stmt.arg.type == ast.Type('float'):
+                    prefix = 'f'
+                else:
+                    prefix = 'i'
+                # if uminus, put 0 - <reg> into the return reg
+                absmc.MoveInstr(self.machine, 'move_immed_{}'.format(prefix), zero_reg, 0, True)
+                absmc.ArithInstr(self.machine, 'sub', ret, zero_reg, stmt.arg.end_reg, prefix)
             else:
-                prefix = 'i'
-            # if uminus, put 0 - <reg> into the return reg
-            absmc.MoveInstr('move_immed_{}'.format(prefix), zero_reg, 0, True)
-            absmc.ArithInstr('sub', ret, zero_reg, stmt.arg.end_reg, prefix)
-        else:
-            # if it's a 0, branch to set 1
-            # if it's a 1, we're falling through, setting to 0, and jumping out
-            set_one_label = absmc.BranchLabel(stmt.lines, 'SET_ONE')
-            out_label = absmc.BranchLabel(stmt.lines, 'UNARY_OUT')
+                # if it's a 0, branch to set 1
+                # if it's a 1, we're falling through, setting to 0, and jumping out
+                set_one_label = absmc.BranchLabel(self.machine, stmt.lines, 'SET_ONE')
+                out_label = absmc.BranchLabel(self.machine, stmt.lines, 'UNARY_OUT')
 
-            absmc.BranchInstr('bz', set_one_label, stmt.arg.end_reg)
-            absmc.MoveInstr('move_immed_i', ret, 0, True)
-            absmc.BranchInstr('jmp', out_label)
+                absmc.BranchInstr(self.machine, 'bz', set_one_label, stmt.arg.end_reg)
+                absmc.MoveInstr(self.machine, 'move_immed_i', ret, 0, True)
+                absmc.BranchInstr(self.machine, 'jmp', out_label)
 
-            set_one_label.add_to_code()
+                set_one_label.add_to_code()
 
-            absmc.MoveInstr('move_immed_i', ret, 1, True)
+                absmc.MoveInstr(self.machine, 'move_immed_i', ret, 1, True)
 
-            out_label.add_to_code()
+                out_label.add_to_code()
+
+            stmt.end_reg = ret
 
-        stmt.end_reg = ret
+        elif isinstance(stmt, ast.SuperExpr):
+            stmt.end_reg = absmc.Register('a', 0)
 
-    elif isinstance(stmt, ast.SuperExpr):
-        stmt.end_reg = absmc.Register('a', 0)
+        elif isinstance(stmt, ast.ArrayAccessExpr):
+            # Create fake register.
+            stmt.end_reg = absmc.Register('n', 0)
+            print 'Found an array access. Arrays are not supported.'
 
-    elif isinstance(stmt, ast.ArrayAccessExpr):
-        # Create fake register.
-        stmt.end_reg = absmc.Register('n', 0)
-        print 'Found an array access. Arrays are not supported.'
+        elif isinstance(stmt, ast.NewArrayExpr):
+            # Create fake register.
+            stmt.end_reg = absmc.Register('n', 0)
+            print 'Found an array creation. Arrays are not supported.'
+
+        else:
+            print 'need instance ' + str(type(stmt))
 
-    elif isinstance(stmt, ast.NewArrayExpr):
-        # Create fake register.
-        stmt.end_reg = absmc.Register('n', 0)
-        print 'Found an array creation. Arrays are not supported.'
+        self.pop_labels()
 
-    else:
-        print 'need instance ' + str(type(stmt))
 
-    pop_labels()
+class UnitGenerator(CodeGenerator):
+    '''Generates the code for one class on its own, into an ObjectUnit.
+
+    The labels of the methods and constructors, the offsets of fields and
+    the sizes of classes are left as absmc.Symbols, which the linker fills
+    in, so the unit doesn't depend on the other classes' code, nor on the
+    ids of methods, constructors and fields, only on their declarations.'''
+    def __init__(self, machine):
+        super(UnitGenerator, self).__init__(machine)
+        self.exports = []
+
+    def method_entry(self, cls, index):
+        symbol = absmc.Symbol('method', cls.name, index)
+        self.exports.append(symbol)
+        if cls.methods[index].name == 'main':
+            absmc.MethodLabel(self.machine, 'main', None)
+        else:
+            self.machine.add_label(absmc.Label(symbol))
+
+    def constructor_entry(self, cls, index):
+        symbol = absmc.Symbol('constructor', cls.name, index)
+        self.exports.append(symbol)
+        self.machine.add_label(absmc.Label(symbol))
+
+    def method_label(self, cls, method):
+        return absmc.Symbol('method', cls.name, cls.methods.index(method))
+
+    def constructor_label(self, cls, constr_id):
+        for index, constr in enumerate(cls.constructors):
+            if constr.id == constr_id:
+                return absmc.Symbol('constructor', cls.name, index)
+
+    def field_offset(self, cls, field):
+        return absmc.Symbol('offset', cls.name, field.name)
+
+    def class_size(self, cls):
+        return absmc.Symbol('size', cls.name)
+
+
+def generate_unit(cls, classtable, line=None):
+    '''Generates the code for the class cls of classtable on its own, the
+    class starting on line of its file.
+
+    Returns:
+        An absmc.ObjectUnit, with what was printed while generating it in
+        its output rather than printed.
+    '''
+    machine = absmc.ObjectMachine()
+    generator = UnitGenerator(machine)
+    generator.classtable = classtable
+    stdout = sys.stdout
+    sys.stdout = output = StringIO.StringIO()
+    try:
+        generator.generate_class_code(cls)
+    finally:
+        sys.stdout = stdout
+    return absmc.ObjectUnit(cls.name, line, machine, output.getvalue(),
+                            generator.exports)
+
+
+def generate_code(classtable, machine=None):
+    '''Generates the code for the classes in classtable.
+
+    The code is added to machine, or to a new AbstractMachine if none is
+    given, which is returned.'''
+    if machine is None:
+        machine = absmc.AbstractMachine()
+    CodeGenerator(machine).generate(classtable)
+    return machine
@@ -0,0 +1,169 @@
+'''A content-addressed cache of what decafc prints for programs.
+
+An entry is found by a hash of everything decafc's output depends on: the
+program's source, the options choosing the lexer and the parser, the
+compiler's own source (all the modules next to this one), and the versions
+of PLY and Python. The names of the files are part of it only for a program
+of several files, whose errors are printed after their file's name. An
+entry holds whether the program compiled and what decafc printed for it,
+which is the generated code or the errors, so a program found in the cache
+needs no compiling at all, nor even importing the compiler. The cache also
+keeps the code of each class of the programs compiled through it (see
+linker.py), so that only the classes that changed are compiled again.
+
+The cache is a directory with a file for each entry, named by its hash,
+which is a line that is "ok" or "failed" followed by the output, as the
+compile server replies. Reading an entry updates its modification time,
+and whenever the entries take up more than the cache's size, the ones used
+least recently are removed until they fit. Entries are written to a
+temporary file which is then renamed, so several compilers can share a
+cache.
+'''
+import os
+import sys
+import glob
+import errno
+import hashlib
+import tempfile
+
+# The cache's size, in bytes, when none is given
+DEFAULT_SIZE = 100 * 1024 * 1024
+
+# Modules next to this one that don't decide the output: the table modules
+# written by buildtables.py, which are built from the other modules
+_GENERATED = ('decaflextab.py', 'decafparsetab.py', 'parsetab.py')
+
+_compiler_version = None
+
+def _update(h, data):
+    # each part is prefixed with its length, so that different parts can't
+    # run together into the same bytes
+    h.update('{}:'.format(len(data)))
+    h.update(data)
+
+def digest(parts):
+    '''Returns a hash of the strings in parts.'''
+    h = hashlib.sha1()
+    for part in parts:
+        _update(h, part)
+    return h.hexdigest()
+
+def compiler_version():
+    '''Returns a hash of the compiler's source and of the versions of PLY
+    and Python.'''
+    global _compiler_version
+    if _compiler_version is None:
+        import ply
+        h = hashlib.sha1()
+        _update(h, ply.__version__)
+        _update(h, sys.version)
+        here = os.path.dirname(os.path.abspath(__file__))
+        for path in sorted(glob.glob(os.path.join(here, '*.py'))):
+            name = os.path.basename(path)
+            if name not in _GENERATED:
+                with open(path, 'rb') as f:
+                    _update(h, name)
+                    _update(h, f.read())
+        _compiler_version = h.hexdigest()
+    return _compiler_version
+
+def program_key(filenames, options):
+    '''Returns the key of the program in filenames, compiled with the given
+    options (strings), or None if one of the files can't be read.'''
+    h = hashlib.sha1()
+    _update(h, compiler_version())
+    for option in options:
+        _update(h, option)
+    for filename in filenames:
+        try:
+            with open(filename, 'rb') as f:
+                source = f.read()
+        except IOError:
+            return None
+        if len(filenames) > 1:
+            _update(h, filename)
+        _update(h, source)
+    return h.hexdigest()
+
+
+class CompileCache(object):
+    '''A cache in a directory, which is made if it doesn't exist, of at most
+    size bytes of entries.'''
+    def __init__(self, directory, size=DEFAULT_SIZE):
+        self.directory = directory
+        self.size = size
+        try:
+            os.makedirs(directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST or not os.path.isdir(directory):
+                raise
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        '''Returns the entry for key, as (succeeded, output), or None if there
+        is none.'''
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except IOError:
+            return None
+        status, newline, output = data.partition('\n')
+        if status not in ('ok', 'failed') or not newline:
+            return None
+        try:
+            os.utime(path, None)
+        except OSError:
+            # removed since it was read, which doesn't matter
+            pass
+        return status == 'ok', output
+
+    def put(self, key, succeeded, output):
+        '''Adds the entry for key, then removes the least recently used
+        entries if the cache is over its size.'''
+        self.write(key, succeeded, output)
+        self.evict()
+
+    def write(self, key, succeeded, output):
+        '''Adds the entry for key, without removing any, for adding several
+        before calling evict.'''
+        fd, temporary = tempfile.mkstemp(prefix='.tmp-', dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write('{}\n{}'.format('ok' if succeeded else 'failed', output))
+            os.rename(temporary, self.path(key))
+        except:
+            os.remove(temporary)
+            raise
+
+    def entries(self):
+        '''Returns (modification time, size, path) for each entry.'''
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.startswith('.'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def evict(self):
+        entries = self.entries()
+        total = sum(size for mtime, size, path in entries)
+        if total <= self.size:
+            return
+        entries.sort()
+        for mtime, size, path in entries:
+            try:
+                os.remove(path)
+            except OSError:
+                # another compiler removed it first
+                pass
+            total -= size
+            if total <= self.size:
+                break
@@ -0,0 +1,175 @@
+'''A compile server, which keeps the Decaf compiler loaded between compilations.
+Usage: python compileserver.py [options] <socket> <filename>
+has the server listening on the Unix socket <socket> compile the Decaf program
+in <filename>, and prints its output. The server is started with
+python decafc.py --serve <socket>.
+
+Starting decafc.py for each file means starting Python, importing PLY and
+building the parser's tables every time; for a short program that is most of
+the time it takes. The server pays for that once, and then compiles the
+programs it is sent over a Unix socket.
+
+The protocol is one compilation per connection. The client sends the source
+of a program and shuts down its side of the connection. The server replies
+with a line that is "ok" or "failed", followed by exactly what decafc prints
+for the program (the generated code, or the errors), and closes the
+connection.
+
+Requests are handled one at a time, since the parser and type checker keep
+their state in module globals.
+
+The client only needs this module, and not the compiler, so it starts quickly.
+
+Options:
+  -h, --help    show this message
+'''
+import os
+import sys
+import getopt
+import signal
+import socket
+import traceback
+import SocketServer
+
+class Usage(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+
+class ServerError(Exception):
+    '''The server can't be started, or sent a reply that isn't understood.'''
+
+
+class CompileHandler(SocketServer.StreamRequestHandler):
+    def handle(self):
+        source = self.rfile.read()
+        try:
+            succeeded, output = self.server.compile(source)
+        except Exception:
+            # A bug in the compiler shouldn't take the server down with it
+            succeeded = False
+            output = 'Internal compiler error:\n' + traceback.format_exc()
+        try:
+            self.wfile.write('{}\n{}'.format('ok' if succeeded else 'failed', output))
+        except socket.error:
+            pass  # the client went away
+
+    def finish(self):
+        try:
+            SocketServer.StreamRequestHandler.finish(self)
+        except socket.error:
+            pass
+
+
+class CompileServer(SocketServer.UnixStreamServer):
+    def __init__(self, path, compile):
+        '''
+        Args:
+            path: The path of the Unix socket to listen on.
+            compile: The function compiling a program, taking its source and
+                returning (succeeded, output), like decafc.compile_source.
+        '''
+        self.compile = compile
+        remove_stale_socket(path)
+        SocketServer.UnixStreamServer.__init__(self, path, CompileHandler)
+
+    def server_close(self):
+        SocketServer.UnixStreamServer.server_close(self)
+        try:
+            os.unlink(self.server_address)
+        except OSError:
+            pass
+
+
+def remove_stale_socket(path):
+    '''Removes the socket at path if no server is listening on it.
+
+    Raises:
+        ServerError: A server is still listening on path.
+    '''
+    if not os.path.exists(path):
+        return
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except socket.error:
+        os.unlink(path)  # left behind by a server that is gone
+    else:
+        raise ServerError('A server is already listening on {}'.format(path))
+    finally:
+        sock.close()
+
+
+def serve(path, compile):
+    '''Serves compile requests on path until interrupted or terminated.'''
+    server = CompileServer(path, compile)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def request(path, source):
+    '''Has the server listening on path compile source.
+
+    Returns:
+        (succeeded, output), as returned by the server's compile function.
+
+    Raises:
+        socket.error: No server is listening on path.
+        ServerError: The server's reply is malformed.
+    '''
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        sock.sendall(source)
+        sock.shutdown(socket.SHUT_WR)
+        chunks = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    finally:
+        sock.close()
+    status, newline, output = ''.join(chunks).partition('\n')
+    if status not in ('ok', 'failed') or not newline:
+        raise ServerError('Malformed reply from the server')
+    return status == 'ok', output
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+
+    try:
+        try:
+            opts, args = getopt.getopt(argv[1:], "h", ["help"])
+        except getopt.error, msg:
+            raise Usage(msg)
+        for o,a in opts:
+            if o in ("-h", "--help"):
+                print __doc__
+                return 0
+        if len(args) != 2:
+            raise Usage("A socket and a file name argument are required")
+    except Usage, err:
+        print >>sys.stderr, err.msg
+        print >>sys.stderr, "For help use --help"
+        return 2
+
+    path, filename = args
+    try:
+        with open(filename, "rU") as f:
+            succeeded, output = request(path, f.read())
+    except (IOError, socket.error, ServerError), err:
+        print >>sys.stderr, "Error: {}".format(err)
+        return 1
+    sys.stdout.write(output)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,52 +1,273 @@
 """ Decaf compiler
 A compiler for Decaf programs
-Usage: python decafc.py <filename>
-where <filename> is the name of the file containing the Decaf program.
+Usage: python decafc.py [options] <filename>...
+where each <filename> is the name of a file containing the Decaf program,
+or some of its classes. The files of a program with several are parsed in
+parallel, and their classes can be used in any of the others.
+
+Options:
+  -r, --run     run the generated code in the simulator instead of printing
+                it; In reads from stdin and Out writes to stdout
+  -s, --stats   with --run, print the number of instructions executed, the
+                calls made and the allocations to stderr
+  -l, --lexer ENGINE
+                the lexer to use: ply (decaflexer.py, the default) or scanner
+                (decafscanner.py, which is faster)
+  -p, --parser ENGINE
+                the parser to use: lalr (decafparser.py, the default) or
+                descent (decafrdparser.py, which is faster and falls back on
+                the LALR parser for a program with errors)
+  -j, --jobs N  parse the files of a program with several in N processes
+                (default: the number of CPUs)
+  -c, --cache DIR
+                keep what is printed for each program in the compile cache in
+                DIR (see compilecache.py), and print it from there instead of
+                compiling the program again; a program that has changed is
+                compiled a class at a time, and only the classes that changed
+                are compiled again (see linker.py); not used with --run
+  --cache-size MB
+                the most the cache in DIR may hold (default: 100)
+  --serve SOCKET
+                instead of compiling a file, run a compile server on the Unix
+                socket SOCKET until interrupted; python compileserver.py
+                SOCKET <filename> then prints what decafc would for the file
+  -h, --help    show this message
 """
 import sys
 import getopt
-
-import decafparser
-import ast
-import typecheck
-import codegen
-from absmc import machine
+import StringIO
 
 class Usage(Exception):
     def __init__(self, msg):
         self.msg = msg
 
-    
+
+def load_compiler():
+    '''Imports the compiler's modules. They are only imported when there is
+    something to compile, as importing them takes longer than compiling
+    most programs, and a program found in the compile cache needs none of
+    them. The modules of the other engines (the scanner, the descent
+    parser, the parallel parser, the linker and the simulator) are only
+    imported by the options that use them.'''
+    global ast, typecheck, codegen
+    import ast
+    import typecheck
+    import codegen
+
+def engines(lexer_name, parser_name):
+    '''Returns the lexer and the parser named by the --lexer and --parser
+    options.'''
+    load_compiler()
+    lexer = None
+    if lexer_name == "scanner":
+        import decafscanner
+        lexer = decafscanner.Scanner()
+    if parser_name == "descent":
+        import decafrdparser as parser
+    else:
+        import decafparser as parser
+    return lexer, parser
+
+def compile_source(source, lexer=None, parser=None):
+    '''Compiles a Decaf program, without printing anything. The parser is
+    decafparser (the default) or decafrdparser, and the lexer is passed on
+    to its from_string.
+
+    Returns:
+        (succeeded, output): whether the program compiled, and what decafc
+        prints for it, which is the generated code or the errors.
+    '''
+    load_compiler()
+    if parser is None:
+        import decafparser as parser
+    stdout = sys.stdout
+    sys.stdout = output = StringIO.StringIO()
+    try:
+        machine = None
+        ast.initialize_ast()
+        if parser.from_string(source, lexer):
+            typecheck.check_classes(ast.classtable)
+            if not typecheck.error_flag:
+                machine = codegen.generate_code(ast.classtable)
+        if machine is None:
+            print "Failure: there were errors."
+        else:
+            print machine
+    finally:
+        sys.stdout = stdout
+    return machine is not None, output.getvalue()
+
+def check_files(infiles, lexer, parser, jobs):
+    '''Parses and type checks the program in infiles into ast.classtable,
+    printing any errors.
+
+    Returns:
+        Whether there were none.
+    '''
+    if len(infiles) == 1:
+        ast.initialize_ast()
+        parsed = parser.from_file(infiles[0], lexer)
+    else:
+        import parallelparse
+        parsed = parallelparse.parse_files(infiles, jobs, lexer, parser)
+    if parsed:
+        typecheck.check_classes(ast.classtable)
+        return not typecheck.error_flag
+    return False
+
+def compile_files(infiles, lexer, parser, jobs, cache=None):
+    '''Compiles the program in infiles, like compile_source, a class at a
+    time with the code of the classes that haven't changed taken from the
+    compile cache, if there is one. If the compiler fails, what it printed
+    before is printed.
+
+    Returns:
+        (succeeded, output)
+    '''
+    stdout = sys.stdout
+    sys.stdout = output = StringIO.StringIO()
+    try:
+        machine = None
+        if check_files(infiles, lexer, parser, jobs):
+            if cache is None:
+                machine = codegen.generate_code(ast.classtable)
+            else:
+                import linker
+                machine = linker.build(ast.classtable, infiles, cache)
+        if machine is None:
+            print "Failure: there were errors."
+        else:
+            print machine
+    except:
+        sys.stdout = stdout
+        sys.stdout.write(output.getvalue())
+        raise
+    finally:
+        sys.stdout = stdout
+    return machine is not None, output.getvalue()
+
+
 def main(argv=None):
     if argv is None:
         argv = sys.argv
-        
+
     # parse command line options
     try:
         try:
-            opts, args = getopt.getopt(argv[1:], "h", ["help"])
+            opts, args = getopt.getopt(argv[1:], "hrsl:p:j:c:",
+                                       ["help", "run", "stats", "serve=", "lexer=", "parser=",
+                                        "jobs=", "cache=", "cache-size="])
         except getopt.error, msg:
             raise Usage(msg)
+        run = False
+        stats = False
+        lexer_name = "ply"
+        parser_name = "lalr"
+        jobs = None
+        cache_dir = None
+        cache_size = None
+        serve = None
         for o,a in opts:
             if o in ("-h", "--help"):
                 print __doc__
                 return 0
-        if (len(args) != 1):
-            raise Usage("A single file name argument is required")
-        fullfilename = args[0]
-        if (fullfilename.endswith('.decaf')):
-            (filename,s,e) = fullfilename.rpartition('.')
-        else:
-            filename=fullfilename
-        infile = filename + ".decaf"
-        ast.initialize_ast()
-        if decafparser.from_file(infile):
-            typecheck.check_classes(ast.classtable)
-            if not typecheck.error_flag:
-                # AST OK. Print and exit
-                codegen.generate_code(ast.classtable)
-                print machine
-                return 0
+            elif o in ("-r", "--run"):
+                run = True
+            elif o in ("-s", "--stats"):
+                stats = True
+            elif o in ("-l", "--lexer"):
+                if a not in ("ply", "scanner"):
+                    raise Usage("The lexer must be ply or scanner")
+                lexer_name = a
+            elif o in ("-p", "--parser"):
+                if a not in ("lalr", "descent"):
+                    raise Usage("The parser must be lalr or descent")
+                parser_name = a
+            elif o in ("-j", "--jobs"):
+                try:
+                    jobs = int(a)
+                except ValueError:
+                    raise Usage("The number of jobs must be an integer")
+                if jobs < 1:
+                    raise Usage("The number of jobs must be at least 1")
+            elif o in ("-c", "--cache"):
+                cache_dir = a
+            elif o == "--cache-size":
+                try:
+                    cache_size = int(float(a) * 1024 * 1024)
+                except ValueError:
+                    raise Usage("The cache size must be a number of megabytes")
+            elif o == "--serve":
+                serve = a
+        if serve is not None:
+            if len(args) != 0 or run:
+                raise Usage("--serve takes no file name and can't be used with --run")
+            import socket
+            import compileserver
+            lexer, parser = engines(lexer_name, parser_name)
+            try:
+                compileserver.serve(serve,
+                                    lambda source: compile_source(source, lexer, parser))
+            except (compileserver.ServerError, socket.error), err:
+                print >>sys.stderr, "Error: {}".format(err)
+                return 1
+            return 0
+        if (len(args) == 0):
+            raise Usage("At least one file name argument is required")
+        infiles = []
+        for fullfilename in args:
+            if (fullfilename.endswith('.decaf')):
+                (filename,s,e) = fullfilename.rpartition('.')
+            else:
+                filename=fullfilename
+            infiles.append(filename + ".decaf")
+
+        if not run:
+            cache = None
+            key = None
+            if cache_dir is not None:
+                import compilecache
+                if cache_size is None:
+                    cache_size = compilecache.DEFAULT_SIZE
+                try:
+                    cache = compilecache.CompileCache(cache_dir, cache_size)
+                except OSError, err:
+                    print >>sys.stderr, "Error: {}".format(err)
+                    return 1
+                key = compilecache.program_key(infiles, [lexer_name, parser_name])
+            entry = cache.get(key) if key is not None else None
+            if entry is None:
+                lexer, parser = engines(lexer_name, parser_name)
+                entry = compile_files(infiles, lexer, parser, jobs, cache)
+                if key is not None:
+                    try:
+                        cache.put(key, *entry)
+                    except (IOError, OSError), err:
+                        print >>sys.stderr, "Error: the compile cache: {}".format(err)
+            succeeded, output = entry
+            sys.stdout.write(output)
+            return 0 if succeeded else None
+
+        lexer, parser = engines(lexer_name, parser_name)
+        if check_files(infiles, lexer, parser, jobs):
+            # Keep the code generator's comments out of the program's output
+            stdout = sys.stdout
+            sys.stdout = sys.stderr
+            try:
+                machine = codegen.generate_code(ast.classtable)
+            finally:
+                sys.stdout = stdout
+            import simulator
+            sim = simulator.Simulator(machine, ast.classtable)
+            try:
+                sim.run()
+            except simulator.SimulationError, err:
+                print >>sys.stderr, "Error: {}".format(err)
+                return 1
+            finally:
+                if stats:
+                    print >>sys.stderr, sim.report()
+            return 0
         print "Failure: there were errors."
     except Usage, err:
         print >>sys.stderr, err.msg
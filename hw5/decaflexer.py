@@ -1,6 +1,7 @@
 #!/usr/bin/python
 import ply.lex as lex
 import sys
+import hashlib
 
 errorflag = False
 
@@ -108,7 +109,39 @@ def t_error(t):
 
 t_ignore  = ' \t'
 
-#lexer = lex.lex()
+def rules_signature():
+    '''Returns a digest of the token rules. buildtables.py records it in
+    decaflextab.py, so that a table module made from other rules is not used.'''
+    module = sys.modules[__name__]
+    strings = []
+    functions = []
+    for name in sorted(dir(module)):
+        value = getattr(module, name)
+        if not name.startswith('t_'):
+            continue
+        if callable(value):
+            functions.append((value.func_code.co_firstlineno, name, value.__doc__))
+        else:
+            strings.append((name, value))
+    # lex tries the functions in the order they are defined
+    functions = [(name, doc) for line, name, doc in sorted(functions)]
+    return hashlib.md5(repr((tokens, strings, functions))).hexdigest()
+
+def build_lexer():
+    '''Builds the lexer, from the tables in decaflextab.py if they are up to
+    date, or else from the rules above.'''
+    module = sys.modules[__name__]
+    try:
+        import decaflextab
+        current = getattr(decaflextab, 'signature', None) == rules_signature()
+    except ImportError:
+        current = False
+    if current:
+        return lex.lex(module=module, optimize=1, lextab='decaflextab')
+    return lex.lex(module=module)
+
+# Built once; each parse uses a clone of it
+lexer = build_lexer()
 
 def g_token(lexer):
     while True :
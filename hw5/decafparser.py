@@ -1,12 +1,10 @@
 import ply.yacc as yacc
 import decaflexer
 from decaflexer import tokens
-from decaflexer import lex
 
 import ast
 
 import sys
-import logging
 precedence = (
     ('right', 'ASSIGN'),
     ('left', 'OR'),
@@ -35,7 +33,15 @@ binops = {'+':'add',
           '>=':'geq'}
 
 def init():
+    global current_type, current_context, current_modifiers
+    global current_class, current_vartable, current_variable_kind
     decaflexer.errorflag = False
+    current_type = None
+    current_context = None
+    current_modifiers = None
+    current_class = None
+    current_vartable = None
+    current_variable_kind = None
 
 current_type = None
 current_context = None
@@ -524,29 +530,40 @@ def p_error(p):
     else:
         signal_error("Unexpected token '{0}'".format(p.value), p.lineno)
 
-parser = yacc.yacc()
+# The tables are read from decafparsetab.py, written by buildtables.py. If it
+# is missing or out of date, they are built here and written to it, so that
+# only the first run after changing the grammar builds them.
+parser = yacc.yacc(tabmodule='decafparsetab', debug=False, write_tables=True)
 
 def signal_error(string, lineno):
     print "{1}: {0}".format(string, lineno)
     decaflexer.errorflag = True
     
-def from_file(filename):
+def from_file(filename, lexer=None):
     try:
         with open(filename, "rU") as f:
-            init()
-            parser.parse(f.read(), lexer=lex.lex(module=decaflexer), debug=None)
-        return not decaflexer.errorflag
+            return from_string(f.read(), lexer)
     except IOError as e:
         print "I/O error: %s: %s" % (filename, e.strerror)
 
+def from_string(source, lexer=None):
+    '''Parses source, with lexer if it is given (e.g. a decafscanner.Scanner),
+    or else with a clone of the PLY lexer.'''
+    init()
+    if lexer is None:
+        lexer = decaflexer.lexer.clone()
+    parser.parse(source, lexer=lexer, debug=None)
+    return not decaflexer.errorflag
+
 
 if __name__ == "__main__" :
+    import logging
     f = open(sys.argv[1], "r")
     logging.basicConfig(
             level=logging.CRITICAL,
     )
     log = logging.getLogger()
-    res = parser.parse(f.read(), lexer=lex.lex(module=decaflexer), debug=log)
+    res = parser.parse(f.read(), lexer=decaflexer.lexer.clone(), debug=log)
 
     if parser.errorok :
         print("Parsing succeeded")
@@ -0,0 +1,649 @@
+'''A recursive-descent parser for Decaf, usable in place of the LALR parser.
+Usage: python decafrdparser.py [options] <filename>...
+parses each file, and prints its classes like decafparser.py's ast does.
+
+The parser accepts the same programs as decafparser.py and builds the same
+ast objects, because it makes them with decafparser.py's own actions
+(p_class_decl_head, p_var_id, p_expr_binop and so on), called in the order
+the LALR parser reduces their rules. Only the rules that pass a value on
+unchanged, or collect values into a list, are left out. Expressions are
+parsed by precedence climbing (a Pratt parser), with binding powers taken
+from decafparser.precedence, so that table still decides how they group.
+
+A program with errors is parsed again by the LALR parser, from the start,
+so that the errors, and the recovery from syntax errors, are exactly the
+LALR parser's. As soon as there is a syntax error, or the lexer or an
+action signals an error, the classes this parser added are taken out of
+ast.classtable again, what it printed is thrown away, and decafparser.py
+takes over.
+
+Options:
+  -c, --compare     instead of printing the classes, check that they (and
+                    any errors) are the same as those of the LALR parser,
+                    and exit with code 1 if they are not
+  -t, --time        instead of printing the classes, time parsing the files
+                    with both parsers
+  -h, --help        show this message
+'''
+import re
+import sys
+import time
+import getopt
+import StringIO
+
+import ast
+import decaflexer
+import decafparser
+from decafparser import (
+    p_class_decl_head, p_extends_id, p_extends_empty,
+    p_method_decl, p_method_decl_header_void, p_method_decl_header_nonvoid,
+    p_constructor_decl, p_constructor_header, p_mod,
+    p_visibility_mod_pub, p_visibility_mod_priv, p_visibility_mod_empty,
+    p_storage_mod_static, p_storage_mod_empty,
+    p_type_int, p_type_bool, p_type_float, p_type_id, p_var_id,
+    p_params_begin, p_params_end, p_block, p_block_begin, p_block_end,
+    p_stmt_if_noelse, p_stmt_while, p_stmt_for, p_stmt_return,
+    p_stmt_stmt_expr, p_stmt_break, p_stmt_continue, p_stmt_var_decl,
+    p_stmt_empty, p_literal_int_const, p_literal_float_const,
+    p_literal_string_const, p_literal_null, p_literal_true, p_literal_false,
+    p_primary_this, p_primary_super, p_primary_newobj, p_args_opt_empty,
+    p_field_access_dot, p_field_access_id, p_array_access,
+    p_method_invocation, p_expr_binop, p_expr_unop_plus, p_expr_unop_minus,
+    p_expr_unop_not, p_assign_equals, p_assign_post_inc, p_assign_pre_inc,
+    p_assign_post_dec, p_assign_pre_dec, p_new_array, p_stmt_expr_empty,
+    p_expr_empty)
+
+class Usage(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+class _Fallback(Exception):
+    '''Raised when the program has an error, to leave it to the LALR parser.'''
+    pass
+
+class Production(list):
+    '''Stands in for PLY's YaccProduction when an action is called: p[n] is
+    the value of the rule's n-th symbol (p[0] the result), and p.lineno(n)
+    the line of the n-th symbol if it is a token, and 0 otherwise, as PLY
+    gives when it is not tracking positions. Being a list, p[n] doesn't call
+    any Python code.'''
+    __slots__ = ('tokens',)
+
+    def lineno(self, n):
+        if n < len(self.tokens) and self.tokens[n] is not None:
+            return self.tokens[n].lineno
+        return 0
+
+def reduce(action, values, tokens=()):
+    '''Calls action on the values of a rule's symbols (with None for p[0])
+    and the tokens among them (None for the others), and returns p[0].'''
+    p = Production(values)
+    p.tokens = tokens
+    try:
+        action(p)
+    except Exception:
+        # e.g. p_type_id with an undefined class; the LALR parser fails the same way
+        raise _Fallback()
+    if decaflexer.errorflag:
+        raise _Fallback()
+    return p[0]
+
+# Binding powers. The operators of decafparser.precedence are at levels from
+# 1 (the loosest) up, and an operator's right operand takes every operator
+# above its level, and the operators at its level too if it is right
+# associative: the ones the LALR parser shifts instead of reducing.
+LEVELS = {}
+for level, entry in enumerate(decafparser.precedence, 1):
+    for token in entry[1:]:
+        LEVELS[token] = (level, entry[0])
+
+def right_power(token):
+    level, assoc = LEVELS[token]
+    return level - 1 if assoc == 'right' else level
+
+# token type -> (level, right power, whether it is nonassociative), for the
+# operators of p_expr_binop's rules
+BINARY = {}
+for op in re.findall(r'expr (\w+) expr', p_expr_binop.__doc__):
+    BINARY[op] = (LEVELS[op][0], right_power(op), LEVELS[op][1] == 'nonassoc')
+
+# token type -> (action, right power) for the prefix operators, whose level is
+# that of their rule's %prec token if it has one
+PREFIX = {}
+for action in (p_expr_unop_plus, p_expr_unop_minus, p_expr_unop_not):
+    op, prec = re.match(r'expr : (\w+) expr(?: %prec (\w+))?$', action.__doc__.strip()).groups()
+    PREFIX[op] = (action, right_power(prec or op))
+
+# Primaries made of a single token
+ATOMS = {
+    'INT_CONST': p_literal_int_const, 'FLOAT_CONST': p_literal_float_const,
+    'STRING_CONST': p_literal_string_const, 'NULL': p_literal_null,
+    'TRUE': p_literal_true, 'FALSE': p_literal_false,
+    'THIS': p_primary_this, 'SUPER': p_primary_super,
+}
+
+TYPES = {'INT': p_type_int, 'BOOLEAN': p_type_bool, 'FLOAT': p_type_float,
+         'ID': p_type_id}
+
+PRE = {'INC': p_assign_pre_inc, 'DEC': p_assign_pre_dec}
+POST = {'INC': p_assign_post_inc, 'DEC': p_assign_post_dec}
+
+# What an expression parsed by Parser.primary is, which decides what may
+# follow it: a field access or an array access is an lhs, and only a field
+# access can be invoked. An assign or a method invocation can be a statement.
+PRIMARY, FIELD, ARRAY, CALL, ASSIGN, NEW_ARRAY = range(6)
+
+class _EndOfInput(object):
+    type = '$end'
+    value = None
+
+_END = _EndOfInput()
+
+class Parser(object):
+    '''Parses the tokens of a lexer, with one token of lookahead (tok) and a
+    second (peek) where the grammar needs it. The methods are named after
+    the nonterminals of decafparser.py they parse.'''
+    def __init__(self, lexer):
+        self.next_token = lexer.token
+        self.ahead = None
+        self.tok = self.fetch()
+
+    def fetch(self):
+        t = self.next_token()
+        return _END if t is None else t
+
+    def advance(self):
+        '''Moves to the next token, and returns the one it was at.'''
+        t = self.tok
+        if self.ahead is None:
+            # fetch, inlined as this is called for every token
+            tok = self.next_token()
+            self.tok = _END if tok is None else tok
+        else:
+            self.tok = self.ahead
+            self.ahead = None
+        return t
+
+    def peek(self):
+        '''Returns the token after the current one.'''
+        if self.ahead is None:
+            self.ahead = self.fetch()
+        return self.ahead
+
+    def expect(self, type):
+        if self.tok.type != type:
+            raise _Fallback()
+        return self.advance()
+
+    # Top-level
+
+    def pgm(self):
+        while self.tok is not _END:
+            self.class_decl()
+
+    def class_decl(self):
+        keyword = self.expect('CLASS')
+        name = self.expect('ID')
+        superclass = self.extends()
+        reduce(p_class_decl_head, [None, keyword.value, name.value, superclass],
+               [None, keyword, name])
+        self.expect('LBRACE')
+        self.class_body_decl()
+        while self.tok.type != 'RBRACE':
+            self.class_body_decl()
+        self.advance()
+
+    def extends(self):
+        if self.tok.type != 'EXTENDS':
+            return reduce(p_extends_empty, [None])
+        keyword = self.advance()
+        name = self.expect('ID')
+        return reduce(p_extends_id, [None, keyword.value, name.value], [None, keyword, name])
+
+    def class_body_decl(self):
+        self.mod()
+        tok = self.tok
+        if tok.type == 'VOID':
+            self.advance()
+            name = self.expect('ID')
+            header = reduce(p_method_decl_header_void, [None, None, tok.value, name.value])
+            self.method_rest(p_method_decl, header)
+        elif tok.type == 'ID' and self.peek().type == 'LPAREN':
+            self.advance()
+            header = reduce(p_constructor_header, [None, None, tok.value])
+            self.method_rest(p_constructor_decl, header)
+        else:
+            self.type()
+            name = self.expect('ID')
+            if self.tok.type == 'LPAREN':
+                header = reduce(p_method_decl_header_nonvoid, [None, None, None, name.value])
+                self.method_rest(p_method_decl, header)
+            else:
+                # a field_decl, whose first var's ID has been read
+                self.var_list(name)
+                self.expect('SEMICOLON')
+
+    # Field/Method/Constructor Declarations
+
+    def method_rest(self, action, header):
+        '''Parses what follows a method or constructor header, and calls
+        action for the whole declaration.'''
+        lparen = self.expect('LPAREN')
+        if self.tok.type == 'RPAREN':
+            reduce(p_params_end, [None])
+        else:
+            reduce(p_params_begin, [None])
+            self.param()
+            while self.tok.type == 'COMMA':
+                self.advance()
+                self.param()
+            reduce(p_params_end, [None])
+        rparen = self.expect('RPAREN')
+        body = self.block()
+        reduce(action, [None, header, lparen.value, None, rparen.value, body])
+
+    def param(self):
+        self.type()
+        self.var(self.expect('ID'))
+
+    def mod(self):
+        tok = self.tok
+        if tok.type == 'PUBLIC':
+            self.advance()
+            visibility = reduce(p_visibility_mod_pub, [None, tok.value], [None, tok])
+        elif tok.type == 'PRIVATE':
+            self.advance()
+            visibility = reduce(p_visibility_mod_priv, [None, tok.value], [None, tok])
+        else:
+            visibility = reduce(p_visibility_mod_empty, [None])
+        tok = self.tok
+        if tok.type == 'STATIC':
+            self.advance()
+            storage = reduce(p_storage_mod_static, [None, tok.value], [None, tok])
+        else:
+            storage = reduce(p_storage_mod_empty, [None])
+        reduce(p_mod, [None, visibility, storage])
+
+    def type(self):
+        tok = self.tok
+        action = TYPES.get(tok.type)
+        if action is None:
+            raise _Fallback()
+        self.advance()
+        return reduce(action, [None, tok.value], [None, tok])
+
+    def var_list(self, name):
+        '''Parses a var_list, whose first ID is name.'''
+        self.var(name)
+        while self.tok.type == 'COMMA':
+            self.advance()
+            self.var(self.expect('ID'))
+
+    def var(self, name):
+        dims = self.dim_star()
+        reduce(p_var_id, [None, name.value, dims], [None, name])
+
+    def dim_star(self):
+        dims = 0
+        while self.tok.type == 'LBRACKET':
+            self.advance()
+            self.expect('RBRACKET')
+            dims += 1
+        return dims
+
+    # Statements
+
+    def block(self):
+        lbrace = self.expect('LBRACE')
+        reduce(p_block_begin, [None])
+        stmts = []
+        while self.tok.type != 'RBRACE':
+            stmts.append(self.stmt())
+        reduce(p_block_end, [None])
+        rbrace = self.advance()
+        return reduce(p_block, [None, lbrace.value, None, stmts, None, rbrace.value],
+                      [None, lbrace])
+
+    def stmt(self):
+        tok = self.tok
+        t = tok.type
+        if t == 'LBRACE':
+            return self.block()
+        elif t == 'IF' or t == 'WHILE':
+            # there is no else: as in the LALR parser, an IF is reduced
+            # before an ELSE could be shifted, so an ELSE is a syntax error
+            self.advance()
+            lparen = self.expect('LPAREN')
+            cond = self.expr()
+            rparen = self.expect('RPAREN')
+            body = self.stmt()
+            action = p_stmt_if_noelse if t == 'IF' else p_stmt_while
+            return reduce(action, [None, tok.value, lparen.value, cond, rparen.value, body],
+                          [None, tok])
+        elif t == 'FOR':
+            self.advance()
+            lparen = self.expect('LPAREN')
+            init = self.stmt_expr_opt('SEMICOLON')
+            semi1 = self.expect('SEMICOLON')
+            cond = self.expr_opt()
+            semi2 = self.expect('SEMICOLON')
+            update = self.stmt_expr_opt('RPAREN')
+            rparen = self.expect('RPAREN')
+            body = self.stmt()
+            return reduce(p_stmt_for, [None, tok.value, lparen.value, init, semi1.value, cond,
+                                       semi2.value, update, rparen.value, body], [None, tok])
+        elif t == 'RETURN':
+            self.advance()
+            value = self.expr_opt()
+            semi = self.expect('SEMICOLON')
+            return reduce(p_stmt_return, [None, tok.value, value, semi.value], [None, tok])
+        elif t == 'BREAK' or t == 'CONTINUE':
+            self.advance()
+            semi = self.expect('SEMICOLON')
+            action = p_stmt_break if t == 'BREAK' else p_stmt_continue
+            return reduce(action, [None, tok.value, semi.value], [None, tok])
+        elif t == 'SEMICOLON':
+            self.advance()
+            return reduce(p_stmt_empty, [None, tok.value], [None, tok])
+        elif t in TYPES and (t != 'ID' or self.peek().type == 'ID'):
+            # a var_decl; an ID followed by another can only be its type
+            self.type()
+            self.var_list(self.expect('ID'))
+            self.expect('SEMICOLON')
+            return reduce(p_stmt_var_decl, [None, None])
+        else:
+            expr = self.stmt_expr()
+            semi = self.expect('SEMICOLON')
+            return reduce(p_stmt_stmt_expr, [None, expr, semi.value], [None, None, semi])
+
+    def stmt_expr(self):
+        kind, node = self.assign()
+        if kind != ASSIGN and kind != CALL:
+            raise _Fallback()
+        return node
+
+    def stmt_expr_opt(self, follow):
+        if self.tok.type == follow:
+            return reduce(p_stmt_expr_empty, [None])
+        return self.stmt_expr()
+
+    def expr_opt(self):
+        if self.tok.type == 'SEMICOLON':
+            return reduce(p_expr_empty, [None])
+        return self.expr()
+
+    # Expressions
+
+    def expr(self, power=0):
+        '''Parses an expression, up to the first binary operator whose level
+        is not above power.'''
+        left = self.unary()
+        nonassoc = None
+        while True:
+            op = self.tok
+            binding = BINARY.get(op.type)
+            if binding is None:
+                return left
+            level, right, is_nonassoc = binding
+            if level <= power:
+                return left
+            if level == nonassoc:
+                # e.g. a == b != c, where the LALR parser has an error action
+                raise _Fallback()
+            self.advance()
+            operand = self.expr(right)
+            left = reduce(p_expr_binop, [None, left, op.value, operand], [None, None, op])
+            nonassoc = level if is_nonassoc else None
+
+    def unary(self):
+        tok = self.tok
+        prefix = PREFIX.get(tok.type)
+        if prefix is None:
+            return self.assign()[1]
+        action, power = prefix
+        self.advance()
+        operand = self.expr(power)
+        return reduce(action, [None, tok.value, operand], [None, tok])
+
+    def assign(self):
+        '''Parses a primary, or a new array, or an assign: an lhs followed by
+        an ASSIGN, INC or DEC, or an lhs after an INC or DEC. An lhs takes the
+        ASSIGN, INC or DEC after it even inside an operand of a binary
+        operator, as the LALR parser shifts them, so the value assigned is all
+        of the expression after the ASSIGN.
+
+        Returns:
+            (kind, node)
+        '''
+        tok = self.tok
+        if tok.type in PRE:
+            self.advance()
+            kind, lhs = self.primary()
+            if kind != FIELD and kind != ARRAY:
+                raise _Fallback()
+            return ASSIGN, reduce(PRE[tok.type], [None, tok.value, lhs], [None, tok])
+        kind, node = self.primary()
+        if kind == FIELD or kind == ARRAY:
+            op = self.tok
+            if op.type == 'ASSIGN':
+                self.advance()
+                value = self.expr()
+                return ASSIGN, reduce(p_assign_equals, [None, node, op.value, value],
+                                      [None, None, op])
+            elif op.type in POST:
+                self.advance()
+                return ASSIGN, reduce(POST[op.type], [None, node, op.value], [None, None, op])
+        return kind, node
+
+    def primary(self):
+        '''Parses a primary, with the field accesses, array accesses and
+        method invocations on it, or a new array.
+
+        Returns:
+            (kind, node)
+        '''
+        tok = self.advance()
+        t = tok.type
+        if t == 'ID':
+            kind = FIELD
+            node = reduce(p_field_access_id, [None, tok.value], [None, tok])
+        elif t in ATOMS:
+            kind = PRIMARY
+            node = reduce(ATOMS[t], [None, tok.value], [None, tok])
+        elif t == 'LPAREN':
+            kind = PRIMARY
+            node = self.expr()
+            self.expect('RPAREN')
+        elif t == 'NEW':
+            name = self.tok
+            if name.type != 'ID' or self.peek().type != 'LPAREN':
+                return NEW_ARRAY, self.new_array(tok)
+            self.advance()
+            lparen = self.advance()
+            args = self.args_opt()
+            rparen = self.expect('RPAREN')
+            kind = PRIMARY
+            node = reduce(p_primary_newobj, [None, tok.value, name.value, lparen.value, args,
+                                             rparen.value], [None, tok, name])
+        else:
+            raise _Fallback()
+
+        while True:
+            op = self.tok
+            t = op.type
+            if t == 'DOT':
+                self.advance()
+                name = self.expect('ID')
+                kind = FIELD
+                node = reduce(p_field_access_dot, [None, node, op.value, name.value],
+                              [None, None, op])
+            elif t == 'LBRACKET':
+                self.advance()
+                index = self.expr()
+                rbracket = self.expect('RBRACKET')
+                kind = ARRAY
+                node = reduce(p_array_access, [None, node, op.value, index, rbracket.value],
+                              [None, None, op])
+            elif t == 'LPAREN' and kind == FIELD:
+                self.advance()
+                args = self.args_opt()
+                rparen = self.expect('RPAREN')
+                kind = CALL
+                node = reduce(p_method_invocation, [None, node, op.value, args, rparen.value],
+                              [None, None, op])
+            else:
+                return kind, node
+
+    def args_opt(self):
+        if self.tok.type == 'RPAREN':
+            return reduce(p_args_opt_empty, [None])
+        args = [self.expr()]
+        while self.tok.type == 'COMMA':
+            self.advance()
+            args.append(self.expr())
+        return args
+
+    def new_array(self, keyword):
+        '''Parses a new_array after its NEW keyword.'''
+        basetype = self.type()
+        dims = []
+        while self.tok.type == 'LBRACKET' and self.peek().type != 'RBRACKET':
+            self.advance()
+            dims.append(self.expr())
+            self.expect('RBRACKET')
+        if not dims:
+            raise _Fallback()
+        stars = self.dim_star()
+        return reduce(p_new_array, [None, keyword.value, basetype, dims, stars], [None, keyword])
+
+
+def from_file(filename, lexer=None):
+    try:
+        with open(filename, "rU") as f:
+            return from_string(f.read(), lexer)
+    except IOError as e:
+        print "I/O error: %s: %s" % (filename, e.strerror)
+
+def from_string(source, lexer=None):
+    '''Parses source, like decafparser.from_string (and with the same lexer
+    argument), and leaves a program with errors to it.'''
+    decafparser.init()
+    if lexer is None:
+        lexer = decaflexer.lexer.clone()
+    # a fresh lexer for the LALR parser, should it be needed
+    spare = lexer.clone()
+    classes = dict(ast.classtable)
+    ids = (ast.lastmethod, ast.lastconstructor, ast.Field.lastfield)
+
+    stdout = sys.stdout
+    sys.stdout = StringIO.StringIO()
+    try:
+        lexer.input(source)
+        Parser(lexer).pgm()
+        failed = decaflexer.errorflag
+    except _Fallback:
+        failed = True
+    except RuntimeError:
+        # nested too deeply for the recursion limit
+        failed = True
+    finally:
+        sys.stdout = stdout
+    if not failed:
+        return True
+
+    # Only the classes this parser added have been changed: an action only
+    # changes a class that was already there after signaling an error.
+    ast.classtable.clear()
+    ast.classtable.update(classes)
+    ast.lastmethod, ast.lastconstructor, ast.Field.lastfield = ids
+    return decafparser.from_string(source, spare)
+
+
+def parse(module, data):
+    '''Parses data with module (decafparser or this one), and returns
+    whether it succeeded, what it printed and the classes it made.'''
+    stdout = sys.stdout
+    sys.stdout = output = StringIO.StringIO()
+    try:
+        ast.initialize_ast()
+        succeeded = module.from_string(data)
+        errors = output.getvalue()
+        output.truncate(0)
+        ast.print_ast()
+    finally:
+        sys.stdout = stdout
+    return succeeded, errors, output.getvalue()
+
+def compare(filename, data):
+    '''Prints whether both parsers give the same result for data.
+
+    Returns:
+        Whether they did.
+    '''
+    expected = parse(decafparser, data)
+    actual = parse(sys.modules[__name__], data)
+    if expected == actual:
+        print '{}: same'.format(filename)
+        return True
+    print '{}: the parsers differ\nLALR:\n{}{}descent:\n{}{}'.format(
+        filename, expected[1], expected[2], actual[1], actual[2])
+    return False
+
+def time_parsers(filename, data):
+    '''Prints the time each parser takes to parse data, the fastest of a few
+    runs, with the PLY lexer.'''
+    for name, module in (('LALR', decafparser), ('descent', sys.modules[__name__])):
+        best = None
+        for i in range(3):
+            start = time.clock()
+            parse(module, data)
+            elapsed = time.clock() - start
+            if best is None or elapsed < best:
+                best = elapsed
+        print '{}: {}: {:.1f}ms'.format(filename, name, best * 1000)
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+
+    try:
+        try:
+            opts, args = getopt.getopt(argv[1:], "hct", ["help", "compare", "time"])
+        except getopt.error, msg:
+            raise Usage(msg)
+        mode = 'print'
+        for o,a in opts:
+            if o in ("-h", "--help"):
+                print __doc__
+                return 0
+            elif o in ("-c", "--compare"):
+                mode = 'compare'
+            elif o in ("-t", "--time"):
+                mode = 'time'
+        if len(args) == 0:
+            raise Usage("At least one file name argument is required")
+    except Usage, err:
+        print >>sys.stderr, err.msg
+        print >>sys.stderr, "For help use --help"
+        return 2
+
+    same = True
+    for filename in args:
+        try:
+            with open(filename, "rU") as f:
+                data = f.read()
+        except IOError as e:
+            print >>sys.stderr, "I/O error: %s: %s" % (filename, e.strerror)
+            return 1
+        if mode == 'compare':
+            same = compare(filename, data) and same
+        elif mode == 'time':
+            time_parsers(filename, data)
+        else:
+            ast.initialize_ast()
+            if from_string(data):
+                ast.print_ast()
+    return 0 if same else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
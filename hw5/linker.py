@@ -0,0 +1,208 @@
+'''Links the code of classes compiled on their own into a program.
+
+codegen.generate_unit compiles a class into an absmc.ObjectUnit, whose
+code leaves the labels of methods and constructors, the offsets of fields
+and the sizes of classes as symbols. The linker lays out the fields of all
+the classes, as the code generator does, assigning the static fields their
+offsets in the static area, and then puts the units' code one after the
+other, in the order of the class table, filling in the symbols and
+renumbering the branch labels (and moving them to their class's lines).
+The program is the same as codegen.generate_code's for the class table.
+
+build does this with a compile cache (see compilecache.py), which keeps the
+unit of each class: a class is only compiled again if its source or the
+declarations of any of the classes have changed. After one class has been
+edited, only its code is generated again, though the whole program is
+still parsed, type checked and linked.
+'''
+import sys
+import cPickle
+
+import ast
+import absmc
+import codegen
+import compilecache
+import decafscanner
+
+class LinkError(Exception):
+    pass
+
+
+class Linker(object):
+    '''Links units into a program, given the classes they were compiled
+    from.'''
+    def __init__(self, classtable):
+        self.classtable = classtable
+        self.machine = absmc.AbstractMachine()
+        # Symbol -> its label, for the methods and constructors of the units
+        self.symbols = {}
+        # the number of branch labels of the units added
+        self.labels = 0
+        # the text of the code, and of the labels after it
+        self.parts = []
+        self.tail = []
+
+    def layout(self):
+        '''Gives the fields their offsets and the classes their sizes.'''
+        generator = codegen.CodeGenerator(self.machine)
+        for cls in self.classtable.viewvalues():
+            generator.preprocess(cls)
+
+    def export(self, unit):
+        cls = self.classtable[unit.name]
+        for symbol in unit.exports:
+            if symbol.kind == 'method':
+                method = cls.methods[symbol.member]
+                label = 'M_{}_{}'.format(method.name, method.id)
+            else:
+                label = 'C_{}'.format(cls.constructors[symbol.member].id)
+            self.symbols[symbol] = label
+
+    def resolve(self, symbol):
+        if symbol.kind in ('method', 'constructor'):
+            if symbol not in self.symbols:
+                raise LinkError('undefined symbol {}'.format(symbol))
+            return self.symbols[symbol]
+        cls = ast.lookup(self.classtable, symbol.classname)
+        if cls is None:
+            raise LinkError('undefined class {}'.format(symbol.classname))
+        if symbol.kind == 'size':
+            return cls.size
+        field = ast.lookup(cls.fields, symbol.member)
+        if field is None:
+            raise LinkError('undefined field {}'.format(symbol))
+        return field.offset
+
+    def add_unit(self, unit, line):
+        '''Adds the unit's code to the program, for its class starting on
+        line.'''
+        shift = 0
+        if line is not None and unit.line is not None:
+            shift = line - unit.line
+        base = self.labels
+        self.labels += unit.labels
+        values = []
+        for field in unit.fields:
+            if field[0] == 'symbol':
+                values.append(self.resolve(field[1]))
+            else:
+                kind, lines, name, number = field
+                if lines is not None:
+                    lines += shift
+                values.append('L{}_{}_{}'.format(lines, name, number + base))
+        if unit.code:
+            self.parts.extend(self.tail)
+            self.parts.append(unit.code.format(*values))
+            self.tail = []
+        if unit.tail:
+            self.tail.append(unit.tail.format(*values))
+
+    def link(self, units, lines):
+        self.layout()
+        for unit in units.viewvalues():
+            self.export(unit)
+        for cls in self.classtable.viewvalues():
+            unit = units.get(cls.name)
+            if unit is None:
+                raise LinkError('no unit for class {}'.format(cls.name))
+            sys.stdout.write(unit.output)
+            self.add_unit(unit, lines.get(cls.name))
+        # the labels after the last instruction are left out, as they are
+        # by the AbstractMachine
+        text = '.static_data {}\n'.format(self.machine.static_data) + ''.join(self.parts)
+        return text[:-1]
+
+
+def link(classtable, units, lines=None):
+    '''Links the units of the classes in classtable (a dictionary of units
+    by class name), for the classes starting on the lines in lines (by class
+    name), printing what was printed while generating them.
+
+    Returns:
+        The program's code, as an AbstractMachine with the code of
+        codegen.generate_code for classtable would print it.
+    '''
+    return Linker(classtable).link(units, lines or {})
+
+
+def interface(classtable):
+    '''Returns a hash of the declarations of the classes in classtable: their
+    superclasses, fields and the signatures of their methods and
+    constructors, on which type checking a class and generating its code
+    depend, besides its own source.'''
+    def formals(method):
+        params = sorted(method.vars.vars[0].values(), key=lambda var: var.id)
+        return [(var.name, str(var.type)) for var in params]
+
+    declarations = []
+    for name in sorted(classtable):
+        cls = classtable[name]
+        declaration = [name, cls.superclass.name if cls.superclass is not None else None]
+        for fname in sorted(cls.fields):
+            field = cls.fields[fname]
+            declaration.append((fname, field.visibility, field.storage, str(field.type)))
+        for method in cls.methods:
+            declaration.append((method.name, method.visibility, method.storage,
+                                str(method.rtype), formals(method)))
+        for constr in cls.constructors:
+            declaration.append((constr.visibility, formals(constr)))
+        declarations.append(repr(declaration))
+    return compilecache.digest(declarations)
+
+def class_sources(filenames):
+    '''Returns the source of each class declared in the files, from its
+    class keyword to the next class's, and the line it starts on, by class
+    name, or None if a file can't be read or a class is declared twice.'''
+    sources = {}
+    for filename in filenames:
+        try:
+            with open(filename, 'rU') as f:
+                data = f.read()
+        except IOError:
+            return None
+        classes = decafscanner.class_offsets(data)
+        ends = [start for name, start, line in classes[1:]] + [len(data)]
+        for (name, start, line), end in zip(classes, ends):
+            if name in sources:
+                return None
+            sources[name] = (data[start:end], line)
+    return sources
+
+def build(classtable, filenames, cache=None):
+    '''Generates the code for the classes in classtable, declared in the
+    files filenames, a unit for each class, and links them. The units are
+    taken from the cache when they are in it, and put in it otherwise.
+
+    Returns:
+        The program's code, as link returns it.
+    '''
+    sources = None
+    if cache is not None:
+        sources = class_sources(filenames)
+        user = [name for name, cls in classtable.iteritems() if not cls.builtin]
+        if sources is not None and sorted(sources) != sorted(user):
+            # classes the scan missed; they are all compiled
+            sources = None
+        if sources is not None:
+            version = compilecache.compiler_version()
+            declarations = interface(classtable)
+    units = {}
+    lines = {}
+    for name, cls in classtable.iteritems():
+        key = None
+        if sources is not None:
+            source, lines[name] = sources.get(name, ('', None))
+            key = compilecache.digest(['unit', version, declarations, name, source])
+            entry = cache.get(key)
+            if entry is not None:
+                units[name] = cPickle.loads(entry[1])
+                continue
+        units[name] = unit = codegen.generate_unit(cls, classtable, lines.get(name))
+        if key is not None:
+            try:
+                cache.write(key, True, cPickle.dumps(unit, cPickle.HIGHEST_PROTOCOL))
+            except (IOError, OSError), err:
+                print >>sys.stderr, "Error: the compile cache: {}".format(err)
+    if cache is not None:
+        cache.evict()
+    return link(classtable, units, lines)
@@ -0,0 +1,197 @@
+'''Parses the files of a Decaf program in parallel, into ast.classtable.
+
+Each file is parsed on its own by a worker process, which sends the classes
+it defines back pickled, and the classes of all the files are merged into
+one class table. A file can use the classes of the other files, whatever
+order the files are given in: the files are first scanned for the names of
+the classes they declare and the identifiers they use, and a worker puts a
+placeholder class in its class table, before parsing its file, for each
+identifier of the file that is the name of another file's class.
+Within a file, a class still has to be declared before it is used, as in a
+program of a single file.
+
+The pickles refer to every class by its name, so that once the merged
+classes have all been made, each reference to a class (to a superclass or
+a placeholder among them) is bound to the merged class of that name as the
+pickles are read. The ids of the fields, methods and constructors are then
+renumbered as they would be if the files had been parsed one after the
+other, in the order they were given, so several files compile to the same
+code as one file with all their classes.
+'''
+import sys
+import cPickle
+import traceback
+import StringIO
+import cStringIO
+import multiprocessing
+
+import ast
+import decafparser
+import decafscanner
+
+def scan_file(filename):
+    '''Returns the names of the classes declared in a file, in order, and the
+    set of the identifiers in it. Errors are left to be reported when the
+    file is parsed.'''
+    try:
+        with open(filename, "rU") as f:
+            source = f.read()
+    except IOError:
+        return [], set()
+    stdout = sys.stdout
+    sys.stdout = StringIO.StringIO()
+    try:
+        scanner = decafscanner.Scanner()
+        scanner.input(source)
+        names = []
+        identifiers = set()
+        previous = None
+        for tok in scanner:
+            if tok.type == 'ID':
+                if previous == 'CLASS':
+                    names.append(tok.value)
+                identifiers.add(tok.value)
+            previous = tok.type
+    finally:
+        sys.stdout = stdout
+    return names, identifiers
+
+def _class_name(obj):
+    if isinstance(obj, ast.Class):
+        return obj.name
+    return None
+
+def dump_classes(names):
+    '''Pickles the classes of ast.classtable with the given names, as a list
+    of their names and attributes, in which every class is referred to by
+    its name.'''
+    output = cStringIO.StringIO()
+    pickler = cPickle.Pickler(output, cPickle.HIGHEST_PROTOCOL)
+    pickler.persistent_id = _class_name
+    pickler.dump([(name, ast.classtable[name].__dict__) for name in names])
+    return output.getvalue()
+
+def load_classes(data):
+    '''Reads what dump_classes wrote, with the classes it refers to looked up
+    in ast.classtable.'''
+    unpickler = cPickle.Unpickler(cStringIO.StringIO(data))
+    unpickler.persistent_load = ast.classtable.__getitem__
+    return unpickler.load()
+
+def _ids():
+    return (ast.lastmethod, ast.lastconstructor, ast.Field.lastfield)
+
+def parse_file(job):
+    '''Parses a file, given the names of the classes it declares and of the
+    other files' classes it uses, the class of lexer to use (or None for the PLY
+    lexer) and the name of the parser's module.
+
+    Returns:
+        (output, classes, counts): what parsing the file printed, and if it
+        succeeded, its classes pickled by dump_classes and the number of
+        methods, constructors and fields it defined, or else None and None.
+        If the parser raised an exception, its traceback is in the output,
+        after what was printed before it.
+    '''
+    filename, names, others, lexer_class, parser_name = job
+    parser = sys.modules[parser_name]
+    stdout = sys.stdout
+    sys.stdout = output = StringIO.StringIO()
+    try:
+        ast.initialize_ast()
+        for name in others:
+            if name not in ast.classtable:
+                ast.addtotable(ast.classtable, name, ast.Class(name, None))
+        start = _ids()
+        try:
+            with open(filename, "rU") as f:
+                source = f.read()
+        except IOError as e:
+            print "I/O error: %s" % e.strerror
+            succeeded = False
+        else:
+            lexer = None if lexer_class is None else lexer_class()
+            try:
+                succeeded = parser.from_string(source, lexer)
+            except Exception:
+                # e.g. p_type_id with an undefined class
+                traceback.print_exc(file=sys.stdout)
+                succeeded = False
+    finally:
+        sys.stdout = stdout
+    if not succeeded:
+        return output.getvalue(), None, None
+    counts = tuple([end - begin for begin, end in zip(start, _ids())])
+    return output.getvalue(), dump_classes(names), counts
+
+def merge(results):
+    '''Starts ast.classtable afresh and merges the classes of the files into
+    it, from the (names, classes, counts) of each file.'''
+    ast.initialize_ast()
+    for names, classes, counts in results:
+        for name in names:
+            ast.addtotable(ast.classtable, name, ast.Class(name, None))
+    methods, constructors, fields = 0, 0, 0
+    for names, classes, counts in results:
+        for name, attributes in load_classes(classes):
+            c = ast.classtable[name]
+            c.__dict__.update(attributes)
+            for f in c.fields.values():
+                f.id += fields
+            for k in c.constructors:
+                k.id += constructors
+            for m in c.methods:
+                m.id += methods
+        methods += counts[0]
+        constructors += counts[1]
+        fields += counts[2]
+    ast.lastmethod += methods
+    ast.lastconstructor += constructors
+    ast.Field.lastfield += fields
+
+def parse_files(filenames, jobs=None, lexer=None, parser=decafparser):
+    '''Parses the files of a program into ast.classtable, printing their
+    errors, each after the name of its file. The lexer is None, for the PLY
+    lexer, or a lexer whose class makes a new one for each file (a
+    decafscanner.Scanner), and the parser is decafparser or decafrdparser.
+
+    The files are parsed by jobs processes, as many as there are CPUs by
+    default, or in this process if jobs is 1.
+
+    Returns:
+        Whether all the files were parsed without errors.
+    '''
+    if jobs is None:
+        jobs = multiprocessing.cpu_count()
+    jobs = min(jobs, len(filenames))
+    pool = multiprocessing.Pool(jobs) if jobs > 1 else None
+    try:
+        run = pool.map if pool is not None else map
+        scans = run(scan_file, filenames)
+        declared = [names for names, identifiers in scans]
+        # class name -> the indices of the files declaring it
+        files = {}
+        for i, names in enumerate(declared):
+            for name in names:
+                files.setdefault(name, set()).add(i)
+        work = []
+        for i, (filename, (names, identifiers)) in enumerate(zip(filenames, scans)):
+            others = [name for name in identifiers if files.get(name, set()) - set([i])]
+            work.append((filename, names, others,
+                         None if lexer is None else lexer.__class__, parser.__name__))
+        results = run(parse_file, work)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    succeeded = True
+    for filename, (output, classes, counts) in zip(filenames, results):
+        for line in output.splitlines():
+            print "{}: {}".format(filename, line)
+        if classes is None:
+            succeeded = False
+    if succeeded:
+        merge([(names, classes, counts)
+               for names, (output, classes, counts) in zip(declared, results)])
+    return succeeded
@@ -0,0 +1,401 @@
+'''A simulator for the abstract machine code generated by codegen.
+
+The instructions in an AbstractMachine's instr_list are decoded once, before
+running, into tuples of an integer opcode and its operands: every register
+becomes an index into a single list of registers (the a and t register
+files and sap), and every label becomes the index of the instruction it is
+on. The simulator then dispatches on the opcode through a table of handlers,
+each of which returns the index of the next instruction.
+
+The machine has:
+    the a and t registers, which are global (the code saves the caller's
+        registers itself, with save and restore around each call),
+    a heap of records, each a list of words, addressed by its index in the
+        heap (0 is Null, so loading from or storing to it is an error),
+    the static area, a record allocated at start-up whose address is in sap,
+    a call stack of return addresses and a save stack of register values.
+
+Execution starts at __main__ and ends when it returns. Calls to the methods
+of the builtin In and Out classes are carried out by the simulator instead
+of jumping to their (empty) code: In.scan_int and In.scan_float read the
+next whitespace-separated token of the input, and the Out.print methods
+write their argument, a0, on a line of the output.
+'''
+import sys
+
+import absmc
+
+# The decoded opcodes
+MOVE_IMMED = 0
+MOVE = 1
+ADD = 2
+SUB = 3
+MUL = 4
+IDIV = 5
+FDIV = 6
+MOD = 7
+GT = 8
+GEQ = 9
+LT = 10
+LEQ = 11
+FTOI = 12
+ITOF = 13
+BZ = 14
+BNZ = 15
+JMP = 16
+CALL = 17
+RET = 18
+SAVE = 19
+RESTORE = 20
+HLOAD = 21
+HSTORE = 22
+HALLOC = 23
+
+# Maps each mnemonic to its opcode. The integer and float arithmetic
+# instructions only differ for division, since registers hold Python values.
+OPCODES = {
+    'move_immed_i': MOVE_IMMED, 'move_immed_f': MOVE_IMMED, 'move': MOVE,
+    'iadd': ADD, 'isub': SUB, 'imul': MUL, 'idiv': IDIV, 'imod': MOD,
+    'igt': GT, 'igeq': GEQ, 'ilt': LT, 'ileq': LEQ,
+    'fadd': ADD, 'fsub': SUB, 'fmul': MUL, 'fdiv': FDIV,
+    'fgt': GT, 'fgeq': GEQ, 'flt': LT, 'fleq': LEQ,
+    'ftoi': FTOI, 'itof': ITOF,
+    'bz': BZ, 'bnz': BNZ, 'jmp': JMP,
+    'call': CALL, 'ret': RET, 'save': SAVE, 'restore': RESTORE,
+    'hload': HLOAD, 'hstore': HSTORE, 'halloc': HALLOC,
+}
+
+COUNT = 24
+
+class SimulationError(Exception):
+    '''An error in the running program, or in the code it was compiled to.'''
+
+class Simulator(object):
+    '''Runs the code of an AbstractMachine.
+
+    After run, the counts of what was executed are in:
+        instructions: the number of instructions executed,
+        calls: a dict mapping each called label to its number of calls,
+        allocations: the number of halloc instructions executed,
+        allocated_words: the total size of the records they allocated.
+    '''
+
+    def __init__(self, machine, classtable, infile=sys.stdin, outfile=sys.stdout):
+        '''
+        Args:
+            machine: The AbstractMachine holding the generated code.
+            classtable: The class table the code was generated from, which
+                has the builtin In and Out classes.
+            infile: The file In.scan_int and In.scan_float read from.
+            outfile: The file the Out.print methods write to.
+        '''
+        self._infile = infile
+        self._outfile = outfile
+        self._tokens = []
+        self._registers = {'sap': 0, 'a0': 1}  # register name -> index in self._regs
+        self._static_data = machine.static_data
+        self._builtins = self._builtin_methods(classtable)
+        self._code, self._labels = self._decode(machine)
+        self._handlers = self._dispatch_table()
+
+        self.instructions = 0
+        self.calls = {}
+        self.allocations = 0
+        self.allocated_words = 0
+
+    def run(self, entry='__main__'):
+        '''Runs the program from the entry label until it returns.'''
+        if entry not in self._labels:
+            raise SimulationError("No '{}' label to start from".format(entry))
+
+        self._regs = [0] * len(self._registers)
+        self._heap = [None]  # address 0 is Null
+        self._call_stack = []
+        self._save_stack = []
+        self._regs[self._register('sap')] = self._allocate(self._static_data)
+
+        code = self._code
+        handlers = self._handlers
+        pc = self._labels[entry]
+        end = len(code)
+        count = 0
+        try:
+            while 0 <= pc < end:
+                op, x, y, z = code[pc]
+                pc = handlers[op](pc, x, y, z)
+                count += 1
+        except ZeroDivisionError:
+            raise SimulationError('Division by zero at {}'.format(self._where(pc)))
+        except (TypeError, IndexError):
+            # Only a Null (or non-record) base or an offset outside a record
+            # can get here, from hload or hstore.
+            raise SimulationError('Invalid heap access at {}'.format(self._where(pc)))
+        finally:
+            self.instructions += count
+
+        if pc >= 0:
+            raise SimulationError('Execution ran past the end of the code')
+
+    def report(self):
+        '''Formats the execution counts as text.'''
+        lines = ['Instructions executed: {}'.format(self.instructions),
+                 'Calls: {}'.format(sum(self.calls.values()))]
+        for label, count in sorted(self.calls.items(), key=lambda item: (-item[1], item[0])):
+            lines.append('\t{}: {}'.format(label, count))
+        lines.append('Allocations: {} ({} words)'.format(self.allocations,
+                                                         self.allocated_words))
+        return '\n'.join(lines)
+
+    def _decode(self, machine):
+        '''Decodes the instructions into (opcode, x, y, z) tuples.
+
+        Returns:
+            The list of decoded instructions, and a dict mapping each label
+            to the index of its instruction.
+        '''
+        labels = {}
+        for index, instr in enumerate(machine.instr_list):
+            if instr.label is not None:
+                for name in instr.label.split(':\n'):
+                    labels[name] = index
+        # Labels added after the last instruction refer to the end
+        for label in machine.labels:
+            labels[str(label)] = len(machine.instr_list)
+
+        code = []
+        for instr in machine.instr_list:
+            op = OPCODES.get(instr.op)
+            if op is None:
+                raise SimulationError("Unknown instruction '{}'".format(instr.op))
+            operands = [self._operand(op, arg, labels) for arg in instr.args]
+            operands.extend([None] * (3 - len(operands)))
+            code.append((op,) + tuple(operands))
+        self._text = [str(instr).split('\t')[-1].strip() for instr in machine.instr_list]
+        return code, labels
+
+    def _operand(self, op, arg, labels):
+        '''Decodes one argument: registers into indices, labels into
+        instruction indices (or, for calls, a (name, index) pair).'''
+        if isinstance(arg, absmc.Register):
+            return self._register(str(arg))
+        if isinstance(arg, absmc.Label) or op == CALL:
+            name = str(arg)
+            if op == CALL and name in self._builtins:
+                return (name, None)
+            if name not in labels:
+                raise SimulationError("Label '{}' not found".format(name))
+            if op == CALL:
+                return (name, labels[name])
+            return labels[name]
+        if arg == 'Null':
+            return 0
+        return arg  # an immediate value
+
+    def _register(self, name):
+        if name not in self._registers:
+            self._registers[name] = len(self._registers)
+        return self._registers[name]
+
+    def _where(self, pc):
+        return "instruction {} '{}'".format(pc, self._text[pc])
+
+    def _allocate(self, size):
+        self._heap.append([0] * size)
+        return len(self._heap) - 1
+
+    def _dispatch_table(self):
+        table = [None] * COUNT
+        table[MOVE_IMMED] = self._op_move_immed
+        table[MOVE] = self._op_move
+        table[ADD] = self._op_add
+        table[SUB] = self._op_sub
+        table[MUL] = self._op_mul
+        table[IDIV] = self._op_idiv
+        table[FDIV] = self._op_fdiv
+        table[MOD] = self._op_mod
+        table[GT] = self._op_gt
+        table[GEQ] = self._op_geq
+        table[LT] = self._op_lt
+        table[LEQ] = self._op_leq
+        table[FTOI] = self._op_ftoi
+        table[ITOF] = self._op_itof
+        table[BZ] = self._op_bz
+        table[BNZ] = self._op_bnz
+        table[JMP] = self._op_jmp
+        table[CALL] = self._op_call
+        table[RET] = self._op_ret
+        table[SAVE] = self._op_save
+        table[RESTORE] = self._op_restore
+        table[HLOAD] = self._op_hload
+        table[HSTORE] = self._op_hstore
+        table[HALLOC] = self._op_halloc
+        return table
+
+    # Each handler takes the current instruction's index and its decoded
+    # operands, and returns the index of the next instruction.
+    def _op_move_immed(self, pc, dst, value, z):
+        self._regs[dst] = value
+        return pc + 1
+
+    def _op_move(self, pc, dst, src, z):
+        self._regs[dst] = self._regs[src]
+        return pc + 1
+
+    def _op_add(self, pc, dst, src1, src2):
+        regs = self._regs
+        regs[dst] = regs[src1] + regs[src2]
+        return pc + 1
+
+    def _op_sub(self, pc, dst, src1, src2):
+        regs = self._regs
+        regs[dst] = regs[src1] - regs[src2]
+        return pc + 1
+
+    def _op_mul(self, pc, dst, src1, src2):
+        regs = self._regs
+        regs[dst] = regs[src1] * regs[src2]
+        return pc + 1
+
+    def _op_idiv(self, pc, dst, src1, src2):
+        # Integer division truncates toward zero, as in Java
+        regs = self._regs
+        quotient = abs(regs[src1]) // abs(regs[src2])
+        if (regs[src1] < 0) != (regs[src2] < 0):
+            quotient = -quotient
+        regs[dst] = quotient
+        return pc + 1
+
+    def _op_fdiv(self, pc, dst, src1, src2):
+        regs = self._regs
+        regs[dst] = float(regs[src1]) / regs[src2]
+        return pc + 1
+
+    def _op_mod(self, pc, dst, src1, src2):
+        # The remainder takes the sign of the dividend, as in Java
+        regs = self._regs
+        remainder = abs(regs[src1]) % abs(regs[src2])
+        if regs[src1] < 0:
+            remainder = -remainder
+        regs[dst] = remainder
+        return pc + 1
+
+    def _op_gt(self, pc, dst, src1, src2):
+        regs = self._regs
+        regs[dst] = 1 if regs[src1] > regs[src2] else 0
+        return pc + 1
+
+    def _op_geq(self, pc, dst, src1, src2):
+        regs = self._regs
+        regs[dst] = 1 if regs[src1] >= regs[src2] else 0
+        return pc + 1
+
+    def _op_lt(self, pc, dst, src1, src2):
+        regs = self._regs
+        regs[dst] = 1 if regs[src1] < regs[src2] else 0
+        return pc + 1
+
+    def _op_leq(self, pc, dst, src1, src2):
+        regs = self._regs
+        regs[dst] = 1 if regs[src1] <= regs[src2] else 0
+        return pc + 1
+
+    def _op_ftoi(self, pc, dst, src, z):
+        self._regs[dst] = int(self._regs[src])
+        return pc + 1
+
+    def _op_itof(self, pc, dst, src, z):
+        self._regs[dst] = float(self._regs[src])
+        return pc + 1
+
+    def _op_bz(self, pc, reg, target, z):
+        if self._regs[reg] == 0:
+            return target
+        return pc + 1
+
+    def _op_bnz(self, pc, reg, target, z):
+        if self._regs[reg] != 0:
+            return target
+        return pc + 1
+
+    def _op_jmp(self, pc, target, y, z):
+        return target
+
+    def _op_call(self, pc, label, y, z):
+        name, target = label
+        self.calls[name] = self.calls.get(name, 0) + 1
+        if target is None:
+            self._builtins[name]()
+            return pc + 1
+        self._call_stack.append(pc + 1)
+        return target
+
+    def _op_ret(self, pc, x, y, z):
+        if self._call_stack:
+            return self._call_stack.pop()
+        return -1  # returning from the entry point ends the program
+
+    def _op_save(self, pc, reg, y, z):
+        self._save_stack.append(self._regs[reg])
+        return pc + 1
+
+    def _op_restore(self, pc, reg, y, z):
+        if not self._save_stack:
+            raise SimulationError('Restore with nothing saved at {}'.format(self._where(pc)))
+        self._regs[reg] = self._save_stack.pop()
+        return pc + 1
+
+    def _op_hload(self, pc, dst, base, offset):
+        regs = self._regs
+        regs[dst] = self._heap[regs[base]][regs[offset]]
+        return pc + 1
+
+    def _op_hstore(self, pc, base, offset, src):
+        regs = self._regs
+        self._heap[regs[base]][regs[offset]] = regs[src]
+        return pc + 1
+
+    def _op_halloc(self, pc, dst, size, z):
+        words = self._regs[size]
+        self._regs[dst] = self._allocate(words)
+        self.allocations += 1
+        self.allocated_words += words
+        return pc + 1
+
+    # The builtin methods. Each one takes its argument from, and leaves its
+    # result in, a0.
+    def _builtin_methods(self, classtable):
+        '''Maps the labels of the In and Out methods to functions that carry
+        them out.'''
+        builtins = {}
+        for method in classtable['In'].methods:
+            convert = int if method.name == 'scan_int' else float
+            builtins['M_{}_{}'.format(method.name, method.id)] = \
+                lambda convert=convert: self._scan(convert)
+        for method in classtable['Out'].methods:
+            formal = list(method.vars.vars[0].values())[0]
+            builtins['M_{}_{}'.format(method.name, method.id)] = \
+                lambda typename=formal.type.typename: self._print(typename)
+        return builtins
+
+    def _read_token(self):
+        while not self._tokens:
+            line = self._infile.readline()
+            if not line:
+                raise SimulationError('In: no more input')
+            self._tokens = line.split()[::-1]
+        return self._tokens.pop()
+
+    def _scan(self, convert):
+        token = self._read_token()
+        try:
+            self._regs[self._register('a0')] = convert(token)
+        except ValueError:
+            raise SimulationError("In: '{}' is not a number".format(token))
+
+    def _print(self, formal_type):
+        value = self._regs[self._register('a0')]
+        if formal_type == 'boolean':
+            text = 'true' if value else 'false'
+        else:
+            text = str(value)
+        self._outfile.write(text + '\n')
@@ -0,0 +1,184 @@
+""" Compiler startup benchmark
+Measures how long a new Python process takes to get the first token of a
+Decaf program (importing PLY, the lexer and the parser), to parse it, and to
+compile it with decafc.py, before and after the tables were built ahead of
+time.
+Usage: python startup.py [options] <filename>
+
+Each configuration runs on a copy of the compiler in a temporary directory:
+"before" is the compiler as of the revision given by --before, taken from
+git, which has already run once and so has its parsetab.py; "first run" has
+no table modules, which are removed before every run, so each run builds
+the tables at startup and writes them; and "tables" has them built by
+buildtables.py first. The times are wall clock times of whole processes,
+including the interpreter's own startup, and the fastest of the repeats is
+reported.
+
+Options:
+  -r, --repeat N    run each measurement N times (default: 10)
+  -b, --before REV  the revision of the compiler to compare with (default:
+                    the one before buildtables.py was added)
+  -h, --help        show this message
+"""
+import os
+import sys
+import glob
+import tarfile
+import StringIO
+import time
+import getopt
+import shutil
+import tempfile
+import subprocess
+
+class Usage(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+# Each stage runs in a new process in the copy of the compiler
+FIRST_TOKEN = '''
+import sys, ply.lex as lex, decaflexer, decafparser
+if hasattr(decaflexer, 'lexer'):
+    lexer = decaflexer.lexer.clone()
+else: # the compiler before the lexer was built once
+    lexer = lex.lex(module=decaflexer)
+lexer.input(open(sys.argv[1]).read())
+lexer.token()
+'''
+
+PARSE = '''
+import sys, ast, decafparser
+ast.initialize_ast()
+decafparser.from_file(sys.argv[1])
+'''
+
+STAGES = [
+    ('first token', ['-c', FIRST_TOKEN]),
+    ('parse', ['-c', PARSE]),
+    ('compile', ['decafc.py']),
+]
+
+CONFIGURATIONS = ['before', 'first run', 'tables']
+
+# The modules and files PLY writes its tables to
+TABLES = ('decaflextab', 'decafparsetab', 'parsetab', 'parser.out')
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def default_before():
+    '''Returns the revision before the one that added buildtables.py.'''
+    added = subprocess.check_output(['git', 'log', '--diff-filter=A', '--format=%H',
+                                     '--', 'buildtables.py'], cwd=HERE).split()
+    if not added:
+        raise OSError("buildtables.py is not in the git history")
+    return added[-1] + '^'
+
+def export_compiler(revision, directory):
+    '''Writes the compiler's files as of revision in git to directory.'''
+    path = subprocess.check_output(['git', 'rev-parse', '--show-prefix'], cwd=HERE).strip()
+    # git archive only takes the files under the directory it runs in
+    top = subprocess.check_output(['git', 'rev-parse', '--show-toplevel'], cwd=HERE).strip()
+    archive = subprocess.check_output(['git', 'archive', '{}:{}'.format(revision, path)],
+                                      cwd=top)
+    with tarfile.open(fileobj=StringIO.StringIO(archive)) as tar:
+        tar.extractall(directory)
+
+def remove_tables(directory):
+    for path in glob.glob(os.path.join(directory, '*')):
+        if os.path.basename(path).startswith(TABLES):
+            os.remove(path)
+
+def copy_compiler(configuration, filename, before):
+    '''Copies the compiler's modules into a new temporary directory, without
+    any table modules, and builds them there for the "tables" configuration.
+    For "before", the compiler of that revision is copied instead, and run
+    once to write its tables.'''
+    directory = tempfile.mkdtemp(prefix='decaf-startup-')
+    with open(os.devnull, 'w') as devnull:
+        if configuration == 'before':
+            export_compiler(before, directory)
+            subprocess.check_call([sys.executable, 'decafc.py', filename],
+                                  cwd=directory, stdout=devnull, stderr=devnull)
+            return directory
+        for path in glob.glob(os.path.join(HERE, '*.py')):
+            if not os.path.basename(path).startswith(TABLES):
+                shutil.copy(path, directory)
+        if configuration == 'tables':
+            subprocess.check_call([sys.executable, 'buildtables.py'],
+                                  cwd=directory, stdout=devnull)
+    return directory
+
+def time_stage(directory, args, filename, repeat, fresh=False):
+    '''Returns the fastest time of running args in directory; if fresh, with
+    the table modules removed before each run.'''
+    best = None
+    with open(os.devnull, 'w') as devnull:
+        for i in range(repeat):
+            if fresh:
+                remove_tables(directory)
+            start = time.time()
+            subprocess.check_call([sys.executable] + args + [filename],
+                                  cwd=directory, stdout=devnull, stderr=devnull)
+            elapsed = time.time() - start
+            if best is None or elapsed < best:
+                best = elapsed
+    return best
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+
+    try:
+        try:
+            opts, args = getopt.getopt(argv[1:], "hr:b:", ["help", "repeat=", "before="])
+        except getopt.error, msg:
+            raise Usage(msg)
+        repeat = 10
+        before = None
+        for o,a in opts:
+            if o in ("-h", "--help"):
+                print __doc__
+                return 0
+            elif o in ("-r", "--repeat"):
+                try:
+                    repeat = max(1, int(a))
+                except ValueError:
+                    raise Usage("The number of repeats must be an integer")
+            elif o in ("-b", "--before"):
+                before = a
+        if len(args) != 1:
+            raise Usage("A single file name argument is required")
+    except Usage, err:
+        print >>sys.stderr, err.msg
+        print >>sys.stderr, "For help use --help"
+        return 2
+
+    filename = os.path.abspath(args[0])
+    if not os.path.exists(filename):
+        print >>sys.stderr, "Error: {} does not exist".format(args[0])
+        return 1
+
+    results = {}
+    try:
+        if before is None:
+            before = default_before()
+        for configuration in CONFIGURATIONS:
+            directory = copy_compiler(configuration, filename, before)
+            try:
+                for stage, stage_args in STAGES:
+                    results[configuration, stage] = time_stage(
+                        directory, stage_args, filename, repeat,
+                        fresh=configuration == 'first run')
+            finally:
+                shutil.rmtree(directory)
+    except (subprocess.CalledProcessError, OSError), err:
+        print >>sys.stderr, "Error: {}".format(err)
+        return 1
+    print '{:<14}{:>12}{:>12}{:>12}'.format('', *CONFIGURATIONS)
+    for stage, stage_args in STAGES:
+        print '{:<14}{:>10.1f}ms{:>10.1f}ms{:>10.1f}ms'.format(
+            stage, *[results[configuration, stage] * 1000 for configuration in CONFIGURATIONS])
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,6 +6,8 @@ current_method = None
 
 
 def check_classes(classtable):
+    global error_flag
+    error_flag = False
     for cls in classtable.viewvalues():
         check_class(cls)
 